@@ -111,6 +111,9 @@ class API(Construct):
         self.api_gw = apigateway.RestApi(
             self,
             "Digidexapi_apigw",
+            # the responses are gzip or brotli compressed, Mangum sends them
+            # base64 encoded
+            binary_media_types=["*/*"],
             domain_name=apigateway.DomainNameOptions(
                 domain_name="api.digidexapi.com",
                 certificate=acm.Certificate.from_certificate_arn(
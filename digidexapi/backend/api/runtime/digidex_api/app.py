@@ -1,17 +1,35 @@
 import logging
-from typing import Union
-
+import os
+from enum import Enum
+from typing import Callable, Dict, List, Union
+
+import async_crud
+import budget
+import caching
+import catalog
+import compression
 import crud
+import documents
+import graph
 import schemas
+import search
+import serialization
+import timing
 import utils
-import uvicorn
 from database import SessionLocal
+from database import async_session
 from fastapi import Depends
 from fastapi import FastAPI
+from fastapi import HTTPException
+from fastapi import Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import RedirectResponse
+from fastapi.responses import Response
+from fastapi.routing import APIRoute
 from mangum import Mangum
 from sqlalchemy.orm import Session
-
+from sqlalchemy.orm.exc import NoResultFound
+from starlette.concurrency import run_in_threadpool
 
 description = """
 DigidexApi is a simple side project about Digimons. It's a serverless application
@@ -34,16 +52,29 @@ app = FastAPI(
         "url": "https://www.apache.org/licenses/LICENSE-2.0.html",
     },
 )
+# maximum number of ids of /digimon/batch
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "50"))
+# "async" serves the digimon and skill routes with the async def endpoints of
+# ASYNC_ENDPOINTS (asyncpg driver), "sync" with the def ones, in the thread
+# pool
+REQUEST_PATH = os.getenv("REQUEST_PATH", "sync")
+
 logger = logging.getLogger()
 logger.setLevel(logging.DEBUG)
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["GET"],
-    allow_headers=["*"],
-)
+
+def page_response(
+    encoder: serialization.Encoder, rows: list, pagination: schemas.Pagination
+):
+    """A schemas.Page, serialized by the encoder of its rows unless
+    SERIALIZATION is "pydantic". The routes keep response_model=schemas.Page
+    for the OpenAPI schema."""
+    if serialization.enabled():
+        return Response(
+            serialization.page(encoder, rows, pagination),
+            media_type="application/json",
+        )
+    return schemas.Page(content=rows, pagination=pagination)
 
 
 # Dependency
@@ -55,10 +86,109 @@ def get_db():
         db.close()
 
 
-@app.get("/digimon", response_model=schemas.Page,
-description="""Return all the Digimon of the application
+def get_async_sessions():
+    """Factory of the AsyncSession of the async endpoints"""
+    return async_session
+
+
+# max-age of the responses which only change with the dataset
+DATA_MAX_AGE = int(os.getenv("DATA_MAX_AGE", "3600"))
+REFERENCE_MAX_AGE = int(os.getenv("REFERENCE_MAX_AGE", "86400"))
+
+# rows of a digimon with all its relations, generously
+DIGIMON_ROWS = 200
+# SQL statements and rows a request may read (see budget), the fills of the
+# process-wide caches aside: the graph and reference routes read nothing. A
+# page reads its rows, and a count past its end. The async endpoints run the
+# same queries.
+QUERY_BUDGETS = {
+    "/digimon": budget.Budget(statements=2, rows=1, rows_per_item=1, page_size=10),
+    # the digimon, then a query per relation
+    "/digimon/batch": budget.Budget(statements=9, rows=DIGIMON_ROWS * MAX_BATCH_SIZE),
+    "/digimon/{id_or_name}": budget.Budget(statements=9, rows=DIGIMON_ROWS),
+    "/digimon/{digimon_id}/image": budget.Budget(statements=1, rows=1),
+    "/digimon/{digimon_id}/thumbnail": budget.Budget(statements=1, rows=1),
+    "/digimon/{digimon_id}/lineage": budget.Budget(statements=0, rows=0),
+    "/digimon/{digimon_id}/tree": budget.Budget(statements=0, rows=0),
+    "/digimon/{digimon_id}/path/{target_id}": budget.Budget(statements=0, rows=0),
+    "/skill": budget.Budget(statements=2, rows=1, rows_per_item=1, page_size=10),
+    "/level": budget.Budget(statements=0, rows=0),
+    "/attribute": budget.Budget(statements=0, rows=0),
+    "/field": budget.Budget(statements=0, rows=0),
+    "/type": budget.Budget(statements=0, rows=0),
+}
+
+
+# innermost, only the statements of the endpoints are counted
+if budget.enabled():
+    budget.install()
+    app.add_middleware(budget.QueryBudgetMiddleware, budgets=QUERY_BUDGETS)
+app.add_middleware(
+    caching.CachingHeadersMiddleware,
+    policies={
+        "/digimon": caching.Policy(DATA_MAX_AGE, presigned_images=True),
+        "/digimon/batch": caching.Policy(DATA_MAX_AGE, presigned_images=True),
+        "/digimon/{id_or_name}": caching.Policy(DATA_MAX_AGE, presigned_images=True),
+        "/digimon/{digimon_id}/lineage": caching.Policy(DATA_MAX_AGE),
+        "/digimon/{digimon_id}/tree": caching.Policy(DATA_MAX_AGE),
+        "/digimon/{digimon_id}/path/{target_id}": caching.Policy(DATA_MAX_AGE),
+        "/skill": caching.Policy(DATA_MAX_AGE),
+        "/level": caching.Policy(REFERENCE_MAX_AGE),
+        "/attribute": caching.Policy(REFERENCE_MAX_AGE),
+        "/field": caching.Policy(REFERENCE_MAX_AGE),
+        "/type": caching.Policy(REFERENCE_MAX_AGE),
+    },
+    get_db=get_db,
+)
+# after the caching headers, to reuse the compressed bodies by ETag
+app.add_middleware(
+    compression.CompressionMiddleware,
+    minimum_size=compression.COMPRESSION_MINIMUM_SIZE,
+    cache_size=compression.COMPRESSION_CACHE_SIZE,
+)
+# added last, so the CORS headers are on the 304 responses too
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["GET"],
+    allow_headers=["*"],
+)
+# outermost, the total time includes the other middlewares
+if timing.enabled():
+    timing.install()
+    app.add_middleware(timing.ServerTimingMiddleware)
+
+
+def decode_cursor(after: Union[str, None], sort: Enum):
+    """Keyset cursor of the after query parameter, an empty after starts a
+    keyset pagination from the first row"""
+    if after is not None and sort.value == "relevance":
+        raise HTTPException(
+            status_code=400, detail="The relevance sort only supports page"
+        )
+    if not after:
+        return None
+    try:
+        return utils.decode_cursor(after, sort.value)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def next_cursor(after: Union[str, None], rows: list, sort: Enum):
+    """Cursor of the next page in keyset mode (after given), None otherwise"""
+    if after is None or not rows:
+        return None
+    return utils.encode_cursor(sort.value, crud.sort_key(rows[-1], sort.value))
 
-""")
+
+@app.get(
+    "/digimon",
+    response_model=schemas.Page,
+    description="""Return all the Digimon of the application
+
+""",
+)
 def get_all_digimons(
     page_size: int = 10,
     page: int = 1,
@@ -70,11 +200,12 @@ def get_all_digimons(
     id_attribute: Union[int, None] = None,
     digivolved_from: Union[int, None] = None,
     digivolve_to: Union[int, None] = None,
+    sort: schemas.DigimonSort = schemas.DigimonSort.id,
+    after: Union[str, None] = None,
     db: Session = Depends(get_db),
 ):
-    digimons = crud.get_digimons(
-        page_size=page_size,
-        page=page,
+    cursor = decode_cursor(after, sort)
+    filters = dict(
         xantibody=xantibody,
         name_contains=name_contains,
         id_type=id_type,
@@ -83,112 +214,293 @@ def get_all_digimons(
         id_attribute=id_attribute,
         digivolved_from=digivolved_from,
         digivolve_to=digivolve_to,
-        db=db,
     )
+    if catalog.enabled():
+        digimon_catalog = catalog.get_catalog(db)
+        digimons, count_digimons = digimon_catalog.get_digimons(
+            page_size=page_size, page=page, sort=sort.value, after=cursor, **filters
+        )
+    else:
+        digimons, count_digimons = crud.get_digimons(
+            page_size=page_size,
+            page=page,
+            db=db,
+            sort=sort.value,
+            after=cursor,
+            **filters,
+        )
 
+    pagination = digimon_pagination(
+        digimons, count_digimons, page_size, page, after, sort, filters
+    )
+    utils.presign_images((digimon.name for digimon in digimons), thumbnail=True)
+    return page_response(serialization.digimon, digimons, pagination)
+
+
+def digimon_pagination(
+    digimons: list,
+    count_digimons: int,
+    page_size: int,
+    page: int,
+    after: Union[str, None],
+    sort: schemas.DigimonSort,
+    filters: dict,
+):
     path = "/digimon?"
-    count_digimons = crud.count_digimons(db=db)
-    pagination = utils.paginaton(
+    return utils.paginaton(
         path,
         count_digimons,
         page,
         page_size,
         len(digimons),
-        xantibody=xantibody,
-        id_field=id_field,
-        id_level=id_level,
-        id_type=id_type,
-        name_contains=name_contains,
-        id_attribute=id_attribute,
-        digivolved_from=digivolved_from,
-        digivolve_to=digivolve_to,
+        next_after=next_cursor(after, digimons, sort),
+        sort=None if sort == schemas.DigimonSort.id else sort.value,
+        xantibody=filters["xantibody"],
+        id_field=filters["id_field"],
+        id_level=filters["id_level"],
+        id_type=filters["id_type"],
+        name_contains=filters["name_contains"],
+        id_attribute=filters["id_attribute"],
+        digivolved_from=filters["digivolved_from"],
+        digivolve_to=filters["digivolve_to"],
     )
 
-    return schemas.Page(content=digimons, pagination=pagination)
+
+def parse_ids(ids: str) -> List[int]:
+    try:
+        digimon_ids = [int(id_) for id_ in ids.split(",") if id_.strip()]
+    except ValueError:
+        raise HTTPException(
+            status_code=400, detail="ids must be comma separated integers"
+        )
+    if not digimon_ids:
+        raise HTTPException(status_code=400, detail="ids is empty")
+    if len(digimon_ids) > MAX_BATCH_SIZE:
+        raise HTTPException(
+            status_code=400, detail=f"At most {MAX_BATCH_SIZE} ids per request"
+        )
+    return digimon_ids
+
+
+@app.get(
+    "/digimon/batch",
+    response_model=List[schemas.DigimonSchema],
+    description="""Details of several Digimon, e.g. /digimon/batch?ids=1,2,3,
+    in the order of the ids""",
+)
+def get_digimons_batch(ids: str, db: Session = Depends(get_db)):
+    digimon_ids = parse_ids(ids)
+    if catalog.enabled():
+        digimons = catalog.get_catalog(db).digimons
+    else:
+        digimons = {
+            digimon.id: digimon
+            for digimon in crud.get_digimons_by_ids(set(digimon_ids), db)
+        }
+    missing = [id_ for id_ in digimon_ids if id_ not in digimons]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Digimon not found: {', '.join(map(str, missing))}",
+        )
+    utils.presign_images((digimons[id_].name for id_ in digimon_ids), thumbnail=False)
+    return [documents.digimon_detail(digimons[id_]) for id_ in digimon_ids]
 
 
 @app.get("/digimon/{id_or_name}", response_model=schemas.DigimonSchema)
 def get_digmon_by_name_or_id(
     id_or_name: Union[int, str], db: Session = Depends(get_db)
 ):
-    if isinstance(id_or_name, int):
-        digimon = crud.get_digimon_by_id(id_or_name, db)
+    if documents.enabled():
+        if isinstance(id_or_name, int):
+            digimon_id = id_or_name
+        else:
+            digimon_id = search.name_index.resolve(id_or_name, db)
+        body = None
+        if digimon_id is not None:
+            body = documents.get_digimon(digimon_id, db)
+        if body is not None:
+            return Response(body, media_type="application/json")
+    try:
+        if catalog.enabled():
+            digimon_catalog = catalog.get_catalog(db)
+            if isinstance(id_or_name, int):
+                digimon = digimon_catalog.get_digimon_by_id(id_or_name)
+            else:
+                digimon = digimon_catalog.get_digimon_by_name(id_or_name)
+        elif isinstance(id_or_name, int):
+            digimon = crud.get_digimon_by_id(id_or_name, db)
+        else:
+            digimon = crud.get_digimon_by_name(id_or_name, db)
+    except NoResultFound:
+        raise HTTPException(status_code=404, detail="Digimon not found")
+
+    return documents.digimon_detail(digimon)
+
+
+def redirect_to_image(digimon_id: int, thumbnail: bool, db: Session):
+    if catalog.enabled():
+        digimon = catalog.get_catalog(db).digimons.get(digimon_id)
+        name = digimon.name if digimon is not None else None
     else:
-        digimon = crud.get_digimon_by_name(id_or_name, db)
+        name = crud.get_digimon_name(digimon_id, db)
+    return image_redirect(name, thumbnail)
 
-    digivolutions = []
-    for digivolution in digimon.digivolve_to:
-        digivolutions.append(
-            schemas.Digivolution(
-                name=digivolution.digimon_next.name, condition=digivolution.condition
-            )
-        )
-    pre_digivolutions = []
-    for pre_digivolution in digimon.digivolved_from:
-        pre_digivolutions.append(
-            schemas.Digivolution(
-                name=pre_digivolution.digimon_prior.name,
-                condition=pre_digivolution.condition,
+
+def image_redirect(name: Union[str, None], thumbnail: bool):
+    if name is None:
+        raise HTTPException(status_code=404, detail="Digimon not found")
+
+    url = utils.create_presigned_url(digimon_name=name, thumbnail=thumbnail)
+    if url is None:
+        raise HTTPException(status_code=502, detail="Image URL unavailable")
+    # the presigned URL does not change before the end of the window
+    max_age = utils.presigner.window_remaining()
+    return RedirectResponse(
+        url, status_code=302, headers={"Cache-Control": f"public, max-age={max_age}"}
+    )
+
+
+@app.get(
+    "/digimon/{digimon_id}/image",
+    response_class=RedirectResponse,
+    status_code=302,
+    description="Redirect to the (presigned) image of the digimon",
+)
+def get_digimon_image(digimon_id: int, db: Session = Depends(get_db)):
+    return redirect_to_image(digimon_id, thumbnail=False, db=db)
+
+
+@app.get(
+    "/digimon/{digimon_id}/thumbnail",
+    response_class=RedirectResponse,
+    status_code=302,
+    description="Redirect to the (presigned) thumbnail of the digimon",
+)
+def get_digimon_thumbnail(digimon_id: int, db: Session = Depends(get_db)):
+    return redirect_to_image(digimon_id, thumbnail=True, db=db)
+
+
+def get_graph(db: Session, *digimon_ids: int) -> graph.DigivolutionGraph:
+    """The digivolution graph, 404 if one of digimon_ids is unknown"""
+    digivolution_graph = graph.get_graph(db)
+    for digimon_id in digimon_ids:
+        if digimon_id not in digivolution_graph:
+            raise HTTPException(status_code=404, detail="Digimon not found")
+    return digivolution_graph
+
+
+@app.get(
+    "/digimon/{digimon_id}/lineage",
+    response_model=schemas.Lineage,
+    description="""Every digimon the digimon can digivolve to (descendants) or
+    come from (ancestors), directly or not. depth is the number of
+    digivolutions from the digimon, max_depth limits it.""",
+)
+def get_digimon_lineage(
+    digimon_id: int,
+    direction: schemas.LineageDirection = schemas.LineageDirection.descendants,
+    max_depth: Union[int, None] = Query(default=None, ge=1),
+    db: Session = Depends(get_db),
+):
+    digivolution_graph = get_graph(db, digimon_id)
+    lineage = digivolution_graph.lineage(digimon_id, direction.value, max_depth)
+    return schemas.Lineage(
+        id=digimon_id,
+        name=digivolution_graph.names[digimon_id],
+        direction=direction,
+        content=[
+            schemas.LineageNode(id=id_, name=digivolution_graph.names[id_], depth=depth)
+            for id_, depth in lineage
+        ],
+    )
+
+
+@app.get(
+    "/digimon/{digimon_id}/tree",
+    response_model=schemas.EvolutionTree,
+    description="""Evolution tree of the digimon as a graph: every digimon of
+    its lineage once (nodes, with their depth) and the digivolutions between
+    them (edges, with their condition).""",
+)
+def get_digimon_tree(
+    digimon_id: int,
+    direction: schemas.LineageDirection = schemas.LineageDirection.descendants,
+    max_depth: Union[int, None] = Query(default=None, ge=1),
+    db: Session = Depends(get_db),
+):
+    digivolution_graph = get_graph(db, digimon_id)
+    nodes, edges = digivolution_graph.tree(digimon_id, direction.value, max_depth)
+    return schemas.EvolutionTree(
+        id=digimon_id,
+        name=digivolution_graph.names[digimon_id],
+        direction=direction,
+        nodes=[
+            schemas.LineageNode(id=id_, name=digivolution_graph.names[id_], depth=depth)
+            for id_, depth in nodes
+        ],
+        edges=[
+            schemas.EvolutionEdge(
+                digimon_prior=prior, digimon_next=next_, condition=condition
             )
-        )
+            for prior, next_, condition in edges
+        ],
+    )
+
 
-    digimon_out = schemas.DigimonSchema(
-        id=digimon.id,
-        name=digimon.name,
-        xantibody=digimon.xantibody,
-        release_date=digimon.release_date,
-        descriptions=digimon.descriptions,
-        levels=digimon.levels,
-        fields=digimon.fields,
-        attributes=digimon.attributes,
-        types=digimon.types,
-        skills=digimon.skills,
-        digivolved_from=pre_digivolutions,
-        digivolve_to=digivolutions,
+@app.get(
+    "/digimon/{digimon_id}/path/{target_id}",
+    response_model=schemas.DigivolutionPath,
+    description="""Shortest chain of digivolutions from the digimon to the
+    target, 404 if the target cannot be reached""",
+)
+def get_digivolution_path(
+    digimon_id: int, target_id: int, db: Session = Depends(get_db)
+):
+    digivolution_graph = get_graph(db, digimon_id, target_id)
+    path = digivolution_graph.shortest_path(digimon_id, target_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="No digivolution path")
+    return schemas.DigivolutionPath(
+        length=len(path) - 1,
+        steps=[
+            schemas.PathStep(
+                id=id_, name=digivolution_graph.names[id_], condition=condition
+            )
+            for id_, condition in path
+        ],
     )
-    return digimon_out
+
+
+def reference_page(table: str, page_size: int, page: int, db: Session):
+    if documents.enabled():
+        body = documents.get_reference_page(table, page_size, page, db)
+        if body is not None:
+            return Response(body, media_type="application/json")
+    rows, pagination = documents.reference_page(table, page_size, page, db)
+    return page_response(serialization.reference, rows, pagination)
 
 
 @app.get("/level", response_model=schemas.Page)
 def get_all_levels(page_size: int = 5, page: int = 1, db: Session = Depends(get_db)):
-    levels, count_levels = crud.get_levels(page_size=page_size, page=page, db=db)
-
-    path = "/level"
-    pagination = utils.paginaton(path, count_levels, page, page_size, len(levels))
-    return schemas.Page(content=levels, pagination=pagination)
+    return reference_page("level", page_size, page, db)
 
 
 @app.get("/attribute", response_model=schemas.Page)
 def get_all_attributes(
     page_size: int = 5, page: int = 1, db: Session = Depends(get_db)
 ):
-    attributes, count_attributes = crud.get_attributes(
-        page_size=page_size, page=page, db=db
-    )
-
-    path = "/attribute"
-    pagination = utils.paginaton(
-        path, count_attributes, page, page_size, len(attributes)
-    )
-    return schemas.Page(content=attributes, pagination=pagination)
+    return reference_page("attribute", page_size, page, db)
 
 
 @app.get("/field", response_model=schemas.Page)
 def get_all_fields(page_size: int = 5, page: int = 1, db: Session = Depends(get_db)):
-    fields, count_fields = crud.get_fields(page_size=page_size, page=page, db=db)
-
-    path = "/field"
-    pagination = utils.paginaton(path, count_fields, page, page_size, len(fields))
-    return schemas.Page(content=fields, pagination=pagination)
+    return reference_page("field", page_size, page, db)
 
 
 @app.get("/type", response_model=schemas.Page)
 def get_all_types(page_size: int = 5, page: int = 1, db: Session = Depends(get_db)):
-    types, count_types = crud.get_types(page_size=page_size, page=page, db=db)
-
-    path = "/type"
-    pagination = utils.paginaton(path, count_types, page, page_size, len(types))
-    return schemas.Page(content=types, pagination=pagination)
+    return reference_page("type", page_size, page, db)
 
 
 @app.get("/skill", response_model=schemas.Page)
@@ -197,6 +509,8 @@ def get_all_skills(
     page: int = 1,
     name_contains: Union[str, None] = None,
     description_contains: Union[str, None] = None,
+    sort: schemas.SkillSort = schemas.SkillSort.id,
+    after: Union[str, None] = None,
     db: Session = Depends(get_db),
 ):
     skills, count_skills = crud.get_skills(
@@ -205,14 +519,232 @@ def get_all_skills(
         name_contains=name_contains,
         description_contains=description_contains,
         db=db,
+        sort=sort.value,
+        after=decode_cursor(after, sort),
     )
+    return skill_page(skills, count_skills, page_size, page, after, sort)
 
-    path = "/skill"
-    pagination = utils.paginaton(path, count_skills, page, page_size, len(skills))
-    return schemas.Page(content=skills, pagination=pagination)
 
+def skill_page(
+    skills: list,
+    count_skills: int,
+    page_size: int,
+    page: int,
+    after: Union[str, None],
+    sort: schemas.SkillSort,
+):
+    path = "/skill?"
+    pagination = utils.paginaton(
+        path,
+        count_skills,
+        page,
+        page_size,
+        len(skills),
+        next_after=next_cursor(after, skills, sort),
+        sort=None if sort == schemas.SkillSort.id else sort.value,
+    )
+    return page_response(serialization.skill, skills, pagination)
+
+
+# Async endpoints, see REQUEST_PATH. The queries of the request run on the
+# async engine; the process-wide caches (catalog, documents, search indexes)
+# keep their sync loaders, called in the thread pool with the get_db session.
+
+
+def load_search_index(table: str, name_contains: Union[str, None], db: Session):
+    """Load the n-gram index a name_contains search needs (if any), before
+    an async_crud function uses it"""
+    if name_contains and not search.uses_trigram(db):
+        search.get_index(table, db)
+
+
+async def get_all_digimons_async(
+    page_size: int = 10,
+    page: int = 1,
+    xantibody: Union[bool, None] = None,
+    name_contains: Union[str, None] = None,
+    id_type: Union[int, None] = None,
+    id_field: Union[int, None] = None,
+    id_level: Union[int, None] = None,
+    id_attribute: Union[int, None] = None,
+    digivolved_from: Union[int, None] = None,
+    digivolve_to: Union[int, None] = None,
+    sort: schemas.DigimonSort = schemas.DigimonSort.id,
+    after: Union[str, None] = None,
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    cursor = decode_cursor(after, sort)
+    filters = dict(
+        xantibody=xantibody,
+        name_contains=name_contains,
+        id_type=id_type,
+        id_field=id_field,
+        id_level=id_level,
+        id_attribute=id_attribute,
+        digivolved_from=digivolved_from,
+        digivolve_to=digivolve_to,
+    )
+    if catalog.enabled():
+        digimon_catalog = await run_in_threadpool(catalog.get_catalog, db)
+        digimons, count_digimons = digimon_catalog.get_digimons(
+            page_size=page_size, page=page, sort=sort.value, after=cursor, **filters
+        )
+    else:
+        await run_in_threadpool(load_search_index, "digimon", name_contains, db)
+        digimons, count_digimons = await async_crud.get_digimons(
+            sessions,
+            page_size=page_size,
+            page=page,
+            sort=sort.value,
+            after=cursor,
+            **filters,
+        )
+
+    pagination = digimon_pagination(
+        digimons, count_digimons, page_size, page, after, sort, filters
+    )
+    await run_in_threadpool(
+        utils.presign_images, [digimon.name for digimon in digimons], True
+    )
+    return page_response(serialization.digimon, digimons, pagination)
+
+
+async def get_digimons_batch_async(
+    ids: str,
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    if catalog.enabled():
+        return await run_in_threadpool(get_digimons_batch, ids, db)
+    digimon_ids = parse_ids(ids)
+    digimons = {
+        digimon.id: digimon
+        for digimon in await async_crud.get_digimons_by_ids(set(digimon_ids), sessions)
+    }
+    missing = [id_ for id_ in digimon_ids if id_ not in digimons]
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Digimon not found: {', '.join(map(str, missing))}",
+        )
+    await run_in_threadpool(
+        utils.presign_images, [digimon.name for digimon in digimons.values()], False
+    )
+    return [documents.digimon_detail(digimons[id_]) for id_ in digimon_ids]
+
+
+async def get_digimon_by_name_or_id_async(
+    id_or_name: Union[int, str],
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    if catalog.enabled() or documents.enabled():
+        return await run_in_threadpool(get_digmon_by_name_or_id, id_or_name, db)
+    if isinstance(id_or_name, int):
+        digimon_id = id_or_name
+    else:
+        digimon_id = await run_in_threadpool(search.name_index.resolve, id_or_name, db)
+    digimons = []
+    if digimon_id is not None:
+        digimons = await async_crud.get_digimons_by_ids([digimon_id], sessions)
+    if not digimons:
+        raise HTTPException(status_code=404, detail="Digimon not found")
+
+    await run_in_threadpool(
+        utils.presign_images, [digimon.name for digimon in digimons], False
+    )
+    return documents.digimon_detail(digimons[0])
+
+
+async def redirect_to_image_async(
+    digimon_id: int, thumbnail: bool, db: Session, sessions: Callable
+):
+    if catalog.enabled():
+        return await run_in_threadpool(redirect_to_image, digimon_id, thumbnail, db)
+    name = await async_crud.get_digimon_name(digimon_id, sessions)
+    return await run_in_threadpool(image_redirect, name, thumbnail)
+
+
+async def get_digimon_image_async(
+    digimon_id: int,
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    return await redirect_to_image_async(digimon_id, False, db, sessions)
+
+
+async def get_digimon_thumbnail_async(
+    digimon_id: int,
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    return await redirect_to_image_async(digimon_id, True, db, sessions)
+
+
+async def get_all_skills_async(
+    page_size: int = 10,
+    page: int = 1,
+    name_contains: Union[str, None] = None,
+    description_contains: Union[str, None] = None,
+    sort: schemas.SkillSort = schemas.SkillSort.id,
+    after: Union[str, None] = None,
+    db: Session = Depends(get_db),
+    sessions: Callable = Depends(get_async_sessions),
+):
+    cursor = decode_cursor(after, sort)
+    await run_in_threadpool(load_search_index, "skill", name_contains, db)
+    skills, count_skills = await async_crud.get_skills(
+        sessions,
+        page_size=page_size,
+        page=page,
+        name_contains=name_contains,
+        description_contains=description_contains,
+        sort=sort.value,
+        after=cursor,
+    )
+    return skill_page(skills, count_skills, page_size, page, after, sort)
+
+
+# route path -> its async endpoint
+ASYNC_ENDPOINTS = {
+    "/digimon": get_all_digimons_async,
+    "/digimon/batch": get_digimons_batch_async,
+    "/digimon/{id_or_name}": get_digimon_by_name_or_id_async,
+    "/digimon/{digimon_id}/image": get_digimon_image_async,
+    "/digimon/{digimon_id}/thumbnail": get_digimon_thumbnail_async,
+    "/skill": get_all_skills_async,
+}
+
+
+def use_async_endpoints(application: FastAPI, endpoints: Dict[str, Callable]):
+    """Replace the endpoint of the routes of endpoints (path -> endpoint),
+    keeping the order, response model and documentation of the routes"""
+    routes = []
+    for route in application.router.routes:
+        endpoint = endpoints.get(getattr(route, "path", None))
+        if endpoint is not None:
+            route = APIRoute(
+                route.path,
+                endpoint,
+                response_model=route.response_model,
+                status_code=route.status_code,
+                description=route.description,
+                response_class=route.response_class,
+                name=route.name,
+                methods=route.methods,
+                dependency_overrides_provider=application,
+            )
+        routes.append(route)
+    application.router.routes[:] = routes
+
+
+if REQUEST_PATH == "async":
+    use_async_endpoints(app, ASYNC_ENDPOINTS)
 
 handler = Mangum(app)
 
 if __name__ == "__main__":
+    import uvicorn
+
     uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,50 @@
+from typing import Callable, List, Optional
+
+import crud
+import models
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# Async versions of the crud functions of the request path. They take a
+# factory of AsyncSession (e.g. database.async_session) rather than a
+# session, and run their queries on a single session, closed before the
+# function returns: the statements of a request are as many as on the sync
+# path, on one connection.
+#
+# The process-wide caches (search indexes, name index, catalog...) are still
+# loaded by the sync code, in the thread pool: their locks are thread locks,
+# which a coroutine must not wait for on the event loop.
+Sessions = Callable[[], AsyncSession]
+
+
+async def get_digimons(sessions: Sessions, **kwargs):
+    """crud.get_digimons on an async session, the search index used by
+    name_contains has to be loaded (see search.get_index)"""
+    async with sessions() as db:
+        return await db.run_sync(
+            lambda session: crud.get_digimons(db=session, **kwargs)
+        )
+
+
+async def get_skills(sessions: Sessions, **kwargs):
+    """crud.get_skills on an async session, see get_digimons"""
+    async with sessions() as db:
+        return await db.run_sync(lambda session: crud.get_skills(db=session, **kwargs))
+
+
+async def get_digimon_name(digimon_id: int, sessions: Sessions) -> Optional[str]:
+    async with sessions() as db:
+        return await db.scalar(
+            select(models.SimpleDigimon.name).where(
+                models.SimpleDigimon.id == digimon_id
+            )
+        )
+
+
+async def get_digimons_by_ids(digimon_ids: List[int], sessions: Sessions):
+    """crud.get_digimons_by_ids on an async session: the digimon with all
+    their relations, a query for the digimon and one per relation"""
+    async with sessions() as db:
+        return await db.run_sync(
+            lambda session: crud.get_digimons_by_ids(digimon_ids, session)
+        )
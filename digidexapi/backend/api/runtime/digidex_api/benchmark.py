@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import pathlib
+import platform
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+from urllib.parse import urlsplit
+
+import budget
+import cache
+import caching
+import catalog
+import dataset
+import documents
+import export
+import graph
+import search
+import serialization
+import sqlalchemy
+import timing
+import utils
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import sessionmaker
+
+import app
+
+# Time every route of the API over a database filled by dataset.generate,
+# straight through the ASGI application and through the Lambda handler
+# (Mangum, with an API Gateway event), and count its queries against the
+# budget of the route. The images are signed locally with static
+# credentials: no AWS account is needed, the signing cost is part of the
+# timings.
+BENCHMARK_CREDENTIALS = {
+    "AWS_ACCESS_KEY_ID": "AKIDBENCHMARK",
+    "AWS_SECRET_ACCESS_KEY": "benchmark/secret/access/key",
+    "AWS_DEFAULT_REGION": "eu-west-3",
+    "S3_IMAGE_BUCKET": "digidex-images",
+}
+
+
+def urls(size: int, seed: int = 0) -> Dict[str, str]:
+    """Route (the path of app.py, with the variant in brackets) -> URL timed.
+    The digimon are drawn from the dataset of dataset.generate(size, seed):
+    a first stage digimon, with a lineage, and ten others for the batch."""
+    rng = random.Random(seed)
+    stage_ids = range(1, size + 1, dataset.STAGES)
+    digimon_id = rng.choice(stage_ids[: max(1, len(stage_ids) - 1)])
+    batch = sorted(rng.sample(range(1, size + 1), min(10, size)))
+    fragment = rng.choice(dataset.SYLLABLES[1:])
+    last_page = max(1, size // 10)
+    return {
+        "/digimon": "/digimon",
+        "/digimon [deep page]": f"/digimon?page={last_page}",
+        "/digimon [name sort]": "/digimon?sort=name&page=2",
+        # the deep page, after the cursor of the page before it, see
+        # keyset_cursor
+        "/digimon [keyset]": "/digimon?after=",
+        "/digimon [filters]": "/digimon?id_level=1&id_attribute=1&xantibody=false",
+        "/digimon [name_contains]": f"/digimon?name_contains={fragment}",
+        "/digimon/batch": f"/digimon/batch?ids={','.join(map(str, batch))}",
+        "/digimon/{id_or_name}": f"/digimon/{digimon_id}",
+        "/digimon/{id_or_name} [name]": (
+            f"/digimon/{dataset.digimon_name(digimon_id).lower()}"
+        ),
+        "/digimon/{digimon_id}/image": f"/digimon/{digimon_id}/image",
+        "/digimon/{digimon_id}/thumbnail": f"/digimon/{digimon_id}/thumbnail",
+        "/digimon/{digimon_id}/lineage": f"/digimon/{digimon_id}/lineage",
+        "/digimon/{digimon_id}/tree": f"/digimon/{digimon_id}/tree",
+        # the target is the deepest descendant, see deepest_descendant
+        "/digimon/{digimon_id}/path/{target_id}": f"/digimon/{digimon_id}/path/",
+        "/skill": "/skill",
+        "/skill [name_contains]": f"/skill?name_contains={fragment}",
+        "/level": "/level",
+        "/attribute": "/attribute",
+        "/field": "/field",
+        "/type": "/type",
+    }
+
+
+def api_gateway_event(url: str) -> Dict:
+    """API Gateway (REST, proxy integration) event of a GET of url"""
+    parts = urlsplit(url)
+    query = parse_qsl(parts.query, keep_blank_values=True)
+    multi_value_query: Dict[str, List[str]] = {}
+    for name, value in query:
+        multi_value_query.setdefault(name, []).append(value)
+    headers = {"Host": "api.digidexapi.com", "X-Forwarded-Proto": "https"}
+    return {
+        "resource": "/{proxy+}",
+        "path": parts.path,
+        "httpMethod": "GET",
+        "headers": headers,
+        "multiValueHeaders": {name: [value] for name, value in headers.items()},
+        "queryStringParameters": dict(query) or None,
+        "multiValueQueryStringParameters": multi_value_query or None,
+        "pathParameters": {"proxy": parts.path.lstrip("/")},
+        "stageVariables": None,
+        "requestContext": {
+            "resourcePath": "/{proxy+}",
+            "httpMethod": "GET",
+            "path": f"/prod{parts.path}",
+            "stage": "prod",
+            "requestId": "benchmark",
+            "identity": {"sourceIp": "127.0.0.1"},
+        },
+        "body": None,
+        "isBase64Encoded": False,
+    }
+
+
+def deepest_descendant(get: Callable[[str], Tuple[int, bytes]], digimon_id: int):
+    """Id of the deepest descendant of a digimon (itself if it has none)"""
+    status, body = get(f"/digimon/{digimon_id}/lineage")
+    if status != 200:
+        return digimon_id
+    content = json.loads(body)["content"]
+    return max(content, key=lambda node: node["depth"])["id"] if content else digimon_id
+
+
+def keyset_cursor(get: Callable[[str], Tuple[int, bytes]], page: int) -> str:
+    """Keyset cursor of the last digimon of a page (by id), "" for none"""
+    if page < 1:
+        return ""
+    status, body = get(f"/digimon?page={page}")
+    content = json.loads(body)["content"] if status == 200 else []
+    return utils.encode_cursor("id", (content[-1]["id"],)) if content else ""
+
+
+def settings() -> Dict[str, str]:
+    """Settings of the API which change the timings, recorded with them"""
+    return {
+        "REQUEST_PATH": app.REQUEST_PATH,
+        "DIGIMON_BACKEND": catalog.DIGIMON_BACKEND,
+        "DOCUMENTS": documents.DOCUMENTS,
+        "SERIALIZATION": serialization.SERIALIZATION,
+        "IMAGE_HREF": utils.IMAGE_HREF,
+        "NAME_SEARCH": search.NAME_SEARCH,
+        "SERVER_TIMING": timing.SERVER_TIMING,
+        "QUERY_BUDGET": budget.QUERY_BUDGET,
+    }
+
+
+def summarize(durations: List[float]) -> Dict[str, float]:
+    """Statistics of durations (seconds), in milliseconds"""
+    ordered = sorted(durations)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return {
+        "min_ms": round(ordered[0] * 1000, 3),
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(p95 * 1000, 3),
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+def empty_caches():
+    """Forget everything the API keeps between requests"""
+    cache.reference_cache.invalidate()
+    cache.count_cache.invalidate()
+    catalog.invalidate()
+    documents.store.invalidate()
+    graph.invalidate()
+    search.invalidate()
+    caching.invalidate()
+    utils.presigner.clear()
+
+
+def is_generated(engine: Engine, size: int, seed: int) -> bool:
+    """The database has the dataset of dataset.generate(size, seed)"""
+    return dataset.generated(engine) == {"size": size, "seed": seed}
+
+
+def async_sessions(database_url: str) -> Callable:
+    """AsyncSession factory of database_url, for REQUEST_PATH=async"""
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = sqlalchemy.engine.make_url(database_url)
+    driver = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+    engine = create_async_engine(url.set(drivername=driver[url.get_backend_name()]))
+    return sessionmaker(class_=AsyncSession, bind=engine, expire_on_commit=False)
+
+
+def time_route(
+    get: Callable[[str], Tuple[int, bytes]], url: str, repeat: int, warmup: int
+) -> Dict:
+    """Status, size and timings of repeat GETs of url, after warmup ones.
+    first_ms is the first GET, with the caches of the API empty."""
+    empty_caches()
+    start = time.perf_counter()
+    status, body = get(url)
+    first = time.perf_counter() - start
+    for _ in range(warmup):
+        get(url)
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        get(url)
+        durations.append(time.perf_counter() - start)
+    return {
+        "status": status,
+        "bytes": len(body),
+        "first_ms": round(first * 1000, 3),
+        **summarize(durations),
+    }
+
+
+def query_usage(get: Callable[[str], Tuple[int, bytes]], route: str, url: str):
+    """Statements and rows of a GET of url with the caches of the API empty,
+    the fills of the process-wide caches apart, and the budget of its route
+    (app.QUERY_BUDGETS)"""
+    empty_caches()
+    with budget.measure() as usage:
+        get(url)
+    record = usage.record()
+    route_budget = app.QUERY_BUDGETS.get(route.split(" [")[0])
+    if route_budget is not None:
+        record["budget"] = {
+            "statements": route_budget.statements,
+            "rows": route_budget.max_rows(urlsplit(url).query.encode("latin-1")),
+        }
+    return record
+
+
+def run(
+    database_url: str,
+    size: int = 1000,
+    seed: int = 0,
+    repeat: int = 20,
+    warmup: int = 2,
+    routes: Optional[List[str]] = None,
+) -> Dict:
+    """Generate the dataset in database_url (unless it is already there) and
+    time the routes (all of them by default) through the ASGI application
+    and through the Lambda handler.
+
+    :return: the results, the dataset and the settings of the API
+    """
+    for name, value in BENCHMARK_CREDENTIALS.items():
+        os.environ.setdefault(name, value)
+    engine = create_engine(database_url)
+    if not is_generated(engine, size, seed):
+        dataset.generate(engine, size, seed)
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # Mangum runs the application on the current event loop, the ASGI
+    # timings use the same one
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    def asgi_get(url: str) -> Tuple[int, bytes]:
+        return loop.run_until_complete(export.asgi_get(app.app, url))
+
+    def handler_get(url: str) -> Tuple[int, bytes]:
+        response = app.handler(api_gateway_event(url), None)
+        return response["statusCode"], response["body"].encode("utf-8")
+
+    overrides = dict(app.app.dependency_overrides)
+    app.app.dependency_overrides[app.get_db] = get_db
+    if app.REQUEST_PATH == "async":
+        factory = async_sessions(database_url)
+        app.app.dependency_overrides[app.get_async_sessions] = lambda: factory
+    installed = budget.is_installed()
+    budget.install()
+    results = {}
+    try:
+        timed_urls = urls(size, seed)
+        path = "/digimon/{digimon_id}/path/{target_id}"
+        digimon_id = int(timed_urls[path].split("/")[2])
+        timed_urls[path] += str(deepest_descendant(asgi_get, digimon_id))
+        last_page = max(1, size // 10)
+        timed_urls["/digimon [keyset]"] += keyset_cursor(asgi_get, last_page - 1)
+        for route, url in timed_urls.items():
+            if routes and route not in routes:
+                continue
+            results[route] = {
+                "url": url,
+                "asgi": time_route(asgi_get, url, repeat, warmup),
+                "handler": time_route(handler_get, url, repeat, warmup),
+                "queries": query_usage(asgi_get, route, url),
+            }
+            logging.info(
+                f"{route}: {results[route]['asgi']['median_ms']}ms "
+                f"({results[route]['handler']['median_ms']}ms through the handler)"
+            )
+    finally:
+        app.app.dependency_overrides = overrides
+        if not installed:
+            budget.uninstall()
+        asyncio.set_event_loop(None)
+        loop.close()
+        empty_caches()
+    return {
+        "dataset": {"size": size, "seed": seed, "database": engine.dialect.name},
+        "settings": settings(),
+        "environment": {
+            "python": platform.python_version(),
+            "sqlalchemy": sqlalchemy.__version__,
+        },
+        "repeat": repeat,
+        "warmup": warmup,
+        "routes": results,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Time every route of the API over a synthetic dataset"
+    )
+    parser.add_argument("--size", type=int, default=1000, help="number of digimon")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--database-url",
+        help="defaults to sqlite:///benchmark-{size}-{seed}.db, the tables of "
+        "a database without the dataset are dropped",
+    )
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=2)
+    parser.add_argument("--route", action="append", help="only time this route")
+    parser.add_argument(
+        "--output",
+        type=pathlib.Path,
+        help="result file, defaults to benchmark-{size}-{seed}.json",
+    )
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    # a line per request otherwise
+    logging.getLogger("mangum").setLevel(logging.WARNING)
+    name = f"benchmark-{arguments.size}-{arguments.seed}"
+    results = run(
+        arguments.database_url or f"sqlite:///{name}.db",
+        arguments.size,
+        arguments.seed,
+        arguments.repeat,
+        arguments.warmup,
+        arguments.route,
+    )
+    output = arguments.output or pathlib.Path(f"{name}.json")
+    output.write_text(json.dumps(results, indent=2) + "\n")
+    print(f"Results written to {output}")
@@ -0,0 +1,155 @@
+import logging
+import sys
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import models
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# index column -> (association table, id column)
+ASSOCIATIONS = {
+    "type": (models.digimon_type, "id_type"),
+    "field": (models.digimon_field, "id_field"),
+    "level": (models.digimon_level, "id_level"),
+    "attribute": (models.digimon_attribute, "id_attribute"),
+}
+
+
+def union(*bitmaps: int) -> int:
+    result = 0
+    for bitmap in bitmaps:
+        result |= bitmap
+    return result
+
+
+def intersection(*bitmaps: int) -> int:
+    """Intersection of the bitmaps. With no bitmap there is no constraint,
+    so the caller has to start from BitmapIndex.all"""
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+        result &= bitmap
+    return result
+
+
+def count(bitmap: int) -> int:
+    # int.bit_count() only exists since python 3.10 and the lambda runs 3.9
+    return bin(bitmap).count("1")
+
+
+def greater_than(bitmap: int, id_: int) -> int:
+    """Keep only the ids strictly greater than id_"""
+    return bitmap >> (id_ + 1) << (id_ + 1) if id_ >= 0 else bitmap
+
+
+def iter_ids(bitmap: int, offset: int = 0) -> Iterator[int]:
+    """Yield the position of every set bit, in ascending order.
+
+    Python ints are the bitsets, bit n set means digimon n matches. Working
+    on the binary string keeps this linear in the bitmap size.
+    """
+    bits = bin(bitmap)[:1:-1]
+    position = bits.find("1")
+    while position != -1:
+        if offset:
+            offset -= 1
+        else:
+            yield position
+        position = bits.find("1", position + 1)
+
+
+def to_ids(bitmap: int, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+    """Ascending ids of the bitmap, skipping offset ids and returning at most
+    limit, so a page can be read straight from a bitmap"""
+    ids = []
+    if limit is not None and limit <= 0:
+        return ids
+    for id_ in iter_ids(bitmap, offset):
+        ids.append(id_)
+        if limit is not None and len(ids) == limit:
+            break
+    return ids
+
+
+class BitmapIndex:
+    """Inverted index of the categorical digimon filters.
+
+    One bitmap per type, field, level and attribute value, plus one per
+    xantibody value. Combining filters is a bitwise and, and the matching ids
+    come out sorted, ready for pagination.
+    """
+
+    def __init__(self):
+        self.all = 0
+        self.bitmaps: Dict[Tuple[str, object], int] = {}
+        self.build_time = 0.0
+
+    def add(self, column: str, value, id_digimon: int):
+        key = (column, value)
+        self.bitmaps[key] = self.bitmaps.get(key, 0) | (1 << id_digimon)
+
+    def add_digimon(self, id_digimon: int, xantibody: Optional[bool]):
+        self.all |= 1 << id_digimon
+        if xantibody is not None:
+            self.add("xantibody", bool(xantibody), id_digimon)
+
+    def add_rows(self, column: str, rows: Iterable[Tuple[int, int]]):
+        """Index (id_digimon, id_value) rows of an association table"""
+        bitmaps = {}
+        for id_digimon, id_value in rows:
+            bitmaps[id_value] = bitmaps.get(id_value, 0) | (1 << id_digimon)
+        for id_value, bitmap in bitmaps.items():
+            key = (column, id_value)
+            self.bitmaps[key] = self.bitmaps.get(key, 0) | bitmap
+
+    def get(self, column: str, value) -> int:
+        """Bitmap of the digimon having value in column, 0 if there is none"""
+        return self.bitmaps.get((column, value), 0)
+
+    def match(self, **filters) -> int:
+        """Bitmap of the digimon matching every filter given (None values are
+        ignored), e.g. match(type=1, xantibody=True)"""
+        bitmaps = [
+            self.get(column, value)
+            for column, value in filters.items()
+            if value is not None
+        ]
+        return intersection(self.all, *bitmaps)
+
+    def memory_size(self) -> int:
+        """Approximate size in bytes of the bitmaps"""
+        return sys.getsizeof(self.all) + sum(
+            sys.getsizeof(bitmap) for bitmap in self.bitmaps.values()
+        )
+
+    def stats(self) -> dict:
+        return {
+            "digimons": count(self.all),
+            "bitmaps": len(self.bitmaps),
+            "build_time": self.build_time,
+            "memory_size": self.memory_size(),
+        }
+
+    def log_stats(self):
+        stats = self.stats()
+        logging.info(
+            f"Bitmap index built: {stats['bitmaps']} bitmaps over "
+            f"{stats['digimons']} digimon in {stats['build_time']:.3f}s, "
+            f"{stats['memory_size']} bytes"
+        )
+
+    @classmethod
+    def build(cls, db: Session) -> "BitmapIndex":
+        start = time.perf_counter()
+        index = cls()
+        for id_digimon, xantibody in db.execute(
+            select(models.SimpleDigimon.id, models.SimpleDigimon.xantibody)
+        ):
+            index.add_digimon(id_digimon, xantibody)
+        for column, (table, id_column) in ASSOCIATIONS.items():
+            index.add_rows(
+                column, db.execute(select(table.c.id_digimon, table.c[id_column]))
+            )
+        index.build_time = time.perf_counter() - start
+        index.log_stats()
+        return index
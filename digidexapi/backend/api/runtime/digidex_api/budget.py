@@ -0,0 +1,221 @@
+import contextlib
+import functools
+import json
+import logging
+import os
+from contextvars import ContextVar
+from typing import Dict, NamedTuple, Optional
+from urllib.parse import parse_qs
+
+import caching
+from sqlalchemy import event
+from sqlalchemy.engine import CursorResult
+from sqlalchemy.engine import Engine
+
+# "raise" fails the requests over the query budget of their route with a 500
+# (tests, development), "log" logs them, "off" counts nothing.
+QUERY_BUDGET = os.getenv("QUERY_BUDGET", "off")
+
+
+class Budget(NamedTuple):
+    """SQL statements and rows a request of a route may read.
+
+    The rows of a page grow with its size: a request may read rows +
+    rows_per_item * page_size rows, page_size being its page_size query
+    parameter or the default of the route.
+    """
+
+    statements: int
+    rows: int
+    rows_per_item: int = 0
+    page_size: int = 0
+
+    def max_rows(self, query_string: bytes = b"") -> int:
+        page_size = self.page_size
+        values = parse_qs(query_string.decode("latin-1")).get("page_size")
+        if values:
+            try:
+                page_size = max(int(values[-1]), 0)
+            except ValueError:
+                pass
+        return self.rows + self.rows_per_item * page_size
+
+
+class BudgetExceeded(Exception):
+    pass
+
+
+class Usage:
+    """Statements run and rows fetched by a request. Those of the process
+    wide caches filled by the request (see exempt) are counted apart: the
+    next requests use them for free."""
+
+    def __init__(self):
+        self.statements = 0
+        self.rows = 0
+        self.exempt_statements = 0
+        self.exempt_rows = 0
+        self.exempt = 0
+
+    def add(self, statements: int = 0, rows: int = 0):
+        if self.exempt:
+            self.exempt_statements += statements
+            self.exempt_rows += rows
+        else:
+            self.statements += statements
+            self.rows += rows
+
+    def record(self) -> Dict[str, int]:
+        return {
+            "statements": self.statements,
+            "rows": self.rows,
+            "exempt_statements": self.exempt_statements,
+            "exempt_rows": self.exempt_rows,
+        }
+
+
+# usage of the request being served, None outside of a counted request (see
+# timing.current)
+current: ContextVar[Optional[Usage]] = ContextVar("budget", default=None)
+
+
+@contextlib.contextmanager
+def exempt():
+    """Do not count against the budget, for the fills of the caches which
+    outlive the request. Also a decorator."""
+    usage = current.get()
+    if usage is None:
+        yield
+        return
+    usage.exempt += 1
+    try:
+        yield
+    finally:
+        usage.exempt -= 1
+
+
+@contextlib.contextmanager
+def measure():
+    """Count the statements and rows of the block (install must have been
+    called), in the Usage it yields"""
+    usage = Usage()
+    token = current.set(usage)
+    try:
+        yield usage
+    finally:
+        current.reset(token)
+
+
+def _count_statement(conn, cursor, statement, parameters, context, many):
+    usage = current.get()
+    if usage is not None:
+        usage.add(statements=1)
+
+
+def _counted(fetch):
+    @functools.wraps(fetch)
+    def wrapper(self, *args, **kwargs):
+        rows = fetch(self, *args, **kwargs)
+        usage = current.get()
+        if usage is not None and rows is not None:
+            usage.add(rows=len(rows) if isinstance(rows, list) else 1)
+        return rows
+
+    return wrapper
+
+
+def _counted_iterator(fetch):
+    @functools.wraps(fetch)
+    def wrapper(self):
+        usage = current.get()
+        for row in fetch(self):
+            if usage is not None:
+                usage.add(rows=1)
+            yield row
+
+    return wrapper
+
+
+# methods of CursorResult every row of a result is fetched with, the ORM's
+# and the async results' included
+_FETCHES = {
+    "_fetchone_impl": _counted,
+    "_fetchmany_impl": _counted,
+    "_fetchall_impl": _counted,
+    "_fetchiter_impl": _counted_iterator,
+}
+
+
+def install():
+    """Count the statements of every engine and the rows of every result"""
+    if is_installed():
+        return
+    event.listen(Engine, "before_cursor_execute", _count_statement)
+    for name, counted in _FETCHES.items():
+        setattr(CursorResult, name, counted(getattr(CursorResult, name)))
+
+
+def uninstall():
+    if not is_installed():
+        return
+    event.remove(Engine, "before_cursor_execute", _count_statement)
+    for name in _FETCHES:
+        setattr(CursorResult, name, getattr(CursorResult, name).__wrapped__)
+
+
+def is_installed() -> bool:
+    return event.contains(Engine, "before_cursor_execute", _count_statement)
+
+
+class QueryBudgetMiddleware:
+    """Count the statements and rows of every request (see install) and
+    check them against the budget of its route before the response starts:
+    over budget, the request is logged, and fails when mode is "raise".
+
+    :param budgets: route path -> Budget, the other routes are not checked
+    """
+
+    def __init__(self, app, budgets: Dict[str, Budget], mode: str = QUERY_BUDGET):
+        self.app = app
+        self.budgets = budgets
+        self.mode = mode
+
+    def check(self, scope, usage: Usage):
+        route = caching.route_path(scope)
+        budget = self.budgets.get(route)
+        if budget is None:
+            return
+        max_rows = budget.max_rows(scope.get("query_string", b""))
+        if usage.statements <= budget.statements and usage.rows <= max_rows:
+            return
+        record = {
+            "message": "query budget exceeded",
+            "path": scope["path"],
+            "route": route,
+            **usage.record(),
+            "budget": {"statements": budget.statements, "rows": max_rows},
+        }
+        logging.warning(json.dumps(record))
+        if self.mode == "raise":
+            raise BudgetExceeded(
+                f"{route}: {usage.statements} statements and {usage.rows} rows, "
+                f"over the budget of {budget.statements} statements and "
+                f"{max_rows} rows"
+            )
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        with measure() as usage:
+
+            async def send_checked(message):
+                if message["type"] == "http.response.start":
+                    self.check(scope, usage)
+                await send(message)
+
+            await self.app(scope, receive, send_checked)
+
+
+def enabled() -> bool:
+    return QUERY_BUDGET in ("log", "raise")
@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import budget
+import models
+import schemas
+from sqlalchemy.orm import Session
+
+REFERENCE_TABLES = {
+    "level": (models.Level, schemas.LevelBase),
+    "attribute": (models.Attribute, schemas.AttributeBase),
+    "field": (models.Field, schemas.FieldBase),
+    "type": (models.Type, schemas.TypeBase),
+}
+
+
+class ReferenceCache:
+    """Process-wide cache of the small reference tables (level, attribute,
+    field and type).
+
+    Each table is loaded with a single query the first time it's requested,
+    then pages and counts are served from memory. Because a Lambda container
+    (or an uvicorn worker) lives for a while, warm requests do not reach the
+    database at all.
+
+    :param ttl: seconds before a loaded table is considered stale. None means
+    the table is kept until :meth:`invalidate` is called.
+    :param clock: monotonic clock, can be replaced for testing.
+    """
+
+    def __init__(
+        self,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tables: Dict[str, Tuple[float, List]] = {}
+
+    def _load(self, table: str, db: Session) -> List:
+        model, schema = REFERENCE_TABLES[table]
+        rows = db.query(model).order_by(model.id).all()
+        logging.info(f"Reference table {table} loaded ({len(rows)} rows)")
+        return [schema.from_orm(row) for row in rows]
+
+    def _is_fresh(self, loaded_at: float) -> bool:
+        return self.ttl is None or self._clock() - loaded_at < self.ttl
+
+    def get_all(self, table: str, db: Session) -> List:
+        """Return every row of a reference table, loading it if needed.
+
+        :param table: one of level, attribute, field or type
+        :param db: session used only when the table has to be (re)loaded
+        """
+        entry = self._tables.get(table)
+        if entry is not None and self._is_fresh(entry[0]):
+            return entry[1]
+        with self._lock:
+            entry = self._tables.get(table)
+            if entry is None or not self._is_fresh(entry[0]):
+                with budget.exempt():
+                    entry = (self._clock(), self._load(table, db))
+                self._tables[table] = entry
+        return entry[1]
+
+    def get_page(
+        self, table: str, page_size: int, page: int, db: Session
+    ) -> Tuple[List, int]:
+        """(page content, total count) of a page of a table"""
+        rows = self.get_all(table, db)
+        start = max(page - 1, 0) * page_size
+        return rows[start : start + page_size], len(rows)
+
+    def invalidate(self, table: Optional[str] = None):
+        """Drop one table (or all of them) so the next request reloads it"""
+        with self._lock:
+            if table is None:
+                self._tables.clear()
+            else:
+                self._tables.pop(table, None)
+
+
+class CountCache:
+    """Bounded LRU cache of the filtered counts used for the pagination.
+
+    The key is the normalized set of filters (see :meth:`key`) so every page
+    and sort order of a same filtered list share the entry.
+
+    :param maxsize: maximum number of counts kept
+    :param ttl: seconds before a count is considered stale, None for never
+    :param clock: monotonic clock, can be replaced for testing
+    """
+
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._counts: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+
+    @staticmethod
+    def key(table: str, **filters) -> Tuple:
+        """Normalized filters: unset (None or empty string) filters are
+        dropped and the others sorted by name"""
+        return (table,) + tuple(
+            sorted(
+                (name, value)
+                for name, value in filters.items()
+                if value is not None and value != ""
+            )
+        )
+
+    def get(self, key: Hashable) -> Optional[int]:
+        with self._lock:
+            entry = self._counts.get(key)
+            if entry is None:
+                return None
+            if self.ttl is not None and self._clock() - entry[0] >= self.ttl:
+                del self._counts[key]
+                return None
+            self._counts.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: Hashable, count: int):
+        with self._lock:
+            self._counts[key] = (self._clock(), count)
+            self._counts.move_to_end(key)
+            while len(self._counts) > self.maxsize:
+                self._counts.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self._counts.clear()
+
+
+def _ttl_from_env(variable: str) -> Optional[float]:
+    ttl = os.getenv(variable)
+    return float(ttl) if ttl else None
+
+
+reference_cache = ReferenceCache(ttl=_ttl_from_env("REFERENCE_CACHE_TTL"))
+count_cache = CountCache(ttl=_ttl_from_env("COUNT_CACHE_TTL"))
@@ -0,0 +1,188 @@
+import hashlib
+import logging
+import os
+import threading
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import parse_qsl
+
+import models
+import utils
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+
+# version of the data, part of every ETag. Unset, it's a digest of the content
+# of the tables computed once per process (see compute_version)
+DATASET_VERSION = os.getenv("DATASET_VERSION")
+
+
+class Policy(NamedTuple):
+    """Caching of the responses of a route"""
+
+    max_age: int
+    # the responses have presigned image URLs, which change with the window
+    # of utils.presigner
+    presigned_images: bool = False
+
+
+def compute_version(db: Session) -> str:
+    """Digest of every row of every table, so an edit changes it as much as
+    an insert or a delete"""
+    digest = hashlib.sha256()
+    for table in models.Base.metadata.sorted_tables:
+        if table.name == models.Document.__tablename__:
+            # not part of the dataset, and may not exist
+            continue
+        digest.update(table.name.encode("utf-8"))
+        order = list(table.primary_key.columns) or list(table.c)
+        for row in db.execute(select(table).order_by(*order)):
+            digest.update(repr(tuple(row)).encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+_version: Optional[str] = None
+_lock = threading.Lock()
+
+
+def get_version(get_db: Callable[[], Iterator[Session]]) -> str:
+    """DATASET_VERSION, or the version computed on first use with a session
+    of the get_db dependency"""
+    global _version
+    if DATASET_VERSION:
+        return DATASET_VERSION
+    if _version is None:
+        with _lock:
+            if _version is None:
+                sessions = get_db()
+                try:
+                    _version = compute_version(next(sessions))
+                finally:
+                    sessions.close()
+                logging.info(f"Dataset version {_version}")
+    return _version
+
+
+def invalidate():
+    """Forget the computed version, e.g. after the data changed"""
+    global _version
+    with _lock:
+        _version = None
+
+
+def normalize_query(query_string: bytes) -> List[Tuple[str, str]]:
+    """Parameters of a query string in a canonical order, so ?a=1&b=2 and
+    ?b=2&a=1 share their ETag"""
+    return sorted(parse_qsl(query_string.decode("latin-1"), keep_blank_values=True))
+
+
+def etag(version: str, path: str, query_string: bytes, window: Optional[int]) -> str:
+    """Strong ETag of the response of a GET: the same data, path, query and
+    presigner window always give the same bytes"""
+    key = repr((version, path, normalize_query(query_string), window))
+    return f'"{hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]}"'
+
+
+def matches(if_none_match: str, tag: str) -> bool:
+    """If-None-Match uses the weak comparison, "*" is left to the route (it
+    matches only if the resource exists)"""
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return any(candidate.removeprefix("W/") == tag for candidate in candidates)
+
+
+def route_path(scope) -> Optional[str]:
+    """Path of the route of a request, e.g. "/digimon/{id_or_name}", None
+    if no route matches (or outside of the application)"""
+    application = scope.get("app")
+    if application is None:
+        return None
+    for route in application.routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route.path
+    return None
+
+
+class CachingHeadersMiddleware:
+    """Add ETag and Cache-Control headers to the successful GET responses of
+    the routes with a policy, and answer a matching If-None-Match with a 304
+    before the route runs, so a revalidation never reaches the database.
+    If-None-Match: * is a 304 only once the route answered a 200, the
+    resource may not exist.
+
+    The ETag is not a digest of the body but of what the body depends on:
+    the dataset version, the path, the normalized query and, for presigned
+    image URLs, the presigner window. Those responses are then cached at
+    most until the window rolls over.
+
+    :param policies: route path (e.g. "/digimon/{id_or_name}") -> Policy
+    :param get_db: the session dependency, used (as overridden in the app) to
+    compute the dataset version
+    """
+
+    def __init__(
+        self,
+        app,
+        policies: Dict[str, Policy],
+        get_db: Callable[[], Iterator[Session]],
+    ):
+        self.app = app
+        self.policies = policies
+        self.get_db = get_db
+
+    def _policy(self, scope) -> Optional[Policy]:
+        path = route_path(scope)
+        return self.policies.get(path) if path is not None else None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            return await self.app(scope, receive, send)
+        policy = self._policy(scope)
+        if policy is None:
+            return await self.app(scope, receive, send)
+
+        version = DATASET_VERSION or _version
+        if not version:
+            get_db = scope["app"].dependency_overrides.get(self.get_db, self.get_db)
+            version = await run_in_threadpool(get_version, get_db)
+        max_age = policy.max_age
+        window = None
+        if policy.presigned_images and utils.IMAGE_HREF == "presigned":
+            window = utils.presigner.window_start()
+            max_age = min(max_age, utils.presigner.window_remaining())
+        tag = etag(version, scope["path"], scope["query_string"], window)
+        headers = [
+            (b"etag", tag.encode("latin-1")),
+            (b"cache-control", f"public, max-age={max_age}".encode("latin-1")),
+        ]
+
+        any_tag = False
+        for name, value in scope["headers"]:
+            if name != b"if-none-match":
+                continue
+            if value.strip() == b"*":
+                any_tag = True
+            elif matches(value.decode("latin-1"), tag):
+                await send(
+                    {"type": "http.response.start", "status": 304, "headers": headers}
+                )
+                await send({"type": "http.response.body", "body": b""})
+                return
+        not_modified = False
+
+        async def send_with_headers(message):
+            nonlocal not_modified
+            if message["type"] == "http.response.start" and message["status"] == 200:
+                if any_tag:
+                    not_modified = True
+                    message = {"type": "http.response.start", "status": 304}
+                    message["headers"] = headers
+                else:
+                    message["headers"] = list(message.get("headers", [])) + headers
+            elif message["type"] == "http.response.body" and not_modified:
+                if message.get("more_body", False):
+                    return
+                message = {"type": "http.response.body", "body": b""}
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -0,0 +1,368 @@
+import bisect
+import itertools
+import logging
+import os
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple, Union
+
+import bitmap
+import budget
+import models
+import search
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import NoResultFound
+
+# "sql" (default) queries Postgres for each request, "memory" serves /digimon
+# from the in-process catalog.
+DIGIMON_BACKEND = os.getenv("DIGIMON_BACKEND", "sql")
+
+
+class Named:
+    """A level, field, attribute or type"""
+
+    __slots__ = ("id", "name")
+
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class CatalogSkill:
+    __slots__ = ("id", "name", "description")
+
+    def __init__(self, id, name, description):
+        self.id = id
+        self.name = name
+        self.description = description
+
+
+class CatalogDescription:
+    __slots__ = ("origin", "language", "description")
+
+    def __init__(self, origin, language, description):
+        self.origin = origin
+        self.language = language
+        self.description = description
+
+
+class CatalogDigimon:
+    """Same attributes as models.Digimon, so the schemas can read it with
+    from_orm and app.py can use it in place of an ORM object."""
+
+    __slots__ = (
+        "id",
+        "name",
+        "xantibody",
+        "release_date",
+        "levels",
+        "fields",
+        "attributes",
+        "types",
+        "skills",
+        "descriptions",
+        "digivolved_from",
+        "digivolve_to",
+    )
+
+    def __init__(self, id, name, xantibody, release_date):
+        self.id = id
+        self.name = name
+        self.xantibody = xantibody
+        self.release_date = release_date
+        self.levels = ()
+        self.fields = ()
+        self.attributes = ()
+        self.types = ()
+        self.skills = ()
+        self.descriptions = ()
+        self.digivolved_from = ()
+        self.digivolve_to = ()
+
+
+class CatalogDigivolution:
+    __slots__ = ("digimon_prior", "digimon_next", "condition")
+
+    def __init__(self, digimon_prior, digimon_next, condition):
+        self.digimon_prior = digimon_prior
+        self.digimon_next = digimon_next
+        self.condition = condition
+
+
+# relation name on CatalogDigimon -> (bitmap index column, model)
+RELATIONS = {
+    "levels": ("level", models.Level),
+    "fields": ("field", models.Field),
+    "attributes": ("attribute", models.Attribute),
+    "types": ("type", models.Type),
+}
+
+
+class Catalog:
+    """Read-only, in-memory copy of the whole Digimon dataset.
+
+    It implements the same filters as crud.get_digimons, so the /digimon
+    routes can be served without any database round trip once loaded. The
+    categorical filters are answered by a bitmap.BitmapIndex, which gives the
+    digimon sorted by id, the order Postgres returns them in for the
+    sequential scans of crud.get_digimons.
+    """
+
+    def __init__(self):
+        self.ids = array("l")
+        self.digimons: Dict[int, CatalogDigimon] = {}
+        self.by_name: Dict[str, int] = {}
+        self.index = bitmap.BitmapIndex()
+        self.names = search.NgramIndex()
+        self.has_digivolve_to = set()
+        self.has_digivolved_from = set()
+        # sort order -> (ids in that order, their sort keys)
+        self.orders: Dict[str, Tuple[array, List[Tuple]]] = {}
+        self.load_time = 0.0
+
+    @classmethod
+    def load(cls, db: Session) -> "Catalog":
+        start = time.perf_counter()
+        catalog = cls()
+        rows = db.execute(
+            select(
+                models.SimpleDigimon.id,
+                models.SimpleDigimon.name,
+                models.SimpleDigimon.xantibody,
+                models.SimpleDigimon.release_date,
+            ).order_by(models.SimpleDigimon.id)
+        )
+        for id_, name, xantibody, release_date in rows:
+            catalog.digimons[id_] = CatalogDigimon(id_, name, xantibody, release_date)
+            catalog.by_name.setdefault(search.name_key(name), id_)
+            catalog.names.add(id_, name)
+        catalog.ids = array("l", catalog.digimons)
+        index_start = time.perf_counter()
+        for digimon in catalog.digimons.values():
+            catalog.index.add_digimon(digimon.id, digimon.xantibody)
+        index_time = time.perf_counter() - index_start
+
+        for relation, (column, model) in RELATIONS.items():
+            values = {
+                id_: Named(id_, name)
+                for id_, name in db.execute(select(model.id, model.name))
+            }
+            table, id_column = bitmap.ASSOCIATIONS[column]
+            rows = catalog._link(db, relation, table, id_column, values)
+            index_start = time.perf_counter()
+            catalog.index.add_rows(column, rows)
+            index_time += time.perf_counter() - index_start
+        skills = {
+            id_: CatalogSkill(id_, name, description)
+            for id_, name, description in db.execute(
+                select(models.Skill.id, models.Skill.name, models.Skill.description)
+            )
+        }
+        catalog._link(db, "skills", models.digimon_skill, "id_skill", skills)
+
+        descriptions: Dict[int, List[CatalogDescription]] = {}
+        for id_digimon, origin, language, description in db.execute(
+            select(
+                models.DigimonDescription.id_digimon,
+                models.DigimonDescription.origin,
+                models.DigimonDescription.language,
+                models.DigimonDescription.description,
+            ).order_by(models.DigimonDescription.id)
+        ):
+            descriptions.setdefault(id_digimon, []).append(
+                CatalogDescription(origin, language, description)
+            )
+        for id_digimon, values in descriptions.items():
+            if id_digimon in catalog.digimons:
+                catalog.digimons[id_digimon].descriptions = tuple(values)
+
+        catalog._load_digivolutions(db)
+        for sort in ("name", "release_date"):
+            keys = sorted(
+                (getattr(digimon, sort) or "", digimon.id)
+                for digimon in catalog.digimons.values()
+            )
+            catalog.orders[sort] = (array("l", (id_ for _, id_ in keys)), keys)
+        catalog.load_time = time.perf_counter() - start
+        catalog.index.build_time = index_time
+        catalog.index.log_stats()
+        logging.info(
+            f"Catalog loaded: {len(catalog.ids)} digimon in {catalog.load_time:.3f}s"
+        )
+        return catalog
+
+    def _link(
+        self, db: Session, relation: str, table, column: str, values: Dict
+    ) -> List[Tuple[int, int]]:
+        """Attach the values to the digimon, return the (id_digimon, id_value)
+        rows linked"""
+        per_digimon: Dict[int, List] = {}
+        linked_rows = []
+        rows = db.execute(
+            select(table.c.id_digimon, table.c[column]).order_by(
+                table.c.id_digimon, table.c[column]
+            )
+        )
+        for id_digimon, id_value in rows:
+            if id_digimon not in self.digimons or id_value not in values:
+                continue
+            per_digimon.setdefault(id_digimon, []).append(values[id_value])
+            linked_rows.append((id_digimon, id_value))
+        for id_digimon, linked in per_digimon.items():
+            setattr(self.digimons[id_digimon], relation, tuple(linked))
+        return linked_rows
+
+    def _load_digivolutions(self, db: Session):
+        digivolve_to: Dict[int, List[CatalogDigivolution]] = {}
+        digivolved_from: Dict[int, List[CatalogDigivolution]] = {}
+        rows = db.execute(
+            select(
+                models.Digivolution.id_digimon_prior,
+                models.Digivolution.id_digimon_next,
+                models.Digivolution.condition,
+            )
+        )
+        for id_prior, id_next, condition in rows:
+            # the digivolution ids are stored as strings
+            prior = self.digimons.get(int(id_prior))
+            next_ = self.digimons.get(int(id_next))
+            if prior is None or next_ is None:
+                continue
+            digivolution = CatalogDigivolution(prior, next_, condition)
+            digivolve_to.setdefault(prior.id, []).append(digivolution)
+            digivolved_from.setdefault(next_.id, []).append(digivolution)
+        for id_digimon, values in digivolve_to.items():
+            self.digimons[id_digimon].digivolve_to = tuple(values)
+        for id_digimon, values in digivolved_from.items():
+            self.digimons[id_digimon].digivolved_from = tuple(values)
+        self.has_digivolve_to = set(digivolve_to)
+        self.has_digivolved_from = set(digivolved_from)
+
+    def _filter(
+        self,
+        xantibody: Union[bool, None],
+        id_type: Union[int, None],
+        id_field: Union[int, None],
+        id_level: Union[int, None],
+        id_attribute: Union[int, None],
+        digivolved_from: Union[int, None],
+        digivolve_to: Union[int, None],
+    ) -> int:
+        """Bitmap of the digimon matching every filter but name_contains"""
+        matching = self.index.match(
+            type=id_type,
+            field=id_field,
+            level=id_level,
+            attribute=id_attribute,
+            xantibody=xantibody,
+        )
+        # Same semantic as the SQL filters of crud.get_digimons:
+        # digivolve_to.any(id_digimon_prior == X) only matches digimon X itself
+        # when it has at least one digivolution (and the other way around).
+        if digivolved_from is not None:
+            if digivolved_from in self.has_digivolve_to:
+                matching &= 1 << digivolved_from
+            else:
+                matching = 0
+        if digivolve_to is not None:
+            if digivolve_to in self.has_digivolved_from:
+                matching &= 1 << digivolve_to
+            else:
+                matching = 0
+        return matching
+
+    def get_digimons(
+        self,
+        page_size: int,
+        page: int,
+        xantibody: Union[bool, None] = None,
+        name_contains: Union[str, None] = None,
+        id_type: Union[int, None] = None,
+        id_field: Union[int, None] = None,
+        id_level: Union[int, None] = None,
+        id_attribute: Union[int, None] = None,
+        digivolved_from: Union[int, None] = None,
+        digivolve_to: Union[int, None] = None,
+        sort: str = "id",
+        after: Union[Tuple, None] = None,
+    ) -> Tuple[List[CatalogDigimon], int]:
+        """In memory version of crud.get_digimons: the page and the number of
+        digimon matching the filters. Text sort keys are compared by code
+        point, like the "C" collation: on a database with another collation
+        the name and release_date orders differ from the SQL ones (see
+        crud.DIGIMON_SORTS). name_contains is answered by a
+        search.NgramIndex."""
+        matching = self._filter(
+            xantibody,
+            id_type,
+            id_field,
+            id_level,
+            id_attribute,
+            digivolved_from,
+            digivolve_to,
+        )
+        if name_contains:
+            matching = self.names.match(name_contains, within=matching)
+        count = bitmap.count(matching)
+        start = 0 if after is not None else max(page - 1, 0) * page_size
+        digimons = self.digimons
+        if sort == "relevance":
+            if name_contains:
+                ids = self.names.rank(name_contains, bitmap.iter_ids(matching))
+                ids = ids[start : start + page_size]
+            else:
+                ids = bitmap.to_ids(matching, start, page_size)
+            return [digimons[id_] for id_ in ids], count
+        if sort == "id":
+            if after is not None:
+                matching = bitmap.greater_than(matching, after[0])
+            ids = bitmap.to_ids(matching, start, page_size)
+            return [digimons[id_] for id_ in ids], count
+        order, keys = self.orders[sort]
+        position = 0 if after is None else bisect.bisect_right(keys, tuple(after))
+        candidates = itertools.islice(order, position, None)
+        if matching != self.index.all:
+            members = set(bitmap.iter_ids(matching))
+            candidates = (id_ for id_ in candidates if id_ in members)
+        ids = itertools.islice(candidates, start, start + page_size)
+        return [digimons[id_] for id_ in ids], count
+
+    def get_digimon_by_id(self, digimon_id: int) -> CatalogDigimon:
+        try:
+            return self.digimons[digimon_id]
+        except KeyError:
+            raise NoResultFound(f"No digimon with id {digimon_id}")
+
+    def get_digimon_by_name(self, digimon_name: str) -> CatalogDigimon:
+        try:
+            return self.digimons[self.by_name[search.name_key(digimon_name)]]
+        except KeyError:
+            raise NoResultFound(f"No digimon named {digimon_name}")
+
+
+_catalog: Optional[Catalog] = None
+_lock = threading.Lock()
+
+
+def get_catalog(db: Session) -> Catalog:
+    """Return the process-wide catalog, loading it with db on first use"""
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                with budget.exempt():
+                    _catalog = Catalog.load(db)
+    return _catalog
+
+
+def invalidate():
+    """Drop the loaded catalog, the next request rebuilds it"""
+    global _catalog
+    with _lock:
+        _catalog = None
+
+
+def enabled() -> bool:
+    return DIGIMON_BACKEND == "memory"
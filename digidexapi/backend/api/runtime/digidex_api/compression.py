@@ -0,0 +1,200 @@
+import argparse
+import gzip
+import json
+import os
+import pathlib
+import re
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from starlette.datastructures import MutableHeaders
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# responses smaller than this are sent as is, compressing them saves nothing
+COMPRESSION_MINIMUM_SIZE = int(os.getenv("COMPRESSION_MINIMUM_SIZE", "500"))
+# number of compressed bodies kept, by ETag and encoding
+COMPRESSION_CACHE_SIZE = int(os.getenv("COMPRESSION_CACHE_SIZE", "256"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+COMPRESSIBLE_TYPES = ("application/json", "text/")
+
+
+def encodings() -> List[str]:
+    """Supported encodings, by order of preference"""
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def negotiate(accept_encoding: str) -> Optional[str]:
+    """Preferred supported encoding of an Accept-Encoding header: the highest
+    q-value, then br before gzip. None if the response is sent as is."""
+    supported = encodings()
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, parameters = item.partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        parameter, _, value = parameters.partition("=")
+        if parameter.strip().lower() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        qualities[name] = quality
+    best = None
+    for encoding in supported:
+        quality = qualities.get(encoding, qualities.get("*", 0.0))
+        if quality > 0 and (best is None or quality > best[0]):
+            best = (quality, encoding)
+    return best[1] if best is not None else None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    # no timestamp in the header, the same body always gives the same bytes
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def weak(etag: str) -> str:
+    return etag if etag.startswith("W/") else f"W/{etag}"
+
+
+class CompressionMiddleware:
+    """Compress the JSON responses with the encoding the client prefers.
+
+    A response with an ETag (see caching.CachingHeadersMiddleware) is
+    compressed once: the ETag is strong, so the compressed body is kept by
+    (ETag, encoding) in a bounded LRU and reused for the next requests. When
+    the client accepts an encoding, the ETag is sent weak (on the 304s too):
+    the compressed bytes are not the ones the strong ETag names.
+
+    :param minimum_size: bodies smaller than this are not compressed
+    :param cache_size: number of compressed bodies kept
+    """
+
+    def __init__(
+        self,
+        app,
+        minimum_size: int = 500,
+        cache_size: int = 256,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.cache_size = cache_size
+        self._bodies: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _compress(self, body: bytes, encoding: str, etag: Optional[str]) -> bytes:
+        if etag is None:
+            return compress(body, encoding)
+        key = (etag, encoding)
+        compressed = self._bodies.get(key)
+        if compressed is not None:
+            self._bodies.move_to_end(key)
+            self.hits += 1
+            return compressed
+        self.misses += 1
+        compressed = compress(body, encoding)
+        self._bodies[key] = compressed
+        while len(self._bodies) > self.cache_size:
+            self._bodies.popitem(last=False)
+        return compressed
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = negotiate(accept_encoding)
+        start = None
+        chunks = []
+
+        async def send_compressed(message):
+            nonlocal start
+            if message["type"] == "http.response.start":
+                start = message
+                return
+            if message["type"] != "http.response.body" or start is None:
+                return await send(message)
+            chunks.append(message.get("body", b""))
+            if message.get("more_body", False):
+                return
+            body = b"".join(chunks)
+            headers = MutableHeaders(raw=list(start.get("headers", [])))
+            etag = headers.get("etag")
+            if start["status"] == 304:
+                # the 304 has the ETag the 200 would have
+                if encoding is not None and etag is not None:
+                    headers["etag"] = weak(etag)
+            elif headers.get("content-type", "").startswith(COMPRESSIBLE_TYPES):
+                headers.add_vary_header("Accept-Encoding")
+                if encoding is not None and etag is not None:
+                    headers["etag"] = weak(etag)
+                if (
+                    encoding is not None
+                    and start["status"] == 200
+                    and "content-encoding" not in headers
+                    and len(body) >= self.minimum_size
+                ):
+                    body = self._compress(body, encoding, etag)
+                    headers["content-encoding"] = encoding
+                    headers["content-length"] = str(len(body))
+            await send({**start, "headers": headers.raw})
+            await send({"type": "http.response.body", "body": body})
+
+        await self.app(scope, receive, send_compressed)
+
+
+def route_of(url: str) -> str:
+    """/digimon/7 -> /digimon/{id}, /level?page=2 -> /level"""
+    return re.sub(r"/\d+", "/{id}", url.partition("?")[0])
+
+
+def benchmark(directory: pathlib.Path, repeat: int = 5) -> Dict[str, Dict]:
+    """CPU cost and bytes saved by each encoding, per route, over the
+    responses of a static export (see export.py).
+
+    :return: route -> responses, bytes and, per encoding, the compressed
+    bytes, the ratio and the compression time per response in microseconds
+    """
+    manifest = json.loads(directory.joinpath("manifest.json").read_text())
+    bodies: Dict[str, List[bytes]] = {}
+    for url, entry in manifest.items():
+        body = directory.joinpath(entry["file"]).read_bytes()
+        bodies.setdefault(route_of(url), []).append(body)
+
+    results = {}
+    for route, route_bodies in sorted(bodies.items()):
+        size = sum(map(len, route_bodies))
+        result = {"responses": len(route_bodies), "bytes": size}
+        for encoding in encodings():
+            start = time.process_time()
+            for _ in range(repeat):
+                compressed = sum(len(compress(b, encoding)) for b in route_bodies)
+            elapsed = (time.process_time() - start) / repeat
+            result[encoding] = {
+                "bytes": compressed,
+                "ratio": round(compressed / size, 3) if size else 1.0,
+                "us_per_response": round(elapsed / len(route_bodies) * 1e6, 1),
+            }
+        results[route] = result
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="CPU cost vs bytes saved of the compression, per route"
+    )
+    parser.add_argument("directory", type=pathlib.Path, help="a static export")
+    parser.add_argument("--repeat", type=int, default=5)
+    arguments = parser.parse_args()
+    print(json.dumps(benchmark(arguments.directory, arguments.repeat), indent=2))
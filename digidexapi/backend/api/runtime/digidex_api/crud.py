@@ -1,8 +1,96 @@
-from typing import Union
+from typing import List, Tuple, Union
 
+import cache
 import models
+import search
+from sqlalchemy import func
+from sqlalchemy import tuple_
 from sqlalchemy.orm import Session
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import selectinload
+from sqlalchemy.orm.exc import NoResultFound
+
+# Sort orders of the lists. The id is always the last sort key so the order
+# is total, which keyset pagination needs. Each order is backed by an index
+# (see models). Text keys follow the collation of the database, while the
+# memory catalog compares them by code point: both backends only give the
+# same name and release_date pages (and cursors) on a "C" collation.
+DIGIMON_SORTS = {
+    "id": (models.SimpleDigimon.id,),
+    "name": (func.coalesce(models.SimpleDigimon.name, ""), models.SimpleDigimon.id),
+    "release_date": (
+        func.coalesce(models.SimpleDigimon.release_date, ""),
+        models.SimpleDigimon.id,
+    ),
+}
+SKILL_SORTS = {
+    "id": (models.Skill.id,),
+    "name": (func.coalesce(models.Skill.name, ""), models.Skill.id),
+}
+
+
+def sort_keys(table: str, sorts, sort: str, name_contains, db: Session, rows: int):
+    """Sort keys of a sort order. "relevance" ranks the names matching
+    name_contains by similarity (offset pagination only, the first rows of
+    them), without a search it is the id order."""
+    if sort != "relevance":
+        return sorts[sort]
+    id_key = sorts["id"]
+    if not name_contains:
+        return id_key
+    return (search.relevance(table, name_contains, db, rows),) + id_key
+
+
+def paginate(query, sort_keys, page_size: int, page: int, after: Union[Tuple, None]):
+    """Order the query by sort_keys and select a page of it.
+
+    Without after the page is selected with an offset. With after (the sort
+    key values of the last row of the previous page) only the rows sorted
+    after it are read, so the cost of a page does not depend on its depth.
+    """
+    query = query.order_by(*sort_keys)
+    if after is not None:
+        return query.filter(tuple_(*sort_keys) > tuple_(*after)).limit(page_size)
+    return query.limit(page_size).offset((page - 1) * page_size)
+
+
+def paginate_with_count(
+    query,
+    sort_keys,
+    page_size: int,
+    page: int,
+    after: Union[Tuple, None],
+    count_key: Tuple,
+):
+    """Page of the query and the number of rows matching the query.
+
+    The count comes from cache.count_cache, or else from a count(*) window
+    function evaluated by the page query itself, so it costs no extra round
+    trip. Only a page past the end (or a keyset page) needs a count query.
+    """
+    count = cache.count_cache.get(count_key)
+    if count is not None:
+        return paginate(query, sort_keys, page_size, page, after).all(), count
+    if after is None:
+        counted = query.add_columns(func.count().over())
+        rows = paginate(counted, sort_keys, page_size, page, after).all()
+        page_rows = [row[0] for row in rows]
+        if rows:
+            count = rows[0][1]
+        elif page <= 1:
+            count = 0
+    else:
+        page_rows = paginate(query, sort_keys, page_size, page, after).all()
+    if count is None:
+        count = query.order_by(None).count()
+    cache.count_cache.set(count_key, count)
+    return page_rows, count
+
+
+def sort_key(row, sort: str) -> Tuple:
+    """Values of the sort keys of a row, i.e. the keyset cursor of the row"""
+    if sort == "id":
+        return (row.id,)
+    return (getattr(row, sort) or "", row.id)
 
 
 def get_digimons(
@@ -17,6 +105,8 @@ def get_digimons(
     digivolved_from: Union[int, None],
     digivolve_to: Union[int, None],
     db: Session,
+    sort: str = "id",
+    after: Union[Tuple, None] = None,
 ):
     query = db.query(models.SimpleDigimon)
     if xantibody is not None:
@@ -36,7 +126,7 @@ def get_digimons(
             models.Digimon.attributes.any(models.Attribute.id.__eq__(id_attribute))
         )
     if name_contains:
-        query = query.filter(models.Digimon.name.like(f"%{name_contains}%"))
+        query = query.filter(search.name_filter("digimon", name_contains, db))
 
     if digivolved_from is not None:
         query = query.filter(
@@ -51,84 +141,97 @@ def get_digimons(
             )
         )
 
-    return query.limit(page_size).offset((page - 1) * page_size).all()
-
-
-def count_digimons(db: Session):
-    return db.query(models.SimpleDigimon).count()
+    count_key = cache.count_cache.key(
+        "digimon",
+        xantibody=xantibody,
+        name_contains=search.normalize(name_contains),
+        id_type=id_type,
+        id_field=id_field,
+        id_level=id_level,
+        id_attribute=id_attribute,
+        digivolved_from=digivolved_from,
+        digivolve_to=digivolve_to,
+    )
+    keys = sort_keys(
+        "digimon", DIGIMON_SORTS, sort, name_contains, db, page * page_size
+    )
+    return paginate_with_count(query, keys, page_size, page, after, count_key)
 
 
 def get_digimon_by_name(digimon_name: str, db: Session):
-    return (
-        db.query(models.Digimon)
-        .options(joinedload(models.Digimon.levels))
-        .options(joinedload(models.Digimon.fields))
-        .options(joinedload(models.Digimon.attributes))
-        .options(joinedload(models.Digimon.skills))
-        .options(joinedload(models.Digimon.types))
-        .options(joinedload(models.Digimon.descriptions))
-        .options(joinedload(models.Digimon.digivolved_from))
-        .options(joinedload(models.Digimon.digivolve_to))
-        .filter(models.Digimon.name.like(digimon_name))
-        .one()
-    )
+    """Digimon named digimon_name, compared with search.name_key. The name is
+    resolved to an id by search.name_index, unknown names raise NoResultFound
+    without querying the digimon."""
+    digimon_id = search.name_index.resolve(digimon_name, db)
+    if digimon_id is None:
+        raise NoResultFound(f"No digimon named {digimon_name}")
+    return get_digimon_by_id(digimon_id, db)
 
 
 def get_digimon_by_id(digimon_id: int, db: Session):
+    """Digimon with all its relations, see get_digimons_by_ids. Raise
+    NoResultFound for an unknown id."""
+    digimons = get_digimons_by_ids([digimon_id], db)
+    if not digimons:
+        raise NoResultFound(f"No digimon with id {digimon_id}")
+    return digimons[0]
+
+
+def get_digimons_by_ids(digimon_ids: List[int], db: Session):
+    """Digimon with all their relations, in a fixed number of queries whatever
+    the number of ids: one for the digimon and one per relation. Each row
+    read is a digimon or a related row, unlike joined loads of several
+    collections which multiply them. The result is in no particular order
+    and skips unknown ids."""
     return (
         db.query(models.Digimon)
-        .options(joinedload(models.Digimon.levels))
-        .options(joinedload(models.Digimon.fields))
-        .options(joinedload(models.Digimon.attributes))
-        .options(joinedload(models.Digimon.skills))
-        .options(joinedload(models.Digimon.types))
-        .options(joinedload(models.Digimon.descriptions))
-        .options(joinedload(models.Digimon.digivolved_from))
-        .options(joinedload(models.Digimon.digivolve_to))
-        .filter(models.Digimon.id.__eq__(digimon_id))
-        .one()
+        .options(selectinload(models.Digimon.levels))
+        .options(selectinload(models.Digimon.fields))
+        .options(selectinload(models.Digimon.attributes))
+        .options(selectinload(models.Digimon.skills))
+        .options(selectinload(models.Digimon.types))
+        .options(selectinload(models.Digimon.descriptions))
+        .options(
+            selectinload(models.Digimon.digivolved_from).joinedload(
+                models.Digivolution.digimon_prior
+            )
+        )
+        .options(
+            selectinload(models.Digimon.digivolve_to).joinedload(
+                models.Digivolution.digimon_next
+            )
+        )
+        .filter(models.Digimon.id.in_(digimon_ids))
+        .all()
     )
 
 
-def get_digivolution(db: Session, id_digimon):
+def get_digimon_name(digimon_id: int, db: Session):
     return (
-        db.query(models.Digimon)
-        .join(models.Digimon.digivolve_to)
-        .where(models.Digivolution.id_digimon_prior == id_digimon)
-        .all()
+        db.query(models.SimpleDigimon.name)
+        .filter(models.SimpleDigimon.id.__eq__(digimon_id))
+        .scalar()
     )
 
 
-def get_fields(page_size: int, page: int, db: Session):
-    query = db.query(models.Field)
-    return query.limit(page_size).offset((page - 1) * page_size).all(), query.count()
-
-
-def get_levels(page_size: int, page: int, db: Session):
-    query = db.query(models.Level)
-    return query.limit(page_size).offset((page - 1) * page_size).all(), query.count()
-
-
-def get_attributes(page_size: int, page: int, db: Session):
-    query = db.query(models.Attribute)
-    return query.limit(page_size).offset((page - 1) * page_size).all(), query.count()
-
-
-def get_types(page_size: int, page: int, db: Session):
-    query = db.query(models.Type)
-    return query.limit(page_size).offset((page - 1) * page_size).all(), query.count()
-
-
 def get_skills(
     page_size: int,
     page: int,
     description_contains: Union[str, None],
     name_contains: Union[str, None],
     db: Session,
+    sort: str = "id",
+    after: Union[Tuple, None] = None,
 ):
     query = db.query(models.Skill)
     if name_contains:
-        query = query.filter(models.Skill.name.like(f"%{name_contains}%"))
+        query = query.filter(search.name_filter("skill", name_contains, db))
     if description_contains:
         query = query.filter(models.Skill.description.like(f"%{description_contains}%"))
-    return query.limit(page_size).offset((page - 1) * page_size).all(), query.count()
+    count_key = cache.count_cache.key(
+        "skill",
+        name_contains=search.normalize(name_contains),
+        description_contains=description_contains,
+    )
+    keys = sort_keys("skill", SKILL_SORTS, sort, name_contains, db, page * page_size)
+    return paginate_with_count(query, keys, page_size, page, after, count_key)
@@ -1,10 +1,15 @@
+import logging
 import os
+import threading
+import time
+from typing import Callable, Dict, Optional
 
-import boto3
 import sqlalchemy
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import Session
 from sqlalchemy.orm import sessionmaker
 
 if not os.getenv("DB_USER"):
@@ -13,16 +18,109 @@ if not os.getenv("DB_USER"):
 db_user = os.getenv("DB_USER")
 db_url = os.getenv("DB_ENPOINT")
 db_password = os.getenv("DB_PASSWORD")
+# "1" logs every SQL statement
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+# connections kept open: a Lambda container serves one request at a time, so
+# one warm connection, the overflow is for uvicorn's thread pool
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "1"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "4"))
+# a connection older than this (seconds) is replaced when checked out
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+# "1" tests each connection when checked out, a frozen container may wake up
+# with a connection the server closed
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
 
-client = boto3.client("rds")
-auth_token = client.generate_db_auth_token(
-    DBHostname=db_url, Port=5432, DBUsername=db_user, Region="eu-west-3"
-)
-try:
+# pool of the async engine (see get_async_engine): a container serves many
+# requests at once on a single event loop
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", "10"))
+ASYNC_DB_MAX_OVERFLOW = int(os.getenv("ASYNC_DB_MAX_OVERFLOW", "10"))
+
+# an RDS IAM auth token is valid 15 minutes, it's renewed a bit before
+TOKEN_LIFETIME = 15 * 60
+TOKEN_REFRESH_MARGIN = 2 * 60
+
+
+class AuthToken:
+    """RDS IAM auth token of the database user, generated when a connection
+    is opened and reused until shortly before it expires.
+
+    The token is only checked when connecting, an open connection outlives
+    it, so a token is needed per physical connection, not per request.
+
+    :param generate: function returning a new token, defaults to the RDS
+    client's generate_db_auth_token
+    :param clock: monotonic clock, can be replaced for testing
+    """
+
+    def __init__(
+        self,
+        generate: Optional[Callable[[], str]] = None,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self._generate = generate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._token: Optional[str] = None
+        self._generated_at = 0.0
+        self.generated = 0
+
+    def _generate_with_rds(self) -> str:
+        import boto3  # imported on first use, see get_engine
+
+        client = boto3.client("rds")
+        self._generate = lambda: client.generate_db_auth_token(
+            DBHostname=db_url, Port=5432, DBUsername=db_user, Region="eu-west-3"
+        )
+        return self._generate()
+
+    def get(self) -> str:
+        with self._lock:
+            age = self._clock() - self._generated_at
+            if self._token is None or age >= TOKEN_LIFETIME - TOKEN_REFRESH_MARGIN:
+                generate = self._generate or self._generate_with_rds
+                self._token = generate()
+                self._generated_at = self._clock()
+                self.generated += 1
+            return self._token
+
+
+auth_token = AuthToken()
+# physical connections opened and closed, for pool_stats
+_connections = {"connects": 0, "closes": 0, "invalidations": 0}
+_engine = None
+_async_engine = None
+_lock = threading.Lock()
+
+
+def use_auth_token(engine, token: AuthToken):
+    """Put a valid token in the password of every new connection of engine,
+    and count the connections"""
+
+    @event.listens_for(engine, "do_connect")
+    def _set_password(dialect, conn_rec, cargs, cparams):
+        cparams["password"] = token.get()
+
+    @event.listens_for(engine, "connect")
+    def _count_connect(dbapi_connection, connection_record):
+        _connections["connects"] += 1
+        logging.info(f"Database connection opened {pool_stats()}")
+
+    @event.listens_for(engine, "close")
+    def _count_close(dbapi_connection, connection_record):
+        _connections["closes"] += 1
+
+    @event.listens_for(engine, "invalidate")
+    def _count_invalidate(dbapi_connection, connection_record, exception):
+        _connections["invalidations"] += 1
+
+
+def _create_engine():
+    # the engine (and boto3, see AuthToken) is only needed once a request
+    # reaches the database, importing this module (a cold start) does not
+    # pay for it
     SQLALCHEMY_DATABASE_URL = sqlalchemy.engine.url.URL.create(
         drivername="postgresql+psycopg2",
         username=db_user,
-        password=auth_token,
         host=db_url,
         port=5432,
         database="postgres",
@@ -30,11 +128,106 @@ try:
 
     engine = create_engine(
         SQLALCHEMY_DATABASE_URL,
-        echo=True,
+        echo=SQL_ECHO,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
         connect_args={"sslmode": "verify-full", "sslrootcert": "eu-west-3-bundle.pem"},
     )
-except Exception as e:
-    print("Database connection failed due to {}".format(e))
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    use_auth_token(engine, auth_token)
+    return engine
+
+
+def get_engine():
+    """The engine of the database, created on first use"""
+    global _engine
+    if _engine is None:
+        with _lock:
+            if _engine is None:
+                try:
+                    _engine = _create_engine()
+                except Exception as e:
+                    print("Database connection failed due to {}".format(e))
+                    raise
+    return _engine
+
+
+def _create_async_engine():
+    import ssl
+
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    SQLALCHEMY_DATABASE_URL = sqlalchemy.engine.url.URL.create(
+        drivername="postgresql+asyncpg",
+        username=db_user,
+        host=db_url,
+        port=5432,
+        database="postgres",
+    )
+
+    engine = create_async_engine(
+        SQLALCHEMY_DATABASE_URL,
+        echo=SQL_ECHO,
+        pool_size=ASYNC_DB_POOL_SIZE,
+        max_overflow=ASYNC_DB_MAX_OVERFLOW,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING,
+        # asyncpg's version of sslmode=verify-full
+        connect_args={"ssl": ssl.create_default_context(cafile="eu-west-3-bundle.pem")},
+    )
+    # the connections of an async engine are opened by its sync_engine
+    use_auth_token(engine.sync_engine, auth_token)
+    return engine
+
+
+def get_async_engine():
+    """The async engine of the database (asyncpg driver), created on first
+    use"""
+    global _async_engine
+    if _async_engine is None:
+        with _lock:
+            if _async_engine is None:
+                try:
+                    _async_engine = _create_async_engine()
+                except Exception as e:
+                    print("Database connection failed due to {}".format(e))
+                    raise
+    return _async_engine
+
+
+def async_session():
+    """A new AsyncSession of get_async_engine(). Its objects stay loaded
+    once it is closed, they are serialized after."""
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+    return AsyncSession(get_async_engine(), autoflush=False, expire_on_commit=False)
+
+
+def pool_stats() -> Dict[str, int]:
+    """Connections of the pool (once the engine exists), physical
+    connections opened, closed and invalidated, and tokens generated"""
+    stats = dict(_connections, tokens=auth_token.generated)
+    if _engine is not None:
+        pool = _engine.pool
+        stats.update(
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+        )
+    return stats
+
+
+class LazySession(Session):
+    """Session bound to get_engine() when no bind is given"""
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        if self.bind is None:
+            return get_engine()
+        return super().get_bind(mapper=mapper, clause=clause, **kwargs)
+
+
+SessionLocal = sessionmaker(class_=LazySession, autocommit=False, autoflush=False)
 
 Base = declarative_base()
@@ -0,0 +1,288 @@
+import argparse
+import json
+import logging
+import random
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import models
+from sqlalchemy import Column
+from sqlalchemy import Integer
+from sqlalchemy import MetaData
+from sqlalchemy import Table
+from sqlalchemy import create_engine
+from sqlalchemy import inspect
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+# A synthetic dataset of any size, with the shape of the real one: the
+# reference tables are small, each digimon has a level or two, a few fields,
+# types and skills, one or two descriptions, and digivolves to 0 to 4
+# digimon of the next stage, close to it (a family).
+
+LEVELS = [
+    "Baby",
+    "In-Training",
+    "Rookie",
+    "Champion",
+    "Ultimate",
+    "Mega",
+    "Ultra",
+    "Armor",
+    "Hybrid",
+]
+# digivolutions go from a stage to the next one, the stage of a digimon is
+# (id - 1) % STAGES and its first level is the level of its stage
+STAGES = 6
+ATTRIBUTES = ["Vaccine", "Data", "Virus", "Free", "Variable", "Unknown"]
+FIELDS = [
+    "Nature Spirits",
+    "Deep Savers",
+    "Nightmare Soldiers",
+    "Wind Guardians",
+    "Metal Empire",
+    "Unknown",
+    "Dark Area",
+    "Virus Busters",
+    "Dragon's Roar",
+    "Jungle Troopers",
+]
+# 40 syllables, 40 ** 4 names: enough for 2.5M digimon
+SYLLABLES = (
+    "a gu ga bu pi yo ko ro te ri ta ma nu me gi gre tal wa ru ka "
+    "ra pa mo ki ha ku dra cor zu vi dor sa ja on lu de sho ne ze bo"
+).split()
+NAME_SPACE = len(SYLLABLES) ** 4
+# a prime, id -> name is a bijection which spreads the close ids
+NAME_STEP = 1_299_709
+WORDS = (
+    "digital monster data evolves fights with fire claws wings metal body "
+    "ancient legend protects the world its attack called strong rookie form "
+    "virus vaccine partner tamer digivice crest light darkness"
+).split()
+# number of related rows of a digimon -> weight
+FAN_OUT = {
+    "levels": {1: 9, 2: 1},
+    "attributes": {1: 17, 2: 3},
+    "fields": {0: 2, 1: 5, 2: 2, 3: 1},
+    "types": {1: 8, 2: 2},
+    "skills": {1: 2, 2: 4, 3: 3, 4: 2, 5: 1, 6: 1},
+    "descriptions": {1: 3, 2: 2},
+    "digivolve_to": {0: 5, 1: 6, 2: 5, 3: 2, 4: 2},
+}
+# digivolutions go to a digimon of the next stage at most this many rows
+# apart, so the lineages are families rather than the whole dataset
+FAMILY_SPREAD = 30
+
+# size and seed of the dataset of the database, outside of the tables of
+# models: the API does not know about it
+GENERATED = Table(
+    "generated_dataset",
+    MetaData(),
+    Column("size", Integer, nullable=False),
+    Column("seed", Integer, nullable=False),
+)
+
+
+def digimon_name(digimon_id: int) -> str:
+    """Unique name of a digimon of the dataset, e.g. "Gabutamon\" """
+    number = digimon_id * NAME_STEP % NAME_SPACE
+    syllables = []
+    while True:
+        number, syllable = divmod(number, len(SYLLABLES))
+        syllables.append(SYLLABLES[syllable])
+        if not number:
+            break
+    return "".join(syllables).capitalize() + "mon"
+
+
+def reference_sizes(size: int) -> Dict[str, int]:
+    """Number of rows of the tables which grow with the number of digimon"""
+    return {"type": max(20, size // 10), "skill": max(10, size * 2)}
+
+
+def _count(rng: random.Random, relation: str) -> int:
+    weights = FAN_OUT[relation]
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)).capitalize() + "."
+
+
+def _stage_ids(stage: int, size: int) -> range:
+    return range(stage + 1, size + 1, STAGES)
+
+
+def _digimon_rows(
+    rng: random.Random, first: int, last: int, size: int, description_id: int
+) -> Tuple[Dict[str, List[Dict]], int]:
+    sizes = reference_sizes(size)
+    rows: Dict[str, List[Dict]] = {
+        table: []
+        for table in (
+            "digimon",
+            "digimon_level",
+            "digimon_attribute",
+            "digimon_field",
+            "digimon_type",
+            "digimon_skill",
+            "digimon_description",
+            "digivolution",
+        )
+    }
+    for digimon_id in range(first, last + 1):
+        stage = (digimon_id - 1) % STAGES
+        xantibody = rng.random() < 0.05
+        name = digimon_name(digimon_id)
+        rows["digimon"].append(
+            {
+                "id": digimon_id,
+                "name": f"{name} (X-Antibody)" if xantibody else name,
+                "xantibody": xantibody,
+                "release_date": str(1997 + rng.randrange(27)),
+            }
+        )
+        levels = {stage + 1} | {
+            rng.randint(1, len(LEVELS)) for _ in range(_count(rng, "levels") - 1)
+        }
+        for table, column, values in (
+            ("digimon_level", "id_level", levels),
+            (
+                "digimon_attribute",
+                "id_attribute",
+                rng.sample(range(1, len(ATTRIBUTES) + 1), _count(rng, "attributes")),
+            ),
+            (
+                "digimon_field",
+                "id_field",
+                rng.sample(range(1, len(FIELDS) + 1), _count(rng, "fields")),
+            ),
+            (
+                "digimon_type",
+                "id_type",
+                rng.sample(range(1, sizes["type"] + 1), _count(rng, "types")),
+            ),
+            (
+                "digimon_skill",
+                "id_skill",
+                rng.sample(range(1, sizes["skill"] + 1), _count(rng, "skills")),
+            ),
+        ):
+            rows[table].extend(
+                {"id_digimon": digimon_id, column: value} for value in sorted(values)
+            )
+        for language in ("en", "jp")[: _count(rng, "descriptions")]:
+            description_id += 1
+            rows["digimon_description"].append(
+                {
+                    "id": description_id,
+                    "id_digimon": digimon_id,
+                    "origin": "Digimon Reference Book",
+                    "language": language,
+                    "description": _text(rng, rng.randint(12, 40)),
+                }
+            )
+        if stage + 1 < STAGES:
+            candidates = _stage_ids(stage + 1, size)
+            position = (digimon_id - 1) // STAGES
+            window = candidates[
+                max(0, position - FAMILY_SPREAD) : position + FAMILY_SPREAD
+            ]
+            count = min(_count(rng, "digivolve_to"), len(window))
+            for next_id in sorted(rng.sample(window, count)):
+                rows["digivolution"].append(
+                    {
+                        "id_digimon_prior": digimon_id,
+                        "id_digimon_next": next_id,
+                        "condition": rng.choice(["Level up", "Level up", "Item"]),
+                    }
+                )
+    return rows, description_id
+
+
+def rows(size: int, seed: int = 0, batch_size: int = 10_000) -> Iterator[Tuple]:
+    """(table name, rows) of the dataset, the reference tables first, then
+    the digimon and their relations batch_size digimon at a time. The same
+    size and seed always give the same rows."""
+    rng = random.Random(seed)
+    sizes = reference_sizes(size)
+    for table, names in (
+        ("level", LEVELS),
+        ("attribute", ATTRIBUTES),
+        ("field", FIELDS),
+    ):
+        yield table, [{"id": id_, "name": name} for id_, name in enumerate(names, 1)]
+    yield "type", [
+        {"id": id_, "name": f"{rng.choice(SYLLABLES).capitalize()} {id_}"}
+        for id_ in range(1, sizes["type"] + 1)
+    ]
+    for first in range(1, sizes["skill"] + 1, batch_size):
+        last = min(first + batch_size - 1, sizes["skill"])
+        yield "skill", [
+            {
+                "id": id_,
+                "name": f"{digimon_name(id_ + size)} {rng.choice(WORDS)}",
+                "description": _text(rng, rng.randint(4, 12)),
+            }
+            for id_ in range(first, last + 1)
+        ]
+    description_id = 0
+    for first in range(1, size + 1, batch_size):
+        last = min(first + batch_size - 1, size)
+        batch, description_id = _digimon_rows(rng, first, last, size, description_id)
+        yield from batch.items()
+
+
+def generate(
+    engine: Engine, size: int = 1000, seed: int = 0, batch_size: int = 10_000
+) -> Dict[str, int]:
+    """Create the tables of models (dropping the existing ones) and fill them
+    with the dataset of rows(size, seed).
+
+    :return: table name -> number of rows
+    """
+    start = time.perf_counter()
+    tables = models.Base.metadata.tables
+    models.Base.metadata.drop_all(engine)
+    models.Base.metadata.create_all(engine)
+    GENERATED.drop(engine, checkfirst=True)
+    counts = {table: 0 for table in tables if table != models.Document.__tablename__}
+    with engine.begin() as connection:
+        for table, table_rows in rows(size, seed, batch_size):
+            if table_rows:
+                connection.execute(tables[table].insert(), table_rows)
+                counts[table] += len(table_rows)
+        # last, an interrupted generation leaves no record
+        GENERATED.create(connection)
+        connection.execute(GENERATED.insert(), {"size": size, "seed": seed})
+    logging.info(
+        f"{size} digimon ({sum(counts.values())} rows) generated in "
+        f"{time.perf_counter() - start:.3f}s"
+    )
+    return counts
+
+
+def generated(engine: Engine) -> Optional[Dict[str, int]]:
+    """Size and seed of the dataset generated in the database, None if there
+    is none"""
+    if not inspect(engine).has_table(GENERATED.name):
+        return None
+    with engine.connect() as connection:
+        row = connection.execute(select(GENERATED)).first()
+    return dict(row._mapping) if row is not None else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Fill a database with a synthetic dataset of digimon"
+    )
+    parser.add_argument("database_url", help="e.g. sqlite:///benchmark.db")
+    parser.add_argument("--size", type=int, default=1000, help="number of digimon")
+    parser.add_argument("--seed", type=int, default=0)
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    counts = generate(
+        create_engine(arguments.database_url), arguments.size, arguments.seed
+    )
+    print(json.dumps(counts, indent=2))
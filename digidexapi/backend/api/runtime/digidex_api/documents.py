@@ -0,0 +1,241 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import budget
+import cache
+import crud
+import models
+import schemas
+import serialization
+import utils
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import delete
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# "table" serves the digimon details and the reference pages from the
+# document table filled by materialize, "off" renders every response
+DOCUMENTS = os.getenv("DOCUMENTS", "off")
+# number of documents kept in memory by store
+DOCUMENT_CACHE_SIZE = int(os.getenv("DOCUMENT_CACHE_SIZE", "1024"))
+# page size of the materialized reference pages, the default of their routes
+REFERENCE_PAGE_SIZE = 5
+
+# image_href of a materialized detail, replaced by the URL when it is served
+IMAGE_HREF = "\x00image_href\x00"
+_IMAGE_HREF = json.dumps(IMAGE_HREF).encode("utf-8")
+
+
+def dumps(content) -> bytes:
+    """The body FastAPI's JSONResponse sends for content"""
+    return json.dumps(
+        jsonable_encoder(content),
+        ensure_ascii=False,
+        allow_nan=False,
+        indent=None,
+        separators=(",", ":"),
+    ).encode("utf-8")
+
+
+def digimon_detail(digimon, image_href: Optional[str] = None) -> schemas.DigimonSchema:
+    """Detail of a digimon loaded by crud or by the catalog"""
+    digivolutions = []
+    for digivolution in digimon.digivolve_to:
+        digivolutions.append(
+            schemas.Digivolution(
+                name=digivolution.digimon_next.name, condition=digivolution.condition
+            )
+        )
+    pre_digivolutions = []
+    for pre_digivolution in digimon.digivolved_from:
+        pre_digivolutions.append(
+            schemas.Digivolution(
+                name=pre_digivolution.digimon_prior.name,
+                condition=pre_digivolution.condition,
+            )
+        )
+
+    return schemas.DigimonSchema(
+        id=digimon.id,
+        name=digimon.name,
+        xantibody=digimon.xantibody,
+        release_date=digimon.release_date,
+        image_href=image_href,
+        descriptions=digimon.descriptions,
+        levels=digimon.levels,
+        fields=digimon.fields,
+        attributes=digimon.attributes,
+        types=digimon.types,
+        skills=digimon.skills,
+        digivolved_from=pre_digivolutions,
+        digivolve_to=digivolutions,
+    )
+
+
+def reference_page(
+    table: str, page_size: int, page: int, db: Session
+) -> Tuple[List, schemas.Pagination]:
+    """Rows and pagination of a page of a reference table (level, attribute,
+    field or type)"""
+    rows, count = cache.reference_cache.get_page(
+        table, page_size=page_size, page=page, db=db
+    )
+    return rows, utils.paginaton(f"/{table}?", count, page, page_size, len(rows))
+
+
+def digimon_path(digimon_id: int) -> str:
+    return f"/digimon/{digimon_id}"
+
+
+def reference_path(table: str, page_size: int, page: int) -> str:
+    return f"/{table}?page={page}&page_size={page_size}"
+
+
+def render_digimon(digimon) -> bytes:
+    """Detail of a digimon as JSON, with IMAGE_HREF as image_href"""
+    return dumps(digimon_detail(digimon, image_href=IMAGE_HREF))
+
+
+def splice_image_href(body: bytes, image_href: Optional[str]) -> bytes:
+    """Put the image URL of the digimon in a rendered detail"""
+    return body.replace(_IMAGE_HREF, json.dumps(image_href).encode("utf-8"), 1)
+
+
+def materialize(db: Session, batch_size: int = 500) -> int:
+    """Render the detail of every digimon and every page of the reference
+    tables (with REFERENCE_PAGE_SIZE) into the document table, replacing its
+    content. Returns the number of documents.
+
+    The digimon are loaded batch_size at a time, with a fixed number of
+    queries per batch (see crud.get_digimons_by_ids).
+    """
+    start = time.perf_counter()
+    models.Document.__table__.create(db.connection(), checkfirst=True)
+    db.execute(delete(models.Document))
+    ids = (
+        db.execute(select(models.SimpleDigimon.id).order_by(models.SimpleDigimon.id))
+        .scalars()
+        .all()
+    )
+    count = 0
+    for batch_start in range(0, len(ids), batch_size):
+        digimons = crud.get_digimons_by_ids(
+            ids[batch_start : batch_start + batch_size], db
+        )
+        db.execute(
+            insert(models.Document),
+            [
+                {
+                    "path": digimon_path(digimon.id),
+                    "body": render_digimon(digimon),
+                    "digimon_name": digimon.name,
+                }
+                for digimon in digimons
+            ],
+        )
+        count += len(digimons)
+        # the rendered digimon are not needed anymore
+        db.expunge_all()
+    for table in cache.REFERENCE_TABLES:
+        documents = []
+        number, total_page = 1, 1
+        while number <= total_page:
+            rows, pagination = reference_page(table, REFERENCE_PAGE_SIZE, number, db)
+            documents.append(
+                {
+                    "path": reference_path(table, REFERENCE_PAGE_SIZE, number),
+                    "body": serialization.page(
+                        serialization.reference, rows, pagination
+                    ),
+                    "digimon_name": None,
+                }
+            )
+            number, total_page = number + 1, pagination.total_page
+        db.execute(insert(models.Document), documents)
+        count += len(documents)
+    db.commit()
+    store.invalidate()
+    logging.info(
+        f"{count} documents materialized in {time.perf_counter() - start:.3f}s"
+    )
+    return count
+
+
+class DocumentStore:
+    """Documents of the document table, each read with one primary key query
+    then kept in a bounded LRU. A path without document is remembered too:
+    the documents only change with materialize, which invalidates the store.
+
+    :param maxsize: maximum number of documents kept
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._documents: "OrderedDict[str, Optional[Tuple[bytes, Optional[str]]]]" = (
+            OrderedDict()
+        )
+
+    def get(self, path: str, db: Session) -> Optional[Tuple[bytes, Optional[str]]]:
+        """(body, digimon_name) of the document of path, None if there is none"""
+        with self._lock:
+            if path in self._documents:
+                self._documents.move_to_end(path)
+                return self._documents[path]
+        with budget.exempt():
+            row = db.execute(
+                select(models.Document.body, models.Document.digimon_name).where(
+                    models.Document.path == path
+                )
+            ).first()
+        document = (bytes(row[0]), row[1]) if row is not None else None
+        with self._lock:
+            self._documents[path] = document
+            while len(self._documents) > self.maxsize:
+                self._documents.popitem(last=False)
+        return document
+
+    def invalidate(self):
+        with self._lock:
+            self._documents.clear()
+
+
+store = DocumentStore(DOCUMENT_CACHE_SIZE)
+
+
+def enabled() -> bool:
+    return DOCUMENTS == "table"
+
+
+def get_digimon(digimon_id: int, db: Session) -> Optional[bytes]:
+    """Materialized detail of a digimon with its image URL, None if there is
+    none"""
+    document = store.get(digimon_path(digimon_id), db)
+    if document is None:
+        return None
+    body, digimon_name = document
+    return splice_image_href(
+        body, utils.create_image_href(digimon_id, digimon_name, thumbnail=False)
+    )
+
+
+def get_reference_page(
+    table: str, page_size: int, page: int, db: Session
+) -> Optional[bytes]:
+    """Materialized page of a reference table, None if there is none"""
+    document = store.get(reference_path(table, page_size, page), db)
+    return document[0] if document is not None else None
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    with SessionLocal() as session:
+        materialize(session)
@@ -0,0 +1,173 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import pathlib
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, Tuple
+from urllib.parse import urlsplit
+
+import utils
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.orm import sessionmaker
+
+import app
+
+# the lists the export starts from, every other page is reached by following
+# the pagination links and the href of the digimon
+START_URLS = ["/digimon", "/skill", "/level", "/attribute", "/field", "/type"]
+MANIFEST = "manifest.json"
+
+
+def file_name(url: str) -> str:
+    """File of the response of url: the path, then the query string after an
+    @, e.g. /digimon/7 -> digimon/7.json and /digimon?page=2&page_size=10 ->
+    digimon@page=2&page_size=10.json"""
+    parts = urlsplit(url)
+    name = parts.path.strip("/")
+    if parts.query:
+        name += f"@{parts.query}"
+    return f"{name}.json"
+
+
+def links(body) -> Iterable[str]:
+    """URLs of the pages a response links to"""
+    pagination = body.get("pagination", {})
+    for link in (pagination.get("next_page"), pagination.get("previous_page")):
+        if link:
+            yield link
+    for row in body.get("content", ()):
+        href = row.get("href") if isinstance(row, dict) else None
+        if href:
+            yield f"/{href}"
+
+
+async def asgi_get(asgi_app, url: str) -> Tuple[int, bytes]:
+    """Status and body of a GET of url, straight through the ASGI app"""
+    parts = urlsplit(url)
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": parts.path,
+        "raw_path": parts.path.encode("utf-8"),
+        "query_string": parts.query.encode("utf-8"),
+        "root_path": "",
+        "headers": [(b"host", b"api.digidexapi.com")],
+        "client": None,
+        "server": None,
+    }
+    status = None
+    body = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            body.append(message.get("body", b""))
+
+    await asgi_app(scope, receive, send)
+    return status, b"".join(body)
+
+
+async def _crawl(asgi_app, write: Callable[[str, bytes], None]) -> int:
+    seen = set(START_URLS)
+    queue = deque(START_URLS)
+    while queue:
+        url = queue.popleft()
+        status, body = await asgi_get(asgi_app, url)
+        if status != 200:
+            raise RuntimeError(f"GET {url} answered {status}")
+        write(url, body)
+        for link in links(json.loads(body)):
+            if link not in seen:
+                seen.add(link)
+                queue.append(link)
+    return len(seen)
+
+
+def export(directory: pathlib.Path, session_factory: Callable[[], Session]) -> Dict:
+    """Write the response of every page of the lists and of every digimon
+    detail under directory, with a manifest of their URLs.
+
+    The files and the manifest only depend on the dataset, so two exports of
+    the same data are identical and can be diffed. The image links are the
+    stable digimon/{id}/image ones, presigned URLs would expire. The files
+    of a previous export that are not part of this one are removed.
+
+    :return: the manifest, URL -> file, size and sha256 of the response
+    """
+    start = time.perf_counter()
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory.joinpath(MANIFEST)
+    previous = {}
+    if manifest_path.exists():
+        previous = json.loads(manifest_path.read_text())
+    manifest = {}
+
+    def write(url: str, body: bytes):
+        name = file_name(url)
+        path = directory.joinpath(name)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(body)
+        manifest[url] = {
+            "file": name,
+            "size": len(body),
+            "sha256": hashlib.sha256(body).hexdigest(),
+        }
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    image_href = utils.IMAGE_HREF
+    overrides = dict(app.app.dependency_overrides)
+    utils.IMAGE_HREF = "redirect"
+    app.app.dependency_overrides[app.get_db] = get_db
+    try:
+        asyncio.run(_crawl(app.app, write))
+    finally:
+        app.app.dependency_overrides = overrides
+        utils.IMAGE_HREF = image_href
+
+    files = {entry["file"] for entry in manifest.values()}
+    for entry in previous.values():
+        if entry["file"] not in files:
+            directory.joinpath(entry["file"]).unlink(missing_ok=True)
+    manifest = dict(sorted(manifest.items()))
+    manifest_path.write_text(json.dumps(manifest, indent=2) + "\n")
+    logging.info(
+        f"{len(manifest)} responses exported to {directory} in "
+        f"{time.perf_counter() - start:.3f}s"
+    )
+    return manifest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Export the API as static JSON files, e.g. for a CDN"
+    )
+    parser.add_argument("directory", type=pathlib.Path)
+    parser.add_argument(
+        "--database-url",
+        help="e.g. sqlite:///digidex.db, defaults to the database of the API",
+    )
+    arguments = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    if arguments.database_url:
+        factory = sessionmaker(bind=create_engine(arguments.database_url))
+    else:
+        from database import SessionLocal as factory
+    export(arguments.directory, factory)
@@ -0,0 +1,231 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from collections import deque
+from typing import Dict, Hashable, List, Optional, Tuple
+
+import budget
+import models
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+DESCENDANTS = "descendants"
+ANCESTORS = "ancestors"
+
+
+_MISSING = object()
+
+
+class _Memo:
+    """Bounded LRU memo of the graph queries"""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._values: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable):
+        with self._lock:
+            value = self._values.get(key, _MISSING)
+            if value is not _MISSING:
+                self._values.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value):
+        with self._lock:
+            self._values[key] = value
+            self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+
+class DigivolutionGraph:
+    """In-memory adjacency lists of the digivolution table.
+
+    Edges go from the prior digimon to the next one. Lineages, paths and
+    trees are computed with breadth first searches and memoized, so repeated
+    queries cost a dictionary lookup and never reach the database.
+
+    :param memo_size: number of results kept per kind of query
+    """
+
+    def __init__(
+        self,
+        names: Dict[int, str],
+        edges: List[Tuple[int, int, str]],
+        memo_size: int = 4096,
+    ):
+        self.names = names
+        # direction -> digimon id -> [(neighbour id, condition)], sorted by id
+        self.adjacency: Dict[str, Dict[int, List[Tuple[int, str]]]] = {
+            DESCENDANTS: {},
+            ANCESTORS: {},
+        }
+        for id_prior, id_next, condition in edges:
+            self.adjacency[DESCENDANTS].setdefault(id_prior, []).append(
+                (id_next, condition)
+            )
+            self.adjacency[ANCESTORS].setdefault(id_next, []).append(
+                (id_prior, condition)
+            )
+        for adjacency in self.adjacency.values():
+            for neighbours in adjacency.values():
+                neighbours.sort()
+        self._lineages = _Memo(memo_size)
+        self._paths = _Memo(memo_size)
+        self._trees = _Memo(memo_size)
+
+    @classmethod
+    def load(cls, db: Session) -> "DigivolutionGraph":
+        start = time.perf_counter()
+        names = {
+            id_: name
+            for id_, name in db.execute(
+                select(models.SimpleDigimon.id, models.SimpleDigimon.name)
+            )
+        }
+        edges = []
+        for id_prior, id_next, condition in db.execute(
+            select(
+                models.Digivolution.id_digimon_prior,
+                models.Digivolution.id_digimon_next,
+                models.Digivolution.condition,
+            )
+        ):
+            # the digivolution ids are stored as strings
+            id_prior, id_next = int(id_prior), int(id_next)
+            if id_prior in names and id_next in names:
+                edges.append((id_prior, id_next, condition))
+        graph = cls(names, edges)
+        logging.info(
+            f"Digivolution graph loaded: {len(names)} digimon, {len(edges)} "
+            f"digivolutions in {time.perf_counter() - start:.3f}s"
+        )
+        return graph
+
+    def __contains__(self, digimon_id: int) -> bool:
+        return digimon_id in self.names
+
+    def _max_depth(self, max_depth: Optional[int]) -> Optional[int]:
+        """No path is longer than the number of digimon, so every larger
+        max_depth is the same query as None"""
+        if max_depth is not None and max_depth >= len(self.names):
+            return None
+        return max_depth
+
+    def lineage(
+        self, digimon_id: int, direction: str, max_depth: Optional[int] = None
+    ) -> List[Tuple[int, int]]:
+        """Every digimon reachable from digimon_id (itself excluded) in the
+        direction, as (id, depth) sorted by depth then id. depth is the
+        number of digivolutions on the shortest path."""
+        max_depth = self._max_depth(max_depth)
+        key = (digimon_id, direction, max_depth)
+        lineage = self._lineages.get(key)
+        if lineage is _MISSING:
+            adjacency = self.adjacency[direction]
+            depths = {digimon_id: 0}
+            queue = deque([digimon_id])
+            while queue:
+                current = queue.popleft()
+                depth = depths[current]
+                if max_depth is not None and depth >= max_depth:
+                    continue
+                for neighbour, _ in adjacency.get(current, ()):
+                    if neighbour not in depths:
+                        depths[neighbour] = depth + 1
+                        queue.append(neighbour)
+            del depths[digimon_id]
+            lineage = sorted(depths.items(), key=lambda item: (item[1], item[0]))
+            self._lineages.set(key, lineage)
+        return lineage
+
+    def shortest_path(
+        self, id_from: int, id_to: int
+    ) -> Optional[List[Tuple[int, Optional[str]]]]:
+        """Shortest chain of digivolutions from id_from to id_to, as
+        [(id, condition to reach it)], the first step having no condition.
+        None if id_to cannot be reached."""
+        key = (id_from, id_to)
+        path = self._paths.get(key)
+        if path is not _MISSING:
+            return path
+        adjacency = self.adjacency[DESCENDANTS]
+        previous: Dict[int, Tuple[Optional[int], Optional[str]]] = {
+            id_from: (None, None)
+        }
+        queue = deque([id_from])
+        while queue and id_to not in previous:
+            current = queue.popleft()
+            for neighbour, condition in adjacency.get(current, ()):
+                if neighbour not in previous:
+                    previous[neighbour] = (current, condition)
+                    queue.append(neighbour)
+        path = None
+        if id_to in previous:
+            path = []
+            current = id_to
+            while current is not None:
+                parent, condition = previous[current]
+                path.append((current, condition))
+                current = parent
+            path.reverse()
+        self._paths.set(key, path)
+        return path
+
+    def tree(
+        self, digimon_id: int, direction: str, max_depth: Optional[int] = None
+    ) -> Tuple[List[Tuple[int, int]], List[Tuple[int, int, str]]]:
+        """Evolution tree of digimon_id as a graph: the (id, depth) of every
+        digimon of the lineage, digimon_id included at depth 0, and the
+        (prior id, next id, condition) digivolutions between them.
+
+        Each digimon appears once, however many paths lead to it, so the
+        size of the tree is bounded by the size of the lineage and its
+        digivolutions, cycles included.
+        """
+        max_depth = self._max_depth(max_depth)
+        key = (digimon_id, direction, max_depth)
+        tree = self._trees.get(key)
+        if tree is not _MISSING:
+            return tree
+        nodes = [(digimon_id, 0)] + self.lineage(digimon_id, direction, max_depth)
+        adjacency = self.adjacency[direction]
+        edges = []
+        for id_, depth in nodes:
+            if max_depth is not None and depth >= max_depth:
+                continue
+            for neighbour, condition in adjacency.get(id_, ()):
+                if direction == DESCENDANTS:
+                    edges.append((id_, neighbour, condition))
+                else:
+                    edges.append((neighbour, id_, condition))
+        tree = (nodes, sorted(edges))
+        self._trees.set(key, tree)
+        return tree
+
+
+_graph: Optional[DigivolutionGraph] = None
+_lock = threading.Lock()
+
+
+def get_graph(db: Session) -> DigivolutionGraph:
+    """Return the process-wide graph, loading it with db on first use"""
+    global _graph
+    if _graph is None:
+        with _lock:
+            if _graph is None:
+                with budget.exempt():
+                    _graph = DigivolutionGraph.load(db)
+    return _graph
+
+
+def invalidate():
+    """Drop the loaded graph, the next request rebuilds it"""
+    global _graph
+    with _lock:
+        _graph = None
@@ -1,10 +1,15 @@
 from database import Base
+from sqlalchemy import DDL
 from sqlalchemy import Boolean
 from sqlalchemy import Column
 from sqlalchemy import ForeignKey
+from sqlalchemy import Index
 from sqlalchemy import Integer
+from sqlalchemy import LargeBinary
 from sqlalchemy import String
 from sqlalchemy import Table
+from sqlalchemy import event
+from sqlalchemy import func
 from sqlalchemy.orm import registry
 from sqlalchemy.orm import relationship
 
@@ -90,6 +95,12 @@ class Skill(Base):
     description = Column(String)
 
 
+# backs the sort order of crud.SKILL_SORTS
+Index(
+    "ix_skill_name_id", func.coalesce(Skill.__table__.c.name, ""), Skill.__table__.c.id
+)
+
+
 class DigimonDescription(Base):
     __tablename__ = "digimon_description"
 
@@ -110,6 +121,19 @@ class SimpleDigimon(Base):
     release_date = Column(String)
 
 
+# back the sort orders of crud.DIGIMON_SORTS
+Index(
+    "ix_digimon_name_id",
+    func.coalesce(SimpleDigimon.__table__.c.name, ""),
+    SimpleDigimon.__table__.c.id,
+)
+Index(
+    "ix_digimon_release_date_id",
+    func.coalesce(SimpleDigimon.__table__.c.release_date, ""),
+    SimpleDigimon.__table__.c.id,
+)
+
+
 class Digivolution(Base):
     __tablename__ = "digivolution"
 
@@ -120,14 +144,18 @@ class Digivolution(Base):
     condition = Column(String)
 
 
-class Digimon(SimpleDigimon):
-    __tablename__ = "digimon"
-    __table_args__ = {"extend_existing": True}
+class Document(Base):
+    """A response rendered once by documents.materialize, keyed by its path"""
 
-    id = Column(Integer, primary_key=True)
-    name = Column(String)
-    xantibody = Column(Boolean)
-    release_date = Column(String)
+    __tablename__ = "document"
+
+    path = Column(String, primary_key=True)
+    body = Column(LargeBinary)
+    # digimon of a detail document, to sign its image when it is served
+    digimon_name = Column(String)
+
+
+class Digimon(SimpleDigimon):
     levels = relationship("Level", secondary=digimon_level)
     skills = relationship("Skill", secondary=digimon_skill)
     attributes = relationship("Attribute", secondary=digimon_attribute)
@@ -136,11 +164,36 @@ class Digimon(SimpleDigimon):
     descriptions = relationship("DigimonDescription")
     digivolved_from = relationship(
         "Digivolution",
-        primaryjoin=(Digivolution.id_digimon_next == id),
+        primaryjoin=(Digivolution.id_digimon_next == SimpleDigimon.id),
         overlaps="digimon_next",
     )
     digivolve_to = relationship(
         "Digivolution",
-        primaryjoin=(Digivolution.id_digimon_prior == id),
+        primaryjoin=(Digivolution.id_digimon_prior == SimpleDigimon.id),
         overlaps="digimon_prior",
     )
+
+
+# Postgres only: the trigram indexes of the name searches (see search.py),
+# used with NAME_SEARCH=trigram once this DDL ran. digidex_search_key is the
+# SQL version of search.normalize, it has to be immutable to be indexed,
+# which unaccent is not.
+for statement in (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE OR REPLACE FUNCTION digidex_search_key(text) RETURNS text "
+    "LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT "
+    "AS $$ SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1)) $$",
+):
+    event.listen(
+        Base.metadata, "before_create", DDL(statement).execute_if(dialect="postgresql")
+    )
+for table in (SimpleDigimon.__table__, Skill.__table__):
+    event.listen(
+        table,
+        "after_create",
+        DDL(
+            f"CREATE INDEX IF NOT EXISTS ix_{table.name}_name_trgm ON {table.name} "
+            "USING gin (digidex_search_key(name) gin_trgm_ops)"
+        ).execute_if(dialect="postgresql"),
+    )
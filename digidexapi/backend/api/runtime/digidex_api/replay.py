@@ -0,0 +1,259 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import pathlib
+import sys
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional
+from urllib.parse import urlencode
+
+import caching
+import httpx
+
+import app
+
+# Replay recorded traffic against the API and gate on latency regressions.
+#
+# The traffic is a JSONL file, a request per line:
+#   {"path": "/digimon", "query": "page=2&page_size=10", "time": 12.5}
+# query is a query string or an object, time the second at which the
+# request was received (any origin, e.g. a unix time). The lines without a
+# path are skipped.
+
+# a latency is a regression when it is both this much slower (relative) and
+# this many milliseconds slower than the baseline, so a jitter of a fast
+# route is not one
+LATENCY_TOLERANCE = 0.2
+LATENCY_SLACK_MS = 2.0
+THROUGHPUT_TOLERANCE = 0.2
+ERROR_RATE_TOLERANCE = 0.01
+PERCENTILES = (50, 95, 99)
+
+
+class Request(NamedTuple):
+    path: str
+    query: str
+    # seconds since the first request of the traffic
+    time: float
+
+    @property
+    def url(self) -> str:
+        return f"{self.path}?{self.query}" if self.query else self.path
+
+
+def load(lines: Iterable[str]) -> List[Request]:
+    """Requests of a JSONL traffic file, by time"""
+    records = []
+    for line in lines:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if "path" not in record:
+            continue
+        query = record.get("query") or ""
+        if isinstance(query, dict):
+            query = urlencode(query, doseq=True)
+        records.append((float(record.get("time", 0)), record["path"], query))
+    if not records:
+        return []
+    start = min(time_ for time_, _, _ in records)
+    requests = [Request(path, query, time_ - start) for time_, path, query in records]
+    return sorted(requests, key=lambda request: request.time)
+
+
+def route_of(path: str) -> str:
+    """Route of app.py serving path, e.g. /digimon/7 -> /digimon/{id_or_name}"""
+    scope = {"type": "http", "method": "GET", "path": path, "app": app.app}
+    return caching.route_path(scope) or path
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples: List[tuple], duration: float) -> Dict:
+    """Latency percentiles (milliseconds), throughput (requests per second)
+    and error rate of (latency, status) samples, a status None being a
+    failed request"""
+    latencies = sorted(latency for latency, _ in samples)
+    errors = sum(1 for _, status in samples if status is None or status >= 500)
+    summary = {"requests": len(samples)}
+    for q in PERCENTILES:
+        summary[f"p{q}_ms"] = round(percentile(latencies, q) * 1000, 3)
+    summary["throughput"] = round(len(samples) / duration, 3) if duration else 0.0
+    summary["error_rate"] = round(errors / len(samples), 4)
+    summary["client_errors"] = sum(
+        1 for _, status in samples if status is not None and 400 <= status < 500
+    )
+    return summary
+
+
+async def replay(
+    requests: List[Request],
+    client: httpx.AsyncClient,
+    concurrency: int = 10,
+    rate: Optional[float] = None,
+    speed: Optional[float] = None,
+) -> Dict:
+    """Send the requests with at most concurrency of them in flight.
+
+    :param rate: requests per second, the requests are sent at a fixed rate
+    :param speed: the requests are sent at their recorded time divided by
+    speed (2 is twice as fast as recorded). Without rate nor speed, they are
+    sent as fast as the concurrency allows.
+    :return: per route (and "all") summary, see summarize
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    samples: Dict[str, List[tuple]] = {}
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    async def send(request: Request, at: Optional[float]):
+        if at is not None:
+            await asyncio.sleep(max(0.0, start + at - loop.time()))
+        async with semaphore:
+            sent = time.perf_counter()
+            try:
+                status = (await client.get(request.url)).status_code
+            except httpx.HTTPError as e:
+                logging.warning(f"GET {request.url} failed: {e}")
+                status = None
+            latency = time.perf_counter() - sent
+        samples.setdefault(route_of(request.path), []).append((latency, status))
+
+    def schedule(index: int, request: Request) -> Optional[float]:
+        if rate:
+            return index / rate
+        if speed:
+            return request.time / speed
+        return None
+
+    await asyncio.gather(
+        *(send(request, schedule(i, request)) for i, request in enumerate(requests))
+    )
+    duration = loop.time() - start
+    results = {
+        route: summarize(route_samples, duration)
+        for route, route_samples in sorted(samples.items())
+    }
+    if samples:
+        results["all"] = summarize(
+            [sample for route in samples.values() for sample in route], duration
+        )
+    return results
+
+
+def compare(results: Dict, baseline: Dict, throughput: bool = True) -> List[str]:
+    """Regressions of results against baseline (both from replay), a route
+    missing from either one is not compared.
+
+    :param throughput: compare the throughput of all the requests, only
+    meaningful when they are sent as fast as possible: a paced replay (rate
+    or speed) has the throughput of its pacing. The throughput of a route
+    depends on the mix of the traffic, it is never compared.
+    """
+    regressions = []
+    for route, expected in baseline.items():
+        actual = results.get(route)
+        if actual is None:
+            continue
+        for q in PERCENTILES:
+            key = f"p{q}_ms"
+            limit = max(
+                expected[key] * (1 + LATENCY_TOLERANCE),
+                expected[key] + LATENCY_SLACK_MS,
+            )
+            if actual[key] > limit:
+                regressions.append(
+                    f"{route}: {key} {actual[key]} > {expected[key]} (baseline)"
+                )
+        if (
+            throughput
+            and route == "all"
+            and actual["throughput"]
+            < expected["throughput"] * (1 - THROUGHPUT_TOLERANCE)
+        ):
+            regressions.append(
+                f"{route}: throughput {actual['throughput']} < "
+                f"{expected['throughput']} (baseline)"
+            )
+        if actual["error_rate"] > expected["error_rate"] + ERROR_RATE_TOLERANCE:
+            regressions.append(
+                f"{route}: error rate {actual['error_rate']} > "
+                f"{expected['error_rate']} (baseline)"
+            )
+    return regressions
+
+
+def client_of(url: Optional[str]) -> httpx.AsyncClient:
+    """Client of the API running at url, or of app.app in this process"""
+    if url:
+        return httpx.AsyncClient(base_url=url, timeout=30)
+    # an exception of the application is a 500, counted as an error
+    transport = httpx.ASGITransport(app=app.app, raise_app_exceptions=False)
+    return httpx.AsyncClient(transport=transport, base_url="http://digidex")
+
+
+async def run(requests: List[Request], url: Optional[str] = None, **options) -> Dict:
+    async with client_of(url) as client:
+        return await replay(requests, client, **options)
+
+
+def main(arguments: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Replay recorded traffic against the API, report the "
+        "latency percentiles, throughput and error rate per route"
+    )
+    parser.add_argument("traffic", type=pathlib.Path, help="JSONL of requests")
+    parser.add_argument(
+        "--url",
+        help="e.g. http://127.0.0.1:8000, defaults to the application in this "
+        "process (and its database)",
+    )
+    parser.add_argument("--concurrency", type=int, default=10)
+    pacing = parser.add_mutually_exclusive_group()
+    pacing.add_argument("--rate", type=float, help="requests per second")
+    pacing.add_argument(
+        "--speed", type=float, help="replay the recorded timing, this much faster"
+    )
+    parser.add_argument("--output", type=pathlib.Path, help="write the results")
+    parser.add_argument(
+        "--baseline", type=pathlib.Path, help="fail on a regression against it"
+    )
+    arguments = parser.parse_args(arguments)
+
+    with arguments.traffic.open() as lines:
+        requests = load(lines)
+    results = asyncio.run(
+        run(
+            requests,
+            arguments.url,
+            concurrency=arguments.concurrency,
+            rate=arguments.rate,
+            speed=arguments.speed,
+        )
+    )
+    text = json.dumps(results, indent=2) + "\n"
+    if arguments.output:
+        arguments.output.write_text(text)
+    else:
+        print(text, end="")
+    if arguments.baseline:
+        regressions = compare(
+            results,
+            json.loads(arguments.baseline.read_text()),
+            throughput=not (arguments.rate or arguments.speed),
+        )
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(main())
@@ -1,10 +1,29 @@
-from typing import List, Union
+from enum import Enum
+from typing import ClassVar, List, Optional, Union
 
 import utils
 from pydantic import BaseModel
 from pydantic import validator
 
 
+class DigimonSort(str, Enum):
+    id = "id"
+    name = "name"
+    release_date = "release_date"
+    relevance = "relevance"
+
+
+class SkillSort(str, Enum):
+    id = "id"
+    name = "name"
+    relevance = "relevance"
+
+
+class LineageDirection(str, Enum):
+    descendants = "descendants"
+    ancestors = "ancestors"
+
+
 class Pagination(BaseModel):
     next_page: str
     previous_page: str
@@ -19,6 +38,8 @@ class DigimonBase(BaseModel):
     release_date: str
     href: str = None
     image_href: str = None
+    # the lists link the thumbnails, the details (DigimonSchema) the images
+    thumbnail: ClassVar[bool] = True
 
     @validator("href", always=True)
     def create_href(cls, v, values, **kwargs):
@@ -26,7 +47,12 @@ class DigimonBase(BaseModel):
 
     @validator("image_href", always=True)
     def create_presign_rul(cls, v, values, **kwargs):
-        return utils.create_presigned_url(digimon_name=values["name"], thumbnail=True)
+        if v is not None:
+            # given, e.g. by documents.render_digimon
+            return v
+        return utils.create_image_href(
+            values["id"], values["name"], thumbnail=cls.thumbnail
+        )
 
     class Config:
         orm_mode = True
@@ -99,15 +125,55 @@ class DigimonSchema(DigimonBase):
     skills: List[SkillBase]
     digivolved_from: List[Digivolution]
     digivolve_to: List[Digivolution]
-
-    @validator("image_href", always=True)
-    def create_presign_url(cls, v, values, **kwargs):
-        return utils.create_presigned_url(digimon_name=values["name"], thumbnail=False)
+    thumbnail: ClassVar[bool] = False
 
     class Config:
         orm_mode = True
 
 
+class LineageNode(BaseModel):
+    id: int
+    name: str
+    depth: int
+    href: str = None
+
+    @validator("href", always=True)
+    def create_href(cls, v, values, **kwargs):
+        return f"digimon/{values['id']}"
+
+
+class Lineage(BaseModel):
+    id: int
+    name: str
+    direction: LineageDirection
+    content: List[LineageNode]
+
+
+class PathStep(BaseModel):
+    id: int
+    name: str
+    condition: Optional[str]
+
+
+class DigivolutionPath(BaseModel):
+    length: int
+    steps: List[PathStep]
+
+
+class EvolutionEdge(BaseModel):
+    digimon_prior: int
+    digimon_next: int
+    condition: Optional[str]
+
+
+class EvolutionTree(BaseModel):
+    id: int
+    name: str
+    direction: LineageDirection
+    nodes: List[LineageNode]
+    edges: List[EvolutionEdge]
+
+
 class Page(BaseModel):
     content: List[
         Union[DigimonBase, SkillBase, LevelBase, FieldBase, AttributeBase, BaseModel]
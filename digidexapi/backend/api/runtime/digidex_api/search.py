@@ -0,0 +1,342 @@
+import heapq
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import bitmap
+import budget
+import models
+from sqlalchemy import and_
+from sqlalchemy import bindparam
+from sqlalchemy import case
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+# "ngram" searches the names with the in process n-gram index. "trigram" uses
+# the pg_trgm GIN indexes on Postgres instead, once their DDL ran (see
+# models), and falls back to the n-gram index without it
+NAME_SEARCH = os.getenv("NAME_SEARCH", "ngram")
+# functions of the trigram DDL of models
+TRIGRAM_FUNCTIONS = ("digidex_search_key(text)", "similarity(text, text)")
+# number of unknown names remembered by name_index
+NAME_NEGATIVE_CACHE_SIZE = int(os.getenv("NAME_NEGATIVE_CACHE_SIZE", "4096"))
+
+# table -> (id column, name column) of the searchable names
+TABLES = {
+    "digimon": (models.SimpleDigimon.id, models.SimpleDigimon.name),
+    "skill": (models.Skill.id, models.Skill.name),
+}
+
+_WORD = re.compile(r"[^\W_]+")
+# the letters unaccent replaces which have no decomposition, casefolded
+_LETTERS = str.maketrans(
+    {"æ": "ae", "œ": "oe", "ø": "o", "đ": "d", "ð": "d", "ł": "l", "þ": "th", "ı": "i"}
+)
+
+
+def normalize(text: Optional[str]) -> str:
+    """Case and diacritic insensitive form of a text: "Étoile" -> "etoile",
+    "Straße" -> "strasse", "Æ" -> "ae", as lower(unaccent()) of Postgres."""
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return stripped.casefold().translate(_LETTERS)
+
+
+def name_key(name: Optional[str]) -> str:
+    """Key of a digimon name in NameIndex: normalized, with the underscores of
+    the S3 keys read as spaces and the spacing collapsed, so "agumon_(x-antibody)"
+    and "Agumon (X-Antibody)" are the same."""
+    return " ".join(normalize(name).replace("_", " ").split())
+
+
+def ngrams(text: str, n: int = 3) -> Set[str]:
+    """Every substring of length n of an (already normalized) text"""
+    return {text[i : i + n] for i in range(len(text) - n + 1)}
+
+
+def trigrams(text: str) -> Set[str]:
+    """Trigrams as computed by pg_trgm: each word is padded with two spaces
+    in front and one behind."""
+    grams = set()
+    for word in _WORD.findall(text):
+        grams |= ngrams(f"  {word} ")
+    return grams
+
+
+def similarity(query: str, text: str) -> float:
+    """pg_trgm similarity of two normalized texts, between 0 and 1"""
+    query_grams, text_grams = trigrams(query), trigrams(text)
+    union = len(query_grams | text_grams)
+    return len(query_grams & text_grams) / union if union else 0.0
+
+
+class NgramIndex:
+    """In-process inverted index of the n-grams of normalized names.
+
+    Each n-gram maps to the bitmap of the ids whose name contains it. A
+    substring query intersects the bitmaps of its n-grams, then checks the
+    few candidates left, instead of scanning every name.
+    """
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self.all = 0
+        self.texts: Dict[int, str] = {}
+        self.postings: Dict[str, int] = {}
+        self.build_time = 0.0
+
+    def add(self, id_: int, text: Optional[str]):
+        text = normalize(text)
+        self.all |= 1 << id_
+        self.texts[id_] = text
+        for gram in ngrams(text, self.n):
+            self.postings[gram] = self.postings.get(gram, 0) | (1 << id_)
+
+    def candidates(self, query: str) -> int:
+        """Bitmap of the ids that may contain the normalized query"""
+        if len(query) < self.n:
+            return self.all
+        postings = self.postings
+        return bitmap.intersection(
+            self.all, *(postings.get(gram, 0) for gram in ngrams(query, self.n))
+        )
+
+    def match(self, query: str, within: Optional[int] = None) -> int:
+        """Bitmap of the ids whose name contains the query, restricted to the
+        within bitmap if given"""
+        query = normalize(query)
+        candidates = self.candidates(query)
+        if within is not None:
+            candidates &= within
+        if not query:
+            return candidates
+        texts = self.texts
+        result = 0
+        for id_ in bitmap.iter_ids(candidates):
+            if query in texts[id_]:
+                result |= 1 << id_
+        return result
+
+    def rank(
+        self, query: str, ids: Iterable[int], limit: Optional[int] = None
+    ) -> List[int]:
+        """ids sorted by decreasing similarity of their name to the query,
+        then by id, only the first limit ones if given"""
+        query = normalize(query)
+        texts = self.texts
+
+        def key(id_):
+            return -similarity(query, texts[id_]), id_
+
+        if limit is not None:
+            return heapq.nsmallest(limit, ids, key=key)
+        return sorted(ids, key=key)
+
+    @classmethod
+    def build(cls, rows: Iterable[Tuple[int, Optional[str]]], n: int = 3):
+        start = time.perf_counter()
+        index = cls(n)
+        for id_, text in rows:
+            index.add(id_, text)
+        index.build_time = time.perf_counter() - start
+        return index
+
+
+class NameIndex:
+    """Hash index of the digimon ids by name_key, with a bounded negative cache.
+
+    The index is loaded with one query on first use. A name it does not know
+    costs one primary key range query, for the digimon added since, then
+    goes to the negative cache: until the index changes, asking again for it
+    is answered without reaching the database.
+
+    :param negative_size: maximum number of unknown names remembered
+    """
+
+    def __init__(self, negative_size: int = 4096):
+        self.negative_size = negative_size
+        self.ids: Dict[str, int] = {}
+        self.loaded = False
+        self.max_id: Optional[int] = None
+        self.misses: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _add_rows(self, rows: Iterable[Tuple[int, Optional[str]]]) -> int:
+        added = 0
+        for id_, name in rows:
+            # the lowest id wins when two names share a key
+            self.ids.setdefault(name_key(name), id_)
+            self.max_id = id_ if self.max_id is None else max(self.max_id, id_)
+            added += 1
+        return added
+
+    def _load_after(self, db: Session, after: Optional[int]) -> int:
+        id_column, name_column = TABLES["digimon"]
+        query = select(id_column, name_column).order_by(id_column)
+        if after is not None:
+            query = query.where(id_column > after)
+        return self._add_rows(db.execute(query))
+
+    def resolve(self, name: str, db: Session) -> Optional[int]:
+        """Id of the digimon named name (see name_key), None if there is none"""
+        key = name_key(name)
+        id_ = self.ids.get(key)
+        if id_ is not None:
+            return id_
+        with self._lock:
+            if not self.loaded:
+                with budget.exempt():
+                    self._load_after(db, None)
+                self.loaded = True
+                id_ = self.ids.get(key)
+                if id_ is not None:
+                    return id_
+            elif key in self.misses:
+                self.misses.move_to_end(key)
+                return None
+            elif self._load_after(db, self.max_id):
+                # new digimon, the names missed so far may exist now
+                self.misses.clear()
+            id_ = self.ids.get(key)
+            if id_ is None:
+                self.misses[key] = None
+                while len(self.misses) > self.negative_size:
+                    self.misses.popitem(last=False)
+            return id_
+
+    def invalidate(self):
+        with self._lock:
+            self.ids = {}
+            self.loaded = False
+            self.max_id = None
+            self.misses.clear()
+
+
+name_index = NameIndex(NAME_NEGATIVE_CACHE_SIZE)
+_indexes: Dict[str, NgramIndex] = {}
+# whether the database has the trigram DDL, checked on first use
+_trigram: Optional[bool] = None
+_lock = threading.Lock()
+
+
+def get_index(table: str, db: Session) -> NgramIndex:
+    """Return the process-wide n-gram index of a table, building it with db
+    on first use"""
+    index = _indexes.get(table)
+    if index is None:
+        with _lock:
+            index = _indexes.get(table)
+            if index is None:
+                with budget.exempt():
+                    index = NgramIndex.build(db.execute(select(*TABLES[table])))
+                logging.info(
+                    f"N-gram index of {table} built: {len(index.texts)} names, "
+                    f"{len(index.postings)} n-grams in {index.build_time:.3f}s"
+                )
+                _indexes[table] = index
+    return index
+
+
+def invalidate(table: Optional[str] = None):
+    """Drop one index (or all of them), the next search rebuilds it"""
+    global _trigram
+    with _lock:
+        if table is None:
+            _indexes.clear()
+            _trigram = None
+        else:
+            _indexes.pop(table, None)
+    if table in (None, "digimon"):
+        name_index.invalidate()
+
+
+def _literal(value):
+    # rendered inline rather than bound
+    return bindparam(None, value, literal_execute=True)
+
+
+def has_trigram(db: Session) -> bool:
+    """Whether the database has the functions of the trigram DDL"""
+    # literals, to_regprocedure takes a cstring before Postgres 16
+    found = [
+        func.to_regprocedure(_literal(name)).isnot(None) for name in TRIGRAM_FUNCTIONS
+    ]
+    return bool(db.scalar(select(and_(*found))))
+
+
+def uses_trigram(db: Session) -> bool:
+    """Whether the name searches use the pg_trgm indexes, see NAME_SEARCH"""
+    global _trigram
+    if NAME_SEARCH != "trigram" or db.get_bind().dialect.name != "postgresql":
+        return False
+    if _trigram is None:
+        with _lock:
+            if _trigram is None:
+                with budget.exempt():
+                    _trigram = has_trigram(db)
+                if not _trigram:
+                    logging.warning(
+                        "NAME_SEARCH is trigram but the database has no "
+                        "digidex_search_key or pg_trgm (see models), the names "
+                        "are searched with the n-gram index"
+                    )
+    return _trigram
+
+
+def search_key(column):
+    """SQL version of normalize, the expression of the pg_trgm indexes. The
+    queries go through it too, so both sides of a comparison are normalized
+    by the same function."""
+    return func.digidex_search_key(column)
+
+
+def escape_like(text: str) -> str:
+    """text as a literal of a LIKE pattern, escaped with a slash"""
+    return text.replace("/", "//").replace("%", "/%").replace("_", "/_")
+
+
+def name_filter(table: str, name_contains: str, db: Session):
+    """Where clause of a case and diacritic insensitive substring search"""
+    id_column, name_column = TABLES[table]
+    if uses_trigram(db):
+        pattern = search_key(escape_like(name_contains))
+        return search_key(name_column).like("%" + pattern + "%", escape="/")
+    index = get_index(table, db)
+    ids = bitmap.to_ids(index.match(name_contains))
+    # rendered inline, a broad search can match more ids than there can be
+    # bound parameters
+    return id_column.in_(bindparam("ids", ids, expanding=True, literal_execute=True))
+
+
+def relevance(table: str, name_contains: str, db: Session, limit: int):
+    """Sort key of the matches, the most similar names first. Only the first
+    limit matches (those of the page and the pages before it) are ranked,
+    the others come after them by id."""
+    id_column, name_column = TABLES[table]
+    if uses_trigram(db):
+        return func.similarity(
+            search_key(name_column), search_key(name_contains)
+        ).desc()
+    index = get_index(table, db)
+    ranked = index.rank(
+        name_contains, bitmap.iter_ids(index.match(name_contains)), limit
+    )
+    if not ranked:
+        # nothing matches, any order will do
+        return id_column
+    # rendered inline, a case of many ids would have as many bound parameters
+    return func.coalesce(
+        case(
+            {_literal(id_): _literal(rank) for rank, id_ in enumerate(ranked)},
+            value=id_column,
+        ),
+        _literal(len(ranked)),
+    )
@@ -0,0 +1,78 @@
+import json
+import os
+from operator import attrgetter
+from typing import Callable, Dict, Iterable
+
+import schemas
+import utils
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+# "fast" sends the pages built by the encoders below, "pydantic" validates
+# them through schemas.Page (same bytes, slower)
+SERIALIZATION = os.getenv("SERIALIZATION", "fast")
+
+
+class Encoder:
+    """Build the JSON-ready dict of a schema from any object with its fields
+    as attributes (ORM rows, catalog objects, schema instances).
+
+    The attributes are read with one precompiled attrgetter and nothing is
+    validated, the values are the database ones. The keys are in the order
+    of the schema fields, so the JSON is the one of the schema.
+
+    :param schema: pydantic model of the rows
+    :param computed: field -> function of the dict of the other fields, for
+    the fields computed by the schema validators
+    """
+
+    def __init__(self, schema, **computed: Callable[[Dict], object]):
+        self.fields = list(schema.__fields__)
+        self.computed = computed
+        read = [field for field in self.fields if field not in computed]
+        self._read = read
+        getter = attrgetter(*read)
+        # attrgetter of a single attribute does not return a tuple
+        self._get = getter if len(read) > 1 else lambda row: (getter(row),)
+
+    def __call__(self, row) -> Dict:
+        values = dict(zip(self._read, self._get(row)))
+        if not self.computed:
+            return values
+        for field, compute in self.computed.items():
+            values[field] = compute(values)
+        return {field: values[field] for field in self.fields}
+
+
+digimon = Encoder(
+    schemas.DigimonBase,
+    href=lambda values: f"digimon/{values['id']}",
+    image_href=lambda values: utils.create_image_href(
+        values["id"], values["name"], thumbnail=True
+    ),
+)
+skill = Encoder(schemas.SkillBase)
+reference = Encoder(schemas.LevelBase)
+
+
+def dumps(content) -> bytes:
+    """Same bytes as FastAPI's JSONResponse"""
+    if orjson is not None:
+        return orjson.dumps(content)
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+def page(encoder: Encoder, rows: Iterable, pagination: schemas.Pagination) -> bytes:
+    """JSON of a schemas.Page of rows"""
+    return dumps(
+        {"content": [encoder(row) for row in rows], "pagination": pagination.dict()}
+    )
+
+
+def enabled() -> bool:
+    return SERIALIZATION == "fast"
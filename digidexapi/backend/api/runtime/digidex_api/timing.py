@@ -0,0 +1,235 @@
+import functools
+import json
+import logging
+import os
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import caching
+import fastapi.routing
+import serialization
+import utils
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+from starlette.responses import JSONResponse
+
+# "on" adds a Server-Timing header to every response and logs the timing of
+# every request. "off" installs nothing, the requests are not slowed down.
+SERVER_TIMING = os.getenv("SERVER_TIMING", "off")
+
+# phases of the Server-Timing header, in this order, with what is counted
+PHASES = {
+    # wait for a pooled (or new) connection, before the first statement of
+    # a session transaction
+    "db-connect": "connections",
+    "sql": "statements",
+    # utils.presigner (presign_many, which presign calls), for a page of
+    # URLs or for one, signed or found in its cache
+    "presign": "calls",
+    # FastAPI's validation of a response_model, with the jsonable_encoder
+    "validate": "calls",
+    # JSON of a response: JSONResponse or the serialization encoders
+    "serialize": "calls",
+}
+
+
+class RequestTiming:
+    """Wall time of a request, by phase.
+
+    The time of a phase is the sum of its durations: the concurrent SQL
+    statements of an async request can add up to more than the request.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # phase -> [seconds, count]
+        self.phases: Dict[str, List] = {}
+
+    def add(self, phase: str, seconds: float):
+        total = self.phases.setdefault(phase, [0.0, 0])
+        total[0] += seconds
+        total[1] += 1
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.start
+
+    def header(self, total: float) -> str:
+        """Value of the Server-Timing header, durations in milliseconds"""
+        metrics = []
+        for phase, unit in PHASES.items():
+            if phase in self.phases:
+                seconds, count = self.phases[phase]
+                metrics.append(
+                    f'{phase};dur={seconds * 1000:.3f};desc="{count} {unit}"'
+                )
+        metrics.append(f"total;dur={total * 1000:.3f}")
+        return ", ".join(metrics)
+
+    def record(self, total: float) -> Dict:
+        """The timing as the structured log line"""
+        return {
+            "total_ms": round(total * 1000, 3),
+            "phases": {
+                phase: {"ms": round(seconds * 1000, 3), "count": count}
+                for phase, (seconds, count) in self.phases.items()
+            },
+        }
+
+
+# timing of the request being served, None outside of a timed request. The
+# thread pool and SQLAlchemy's greenlets copy the context, the timing object
+# is the request's one.
+current: ContextVar[Optional[RequestTiming]] = ContextVar("timing", default=None)
+
+
+def add(phase: str, seconds: float):
+    timing = current.get()
+    if timing is not None:
+        timing.add(phase, seconds)
+
+
+def timed(phase: str, function):
+    """function, adding the duration of its calls to phase"""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if current.get() is None:
+            return function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            add(phase, time.perf_counter() - start)
+
+    return wrapper
+
+
+def timed_async(phase: str, function):
+    @functools.wraps(function)
+    async def wrapper(*args, **kwargs):
+        if current.get() is None:
+            return await function(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return await function(*args, **kwargs)
+        finally:
+            add(phase, time.perf_counter() - start)
+
+    return wrapper
+
+
+def _before_execute(session_state):
+    # the session gets its connection (see _after_begin) before the first
+    # statement of a transaction runs
+    if current.get() is not None:
+        session_state.session.info["timing_execute"] = time.perf_counter()
+
+
+def _after_begin(session, transaction, connection):
+    start = session.info.pop("timing_execute", None)
+    if start is not None:
+        add("db-connect", time.perf_counter() - start)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, many):
+    if current.get() is not None:
+        conn.info.setdefault("timing_statements", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, many):
+    starts = conn.info.get("timing_statements")
+    if starts:
+        add("sql", time.perf_counter() - starts.pop())
+
+
+# event target, name, listener
+_LISTENERS = [
+    (Session, "do_orm_execute", _before_execute),
+    (Session, "after_begin", _after_begin),
+    (Engine, "before_cursor_execute", _before_cursor_execute),
+    (Engine, "after_cursor_execute", _after_cursor_execute),
+]
+# object, attribute, phase of the functions wrapped by install
+_WRAPPED = [
+    (utils.presigner, "presign_many", "presign"),
+    (JSONResponse, "render", "serialize"),
+    (serialization, "page", "serialize"),
+]
+
+
+def install():
+    """Listen to the events of every engine and session, and wrap the
+    presigner and the serializers"""
+    if is_installed():
+        return
+    for target, name, listener in _LISTENERS:
+        event.listen(target, name, listener)
+    for target, attribute, phase in _WRAPPED:
+        setattr(target, attribute, timed(phase, getattr(target, attribute)))
+    fastapi.routing.serialize_response = timed_async(
+        "validate", fastapi.routing.serialize_response
+    )
+
+
+def uninstall():
+    if not is_installed():
+        return
+    for target, name, listener in _LISTENERS:
+        event.remove(target, name, listener)
+    for target, attribute, _ in _WRAPPED:
+        wrapped = getattr(target, attribute).__wrapped__
+        if target is utils.presigner:
+            # the wrapper shadows the method
+            delattr(target, attribute)
+        else:
+            setattr(target, attribute, wrapped)
+    fastapi.routing.serialize_response = fastapi.routing.serialize_response.__wrapped__
+
+
+def is_installed() -> bool:
+    return event.contains(Engine, "before_cursor_execute", _before_cursor_execute)
+
+
+class ServerTimingMiddleware:
+    """Time the phases of every request (see install), send them in a
+    Server-Timing header and log them as a JSON line"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        timing = RequestTiming()
+        token = current.set(timing)
+        status = None
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(raw=list(message.get("headers", [])))
+                headers.append("Server-Timing", timing.header(timing.elapsed()))
+                message = {**message, "headers": headers.raw}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            current.reset(token)
+            record = {
+                "message": "request timing",
+                "method": scope["method"],
+                "path": scope["path"],
+                "route": caching.route_path(scope),
+                "status": status,
+                **timing.record(timing.elapsed()),
+            }
+            logging.info(json.dumps(record))
+
+
+def enabled() -> bool:
+    return SERVER_TIMING == "on"
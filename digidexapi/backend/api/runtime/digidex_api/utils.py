@@ -1,42 +1,312 @@
+import base64
+import hashlib
+import hmac
+import json
 import logging
 import os
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Tuple
+from urllib.parse import quote
+from urllib.parse import unquote
+from urllib.parse import urlsplit
 
-import boto3
 import schemas
-from botocore.exceptions import ClientError
 
 
-def create_presigned_url(digimon_name: str, thumbnail: bool, expiration=3600):
+def image_key(digimon_name: str, thumbnail: bool) -> str:
+    """S3 key of a digimon image, the file has the digimon's name"""
+    folder = "digimon-thumbnail" if thumbnail else "digimon-image"
+    return f"{folder}/{digimon_name.replace(' ', '_')}.png"
+
+
+def _hmac(key: bytes, message: str) -> bytes:
+    return hmac.new(key, message.encode("utf-8"), hashlib.sha256).digest()
+
+
+def _percent_encode(value) -> str:
+    # same as botocore.utils.percent_encode
+    return quote(str(value), safe="-_.~")
+
+
+class SigV4Presigner:
+    """Presign GET URLs for the objects of one S3 bucket.
+
+    botocore's generate_presigned_url builds a full request and derives the
+    SigV4 signing key for every URL. Here the endpoint is resolved once (from a
+    URL presigned by botocore), the signing key is derived once per day and
+    credential set, and a batch of keys is signed in one call. The URLs are
+    byte-identical to the ones botocore generates. If botocore does not sign
+    the bucket with SigV4, the URLs are generated by the client.
+
+    :param client: a boto3 S3 client, used to resolve the bucket endpoint
+    :param bucket: the bucket name
+    :param credentials: botocore credentials (e.g. of
+    boto3.session.Session().get_credentials()), the ones the client signs with
+    """
+
+    def __init__(self, client, bucket: str, credentials):
+        self.client = client
+        self.bucket = bucket
+        self._credentials = credentials
+        self._endpoint = None
+        self._signing_key = (None, None)
+
+    def _resolve_endpoint(self):
+        url = self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": "key"}, ExpiresIn=1
+        )
+        parts = urlsplit(url)
+        params = [pair.partition("=") for pair in parts.query.split("&")]
+        if not any(name == "X-Amz-Credential" for name, _, _ in params):
+            # the client does not use SigV4 for this bucket (legacy us-east-1)
+            self._endpoint = False
+            return self._endpoint
+        # operation params (if any) come before the X-Amz-* auth params
+        operation_params = [
+            (name, value) for name, _, value in params if not name.startswith("X-Amz")
+        ]
+        credential_scope = unquote(
+            next(value for name, _, value in params if name == "X-Amz-Credential")
+        )
+        region = credential_scope.split("/")[2]
+        path_prefix = parts.path[: -len("key")]
+        self._endpoint = (
+            parts.scheme,
+            parts.netloc,
+            path_prefix,
+            region,
+            operation_params,
+        )
+        return self._endpoint
+
+    def _get_credentials(self):
+        """Current values of the credentials, refreshed if they expire"""
+        return self._credentials.get_frozen_credentials()
+
+    def _get_signing_key(self, date: str, credentials, region: str) -> bytes:
+        cache_key = (date, credentials.access_key, credentials.secret_key, region)
+        if self._signing_key[0] != cache_key:
+            key = _hmac(f"AWS4{credentials.secret_key}".encode("utf-8"), date)
+            key = _hmac(key, region)
+            key = _hmac(key, "s3")
+            key = _hmac(key, "aws4_request")
+            self._signing_key = (cache_key, key)
+        return self._signing_key[1]
+
+    def presign_many(
+        self, keys: Iterable[str], expires_in: int, timestamp: float
+    ) -> List[str]:
+        """Presign a GET URL for every key.
+
+        :param keys: object keys
+        :param expires_in: lifetime in seconds of the URLs
+        :param timestamp: signing time (unix time)
+        """
+        endpoint = self._endpoint
+        if endpoint is None:
+            endpoint = self._resolve_endpoint()
+        if endpoint is False:
+            return [
+                self.client.generate_presigned_url(
+                    "get_object",
+                    Params={"Bucket": self.bucket, "Key": key},
+                    ExpiresIn=expires_in,
+                )
+                for key in keys
+            ]
+        scheme, host, path_prefix, region, operation_params = endpoint
+        credentials = self._get_credentials()
+
+        amz_date = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime(timestamp))
+        scope = f"{amz_date[:8]}/{region}/s3/aws4_request"
+        auth_params = [
+            ("X-Amz-Algorithm", "AWS4-HMAC-SHA256"),
+            ("X-Amz-Credential", f"{credentials.access_key}/{scope}"),
+            ("X-Amz-Date", amz_date),
+            ("X-Amz-Expires", expires_in),
+            ("X-Amz-SignedHeaders", "host"),
+        ]
+        if credentials.token is not None:
+            auth_params.append(("X-Amz-Security-Token", credentials.token))
+        query = [
+            (_percent_encode(name), _percent_encode(value))
+            for name, value in auth_params
+        ]
+        query_string = "&".join(
+            f"{name}={value}" for name, value in operation_params + query
+        )
+        canonical_query = "&".join(
+            f"{name}={value}" for name, value in sorted(operation_params + query)
+        )
+        signing_key = self._get_signing_key(amz_date[:8], credentials, region)
+
+        urls = []
+        for key in keys:
+            path = path_prefix + quote(key, safe="/~")
+            canonical_request = (
+                f"GET\n{path}\n{canonical_query}\nhost:{host}\n\nhost\n"
+                "UNSIGNED-PAYLOAD"
+            )
+            string_to_sign = (
+                f"AWS4-HMAC-SHA256\n{amz_date}\n{scope}\n"
+                f"{hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()}"
+            )
+            signature = hmac.new(
+                signing_key, string_to_sign.encode("utf-8"), hashlib.sha256
+            ).hexdigest()
+            urls.append(
+                f"{scheme}://{host}{path}?{query_string}&X-Amz-Signature={signature}"
+            )
+        return urls
+
+
+class Presigner:
+    """Presign the digimon image URLs with a single S3 client.
+
+    Generated URLs are cached by (object key, thumbnail) for a time window.
+    They are signed at the start of their window, so the same digimon gets the
+    same URL until the window rolls over, which keeps the responses
+    cacheable. Each URL stays valid `expiration` seconds after the end of its
+    window.
+
+    :param expiration: minimum lifetime in seconds of a returned URL
+    :param window: length in seconds of a cache window
+    :param clock: wall clock, can be replaced for testing
+    """
+
+    def __init__(
+        self,
+        expiration: int = 3600,
+        window: int = 900,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.expiration = expiration
+        self.window = window
+        self._clock = clock
+        self._client = None
+        self._credentials = None
+        self._signers: Dict[str, SigV4Presigner] = {}
+        self._lock = threading.Lock()
+        self._window_start = None
+        self._urls: Dict[Tuple[str, bool], str] = {}
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    # imported on first use, it's a large part of a cold start
+                    import boto3
+
+                    # the signer signs with the credentials of the client
+                    session = boto3.session.Session()
+                    self._credentials = session.get_credentials()
+                    self._client = session.client("s3")
+        return self._client
+
+    @property
+    def credentials(self):
+        """Credentials of the client, resolved once"""
+        self.client  # resolved with the client
+        return self._credentials
+
+    def _signer(self) -> SigV4Presigner:
+        bucket = os.getenv("S3_IMAGE_BUCKET")
+        signer = self._signers.get(bucket)
+        if signer is None:
+            signer = SigV4Presigner(self.client, bucket, self.credentials)
+            self._signers[bucket] = signer
+        return signer
+
+    def _current_window(self) -> int:
+        now = self._clock()
+        window_start = int(now // self.window * self.window)
+        if window_start != self._window_start:
+            # new window, every cached URL has to be regenerated
+            self._urls = {}
+            self._window_start = window_start
+        return window_start
+
+    def presign_many(self, keys: Iterable[str], thumbnail: bool) -> List[str]:
+        """Presigned URLs of the keys, the missing ones are signed in one batch"""
+        window_start = self._current_window()
+        urls = self._urls
+        keys = list(keys)
+        missing = [key for key in dict.fromkeys(keys) if (key, thumbnail) not in urls]
+        if missing:
+            signed = self._signer().presign_many(
+                missing,
+                expires_in=self.window + self.expiration,
+                timestamp=window_start,
+            )
+            for key, url in zip(missing, signed):
+                urls[(key, thumbnail)] = url
+        return [urls[(key, thumbnail)] for key in keys]
+
+    def presign(self, key: str, thumbnail: bool) -> str:
+        return self.presign_many([key], thumbnail)[0]
+
+    def window_start(self) -> int:
+        """Start (unix time) of the current window, the URLs signed since"""
+        return self._current_window()
+
+    def window_remaining(self) -> int:
+        """Seconds before the current window rolls over (and URLs change)"""
+        return self._current_window() + self.window - int(self._clock())
+
+    def clear(self):
+        self._urls = {}
+
+
+presigner = Presigner(
+    expiration=int(os.getenv("PRESIGNED_URL_EXPIRATION", "3600")),
+    window=int(os.getenv("PRESIGNED_URL_WINDOW", "900")),
+)
+
+
+# "presigned" (default) puts presigned S3 URLs in image_href, "redirect" puts
+# the stable digimon/{id}/image and digimon/{id}/thumbnail links instead.
+IMAGE_HREF = os.getenv("IMAGE_HREF", "presigned")
+
+
+def create_presigned_url(digimon_name: str, thumbnail: bool):
     """Generate a presigned URL to share an S3 object
 
     :param digimon_name: a digimon name. It's image file's name has
     the same name.
     :type digimon_name: str
-    :param expiration: Time in seconds for the presigned URL to remain valid
     :return: Presigned URL as string. If error, returns None.
     """
-
-    # Generate a presigned URL for the S3 object
-    s3_client = boto3.client("s3")
-    if thumbnail:
-        object_name = f"digimon-thumbnail/{digimon_name.replace(' ', '_')}.png"
-    else:
-        object_name = f"digimon-image/{digimon_name.replace(' ', '_')}.png"
+    from botocore.exceptions import ClientError
 
     try:
-        bucket = os.getenv("S3_IMAGE_BUCKET")
-
-        response = s3_client.generate_presigned_url(
-            "get_object",
-            Params={"Bucket": bucket, "Key": object_name},
-            ExpiresIn=expiration,
-        )
+        return presigner.presign(image_key(digimon_name, thumbnail), thumbnail)
     except ClientError as e:
         logging.error(e)
         return None
 
-    # The response contains the presigned URL
-    return response
+
+def create_image_href(digimon_id: int, digimon_name: str, thumbnail: bool):
+    """image_href of a digimon, according to IMAGE_HREF"""
+    if IMAGE_HREF == "redirect":
+        return f"digimon/{digimon_id}/{'thumbnail' if thumbnail else 'image'}"
+    return create_presigned_url(digimon_name=digimon_name, thumbnail=thumbnail)
+
+
+def presign_images(digimon_names: Iterable[str], thumbnail: bool):
+    """Sign the images of a whole page at once, the schemas' validators then
+    find every URL in the presigner cache"""
+    if IMAGE_HREF == "redirect":
+        return
+    from botocore.exceptions import ClientError
+
+    try:
+        presigner.presign_many(
+            (image_key(name, thumbnail) for name in digimon_names), thumbnail
+        )
+    except ClientError as e:
+        logging.error(e)
 
 
 def create_page_url_digimon(path, page_size, page, page_size_actual, **kwarg):
@@ -64,14 +334,65 @@ def create_page_url_other(path, page_size, page, page_elements):
     return f"{path}{'&'.join(url_element)}"
 
 
-def paginaton(path, count_levels, page, page_size, page_elements, **kwargs):
-    next_page = create_page_url_digimon(
-        path, page_size, page + 1, page_elements, **kwargs
-    )
-    previous_page = create_page_url_digimon(
-        path, page_size, page - 1, page_elements, **kwargs
-    )
-    total_page = count_levels // page_size + 1
+def encode_cursor(sort: str, key: Tuple) -> str:
+    """Opaque keyset cursor: the sort order and the sort key of the last row"""
+    data = json.dumps([sort, *key], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str) -> Tuple:
+    """Sort key encoded by encode_cursor, raises ValueError if the cursor is
+    invalid or was made for another sort order"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_sort, *key = json.loads(data)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor {cursor}") from e
+    if cursor_sort != sort or len(key) != (1 if sort == "id" else 2):
+        raise ValueError(f"Cursor {cursor} is not for sort={sort}")
+    *text_key, id_ = key
+    # bool is an int too
+    if (
+        not isinstance(id_, int)
+        or isinstance(id_, bool)
+        or not all(isinstance(value, str) for value in text_key)
+    ):
+        raise ValueError(f"Invalid cursor {cursor}")
+    return tuple(key)
+
+
+def create_page_url_cursor(path, page_size, after, page_size_actual, **kwarg):
+    if after is None or page_size_actual < page_size:
+        return ""
+    url_element = [f"after={after}", f"page_size={page_size}"]
+    for key, value in kwarg.items():
+        if value is not None:
+            url_element.append(f"{key}={value}")
+
+    return f"{path}{'&'.join(url_element)}"
+
+
+def paginaton(
+    path, count_levels, page, page_size, page_elements, next_after=None, **kwargs
+):
+    """Pagination links of a page.
+
+    :param next_after: in keyset mode, the cursor of the last row of the page.
+    The next page link then uses after= and there is no previous page link.
+    """
+    if next_after is not None:
+        next_page = create_page_url_cursor(
+            path, page_size, next_after, page_elements, **kwargs
+        )
+        previous_page = ""
+    else:
+        next_page = create_page_url_digimon(
+            path, page_size, page + 1, page_elements, **kwargs
+        )
+        previous_page = create_page_url_digimon(
+            path, page_size, page - 1, page_elements, **kwargs
+        )
+    total_page = max(-(-count_levels // page_size), 1)
     pagination = schemas.Pagination(
         next_page=next_page,
         previous_page=previous_page,
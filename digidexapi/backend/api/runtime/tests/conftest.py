@@ -0,0 +1,237 @@
+import os
+import pathlib
+import sys
+
+import pytest
+
+# The lambda code uses flat imports (``import crud``), so the package directory
+# has to be on the path, and database.py needs a (fake) environment to import.
+sys.path.insert(
+    0, str(pathlib.Path(__file__).parent.parent.joinpath("digidex_api").resolve())
+)
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "AKIDEXAMPLE")
+os.environ.setdefault(
+    "AWS_SECRET_ACCESS_KEY", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY"
+)
+os.environ.setdefault("AWS_DEFAULT_REGION", "eu-west-3")
+os.environ.setdefault("DB_USER", "digidex")
+os.environ.setdefault("DB_ENPOINT", "localhost")
+os.environ.setdefault("S3_IMAGE_BUCKET", "digidex-images")
+os.environ.setdefault("DATASET_VERSION", "test")
+
+import budget  # noqa: E402
+import cache  # noqa: E402
+import catalog  # noqa: E402
+import documents  # noqa: E402
+import graph  # noqa: E402
+import models  # noqa: E402
+import search  # noqa: E402
+from database import Base  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+import app  # noqa: E402
+
+LEVELS = [(1, "Baby"), (2, "In-Training"), (3, "Rookie"), (4, "Champion")]
+ATTRIBUTES = [(1, "Vaccine"), (2, "Data"), (3, "Virus")]
+FIELDS = [(1, "Nature Spirits"), (2, "Metal Empire"), (3, "Wind Guardians")]
+TYPES = [(1, "Reptile"), (2, "Beast"), (3, "Machine"), (4, "Bird")]
+SKILLS = [
+    (1, "Pepper Breath", "Spits a fireball"),
+    (2, "Sharp Claws", "Slashes with claws"),
+    (3, "Blue Blaster", "Blue flames"),
+    (4, "Nova Blast", "A huge fireball"),
+]
+# id, name, xantibody, release_date
+DIGIMONS = [
+    (1, "Koromon", False, "1997"),
+    (2, "Agumon", False, "1997"),
+    (3, "Agumon (X-Antibody)", True, "2005"),
+    (4, "Greymon", False, "1997"),
+    (5, "Gabumon", False, "1997"),
+    (6, "Garurumon", False, "1997"),
+    (7, "MetalGreymon", True, "1998"),
+]
+DIGIMON_LEVELS = [(1, 2), (2, 3), (3, 3), (4, 4), (5, 3), (6, 4), (7, 4)]
+DIGIMON_ATTRIBUTES = [(1, 1), (2, 1), (3, 1), (4, 1), (5, 2), (6, 2), (7, 3)]
+DIGIMON_FIELDS = [(2, 1), (2, 3), (3, 1), (4, 1), (5, 1), (6, 1), (7, 2), (7, 3)]
+DIGIMON_TYPES = [(2, 1), (3, 1), (4, 1), (5, 2), (6, 2), (7, 3), (7, 1)]
+DIGIMON_SKILLS = [(2, 1), (2, 2), (3, 1), (4, 4), (5, 3), (7, 4), (7, 2)]
+# prior, next, condition
+DIGIVOLUTIONS = [
+    (1, 2, "Level up"),
+    (2, 4, "Level up"),
+    (3, 4, "Level up"),
+    (4, 7, "Dark Digivolution"),
+    (5, 6, "Level up"),
+]
+DESCRIPTIONS = [
+    (1, 2, "Digimon Reference Book", "en", "A small dinosaur Digimon."),
+    (2, 2, "Digimon Reference Book", "jp", "Chiisana kyouryuu."),
+    (3, 4, "Digimon Reference Book", "en", "A dinosaur Digimon."),
+]
+
+
+def seed(session):
+    for model, rows in (
+        (models.Level, LEVELS),
+        (models.Attribute, ATTRIBUTES),
+        (models.Field, FIELDS),
+        (models.Type, TYPES),
+    ):
+        session.add_all(model(id=id_, name=name) for id_, name in rows)
+    session.add_all(
+        models.Skill(id=id_, name=name, description=description)
+        for id_, name, description in SKILLS
+    )
+    session.add_all(
+        models.SimpleDigimon(
+            id=id_, name=name, xantibody=xantibody, release_date=release_date
+        )
+        for id_, name, xantibody, release_date in DIGIMONS
+    )
+    session.flush()
+    for table, column, rows in (
+        (models.digimon_level, "id_level", DIGIMON_LEVELS),
+        (models.digimon_attribute, "id_attribute", DIGIMON_ATTRIBUTES),
+        (models.digimon_field, "id_field", DIGIMON_FIELDS),
+        (models.digimon_type, "id_type", DIGIMON_TYPES),
+        (models.digimon_skill, "id_skill", DIGIMON_SKILLS),
+    ):
+        session.execute(
+            table.insert(),
+            [{"id_digimon": id_digimon, column: id_x} for id_digimon, id_x in rows],
+        )
+    session.add_all(
+        models.Digivolution(
+            id_digimon_prior=prior, id_digimon_next=next_, condition=condition
+        )
+        for prior, next_, condition in DIGIVOLUTIONS
+    )
+    session.add_all(
+        models.DigimonDescription(
+            id=id_,
+            id_digimon=id_digimon,
+            origin=origin,
+            language=language,
+            description=description,
+        )
+        for id_, id_digimon, origin, language, description in DESCRIPTIONS
+    )
+    session.commit()
+
+
+@pytest.fixture(scope="session")
+def engine():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+
+    # Postgres LIKE is case sensitive, make SQLite behave the same.
+    @event.listens_for(engine, "connect")
+    def _case_sensitive_like(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA case_sensitive_like = ON")
+
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    seed(session)
+    session.close()
+    return engine
+
+
+@pytest.fixture()
+def file_engine(tmp_path):
+    """Engine of a seeded SQLite file, for the tests which need several
+    connections (or drivers) on the same data"""
+    engine = create_engine(f"sqlite:///{tmp_path.joinpath('digidex.db')}")
+
+    @event.listens_for(engine, "connect")
+    def _case_sensitive_like(dbapi_connection, connection_record):
+        dbapi_connection.execute("PRAGMA case_sensitive_like = ON")
+
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    seed(session)
+    session.close()
+    yield engine
+    engine.dispose()
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    cache.reference_cache.invalidate()
+    cache.count_cache.invalidate()
+    catalog.invalidate()
+    documents.store.invalidate()
+    graph.invalidate()
+    search.invalidate()
+
+
+@pytest.fixture()
+def db(engine):
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    try:
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.fixture()
+def client(engine):
+    testing_session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = testing_session()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.app.dependency_overrides[app.get_db] = override_get_db
+    try:
+        yield TestClient(app.app)
+    finally:
+        app.app.dependency_overrides.clear()
+
+
+class FakeClock:
+    """Clock of the tests, it's at now until the test moves it"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture()
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture()
+def statements(engine):
+    """SQL of every statement run on the engine during the test"""
+    executed = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        executed.append(statement)
+
+    event.listen(engine, "before_cursor_execute", count)
+    yield executed
+    event.remove(engine, "before_cursor_execute", count)
+
+
+@pytest.fixture()
+def counted():
+    """Count the statements and rows of the queries, see budget.measure"""
+    budget.install()
+    try:
+        yield
+    finally:
+        budget.uninstall()
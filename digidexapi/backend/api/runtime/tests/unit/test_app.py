@@ -0,0 +1,229 @@
+from urllib.parse import urlparse
+
+import budget
+import catalog
+import pytest
+import utils
+
+import app
+
+
+def test_image_redirect(client):
+    response = client.get("/digimon/3/image", follow_redirects=False)
+
+    assert response.status_code == 302
+    location = response.headers["location"]
+    assert urlparse(location).path == "/digimon-image/Agumon_%28X-Antibody%29.png"
+    assert location == utils.create_presigned_url("Agumon (X-Antibody)", False)
+    max_age = int(response.headers["cache-control"].split("max-age=")[1])
+    assert 0 < max_age <= utils.presigner.window
+
+
+def test_thumbnail_redirect(client):
+    response = client.get("/digimon/2/thumbnail", follow_redirects=False)
+
+    assert response.status_code == 302
+    assert urlparse(response.headers["location"]).path == (
+        "/digimon-thumbnail/Agumon.png"
+    )
+
+
+def test_image_redirect_unknown_digimon(client):
+    response = client.get("/digimon/1000/image", follow_redirects=False)
+
+    assert response.status_code == 404
+
+
+def test_image_redirect_presign_error(client, monkeypatch):
+    monkeypatch.setattr(utils, "create_presigned_url", lambda **kwargs: None)
+
+    response = client.get("/digimon/3/image", follow_redirects=False)
+    assert response.status_code == 502
+
+
+@pytest.fixture()
+def redirect_links(monkeypatch):
+    monkeypatch.setattr(utils, "IMAGE_HREF", "redirect")
+
+
+def test_list_with_redirect_links(client, redirect_links):
+    content = client.get("/digimon", params={"page_size": 2}).json()["content"]
+
+    assert [digimon["image_href"] for digimon in content] == [
+        "digimon/1/thumbnail",
+        "digimon/2/thumbnail",
+    ]
+
+
+def test_detail_with_redirect_links(client, redirect_links):
+    digimon = client.get("/digimon/4").json()
+
+    assert digimon["image_href"] == "digimon/4/image"
+
+
+def crawl(client, url):
+    names = []
+    while url:
+        response = client.get(url)
+        assert response.status_code == 200
+        body = response.json()
+        names.extend(row["name"] for row in body["content"])
+        assert body["pagination"]["previous_page"] == ""
+        url = body["pagination"]["next_page"]
+    return names
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (
+            "/digimon?after=&page_size=2",
+            [
+                "Koromon",
+                "Agumon",
+                "Agumon (X-Antibody)",
+                "Greymon",
+                "Gabumon",
+                "Garurumon",
+                "MetalGreymon",
+            ],
+        ),
+        (
+            "/digimon?after=&page_size=3&sort=name",
+            [
+                "Agumon",
+                "Agumon (X-Antibody)",
+                "Gabumon",
+                "Garurumon",
+                "Greymon",
+                "Koromon",
+                "MetalGreymon",
+            ],
+        ),
+        (
+            "/digimon?after=&page_size=2&sort=release_date&xantibody=false",
+            ["Koromon", "Agumon", "Greymon", "Gabumon", "Garurumon"],
+        ),
+        (
+            "/skill?after=&page_size=3&sort=name",
+            ["Blue Blaster", "Nova Blast", "Pepper Breath", "Sharp Claws"],
+        ),
+    ],
+)
+def test_keyset_crawl(client, url, expected):
+    assert crawl(client, url) == expected
+
+
+def test_keyset_next_page_link(client):
+    body = client.get("/digimon?after=&page_size=2&sort=name&id_type=1").json()
+
+    next_page = body["pagination"]["next_page"]
+    assert next_page.startswith("/digimon?after=")
+    assert next_page.endswith("&page_size=2&sort=name&id_type=1")
+    assert [row["name"] for row in client.get(next_page).json()["content"]] == [
+        "Greymon",
+        "MetalGreymon",
+    ]
+
+
+def test_offset_pages_are_ordered(client):
+    body = client.get("/digimon?page=2&page_size=2&sort=name").json()
+
+    assert [row["name"] for row in body["content"]] == ["Gabumon", "Garurumon"]
+    assert body["pagination"]["next_page"] == "/digimon?page=3&page_size=2&sort=name"
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/digimon?after=notacursor",
+        f"/digimon?sort=name&after={utils.encode_cursor('id', (3,))}",
+        "/skill?after=e30",
+        f"/digimon?after={utils.encode_cursor('id', ('x',))}",
+        f"/digimon?after={utils.encode_cursor('id', (True,))}",
+        f"/digimon?sort=name&after={utils.encode_cursor('name', (['a'], 1))}",
+        f"/skill?sort=name&after={utils.encode_cursor('name', ('a', '1'))}",
+    ],
+)
+@pytest.mark.parametrize("backend", ["sql", "memory"])
+def test_invalid_cursor(client, monkeypatch, url, backend):
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", backend)
+    assert client.get(url).status_code == 400
+
+
+def without_image(digimon):
+    digimon.pop("image_href")
+    return digimon
+
+
+def test_batch_in_request_order(client):
+    response = client.get("/digimon/batch", params={"ids": "4,2,7,2"})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [digimon["id"] for digimon in body] == [4, 2, 7, 2]
+    for digimon in body:
+        expected = client.get(f"/digimon/{digimon['id']}").json()
+        assert without_image(digimon) == without_image(expected)
+
+
+def test_batch_fixed_number_of_queries(client, statements):
+    client.get("/digimon/batch", params={"ids": "1"})
+    single = len(statements)
+    client.get("/digimon/batch", params={"ids": "1,2,3,4,5,6,7"})
+
+    # the digimon, then one query per relation
+    assert single == 9
+    assert len(statements) == 2 * single
+
+
+@pytest.mark.parametrize(
+    "ids, status_code",
+    [("1,1000,2,2000", 404), ("1,a", 400), (",", 400), ("1,2,3,4,5", 400)],
+)
+def test_batch_errors(client, monkeypatch, ids, status_code):
+    monkeypatch.setattr(app, "MAX_BATCH_SIZE", 4)
+
+    response = client.get("/digimon/batch", params={"ids": ids})
+    assert response.status_code == status_code
+    if status_code == 404:
+        assert response.json()["detail"] == "Digimon not found: 1000, 2000"
+
+
+def test_batch_memory_backend(client, monkeypatch):
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", "memory")
+    catalog.invalidate()
+    try:
+        body = client.get("/digimon/batch", params={"ids": "7,3"}).json()
+    finally:
+        catalog.invalidate()
+    assert [digimon["name"] for digimon in body] == [
+        "MetalGreymon",
+        "Agumon (X-Antibody)",
+    ]
+    assert body[0]["digivolved_from"] == [
+        {"name": "Greymon", "condition": "Dark Digivolution"}
+    ]
+
+
+def test_detail_queries_do_not_multiply_rows(client, counted):
+    with budget.measure() as usage:
+        digimon = client.get("/digimon/7").json()
+
+    # one query for the digimon, one per relation
+    assert usage.statements == 9
+    related = sum(
+        len(digimon[relation])
+        for relation in (
+            "levels",
+            "fields",
+            "attributes",
+            "types",
+            "skills",
+            "descriptions",
+            "digivolved_from",
+            "digivolve_to",
+        )
+    )
+    assert related == 9
+    assert usage.rows == 1 + related
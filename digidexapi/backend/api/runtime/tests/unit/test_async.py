@@ -0,0 +1,153 @@
+import asyncio
+
+import async_crud
+import budget
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import app
+
+
+@pytest.fixture()
+def sessions(file_engine):
+    """AsyncSession factory of the file of file_engine, and its sessionmaker"""
+    # a TestClient runs each request on a new event loop, the connections
+    # are not pooled
+    async_engine = create_async_engine(
+        file_engine.url.set(drivername="sqlite+aiosqlite"), poolclass=NullPool
+    )
+
+    # as file_engine
+    @event.listens_for(async_engine.sync_engine, "connect")
+    def _case_sensitive_like(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA case_sensitive_like = ON")
+        cursor.close()
+
+    return (
+        sessionmaker(class_=AsyncSession, bind=async_engine, expire_on_commit=False),
+        sessionmaker(bind=file_engine),
+    )
+
+
+@pytest.fixture()
+def async_client(sessions):
+    async_sessions, sync_sessions = sessions
+    async_app = FastAPI()
+    async_app.router.routes.extend(app.app.router.routes)
+    app.use_async_endpoints(async_app, app.ASYNC_ENDPOINTS)
+
+    def override_get_db():
+        db = sync_sessions()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async_app.dependency_overrides[app.get_db] = override_get_db
+    async_app.dependency_overrides[app.get_async_sessions] = lambda: async_sessions
+    return TestClient(async_app)
+
+
+def test_async_endpoints_replace_the_routes_in_place():
+    application = FastAPI()
+    application.router.routes.extend(app.app.router.routes)
+    paths = [route.path for route in application.routes]
+
+    app.use_async_endpoints(application, app.ASYNC_ENDPOINTS)
+
+    assert [route.path for route in application.routes] == paths
+    for route in application.routes:
+        if route.path in app.ASYNC_ENDPOINTS:
+            assert route.endpoint is app.ASYNC_ENDPOINTS[route.path]
+            assert asyncio.iscoroutinefunction(route.endpoint)
+    assert application.openapi()["paths"].keys() == app.app.openapi()["paths"].keys()
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/digimon",
+        "/digimon?page=2&page_size=3",
+        "/digimon?name_contains=agu",
+        "/digimon?id_level=3&xantibody=false",
+        "/digimon?sort=name&after=&page_size=2",
+        "/digimon?digivolved_from=2",
+        "/digimon/batch?ids=4,2,7",
+        "/digimon/batch?ids=2,99",
+        "/digimon/batch?ids=a",
+        "/digimon/2",
+        "/digimon/agumon",
+        "/digimon/Unknownmon",
+        "/digimon/99",
+        "/digimon/3/image",
+        "/digimon/2/thumbnail",
+        "/digimon/99/image",
+        "/skill",
+        "/skill?name_contains=blast",
+        "/skill?description_contains=fire&sort=name",
+        "/skill?after=&page_size=2",
+    ],
+)
+def test_async_endpoints_send_the_sync_responses(client, async_client, url):
+    expected = client.get(url, follow_redirects=False)
+    response = async_client.get(url, follow_redirects=False)
+
+    assert response.status_code == expected.status_code
+    assert response.headers.get("location") == expected.headers.get("location")
+    assert response.content == expected.content
+
+
+@pytest.mark.parametrize(
+    "url", ["/digimon/batch?ids=4,2,7", "/digimon/agumon", "/digimon/3/image"]
+)
+def test_async_endpoints_stay_within_their_budget(async_client, url):
+    budget.install()
+    try:
+        checked = budget.QueryBudgetMiddleware(
+            async_client.app, app.QUERY_BUDGETS, "raise"
+        )
+        response = TestClient(checked).get(url, follow_redirects=False)
+    finally:
+        budget.uninstall()
+
+    assert response.status_code in (200, 302)
+
+
+def test_relations_are_loaded_on_one_session(sessions):
+    async_sessions, _ = sessions
+    opened = []
+
+    class Session(AsyncSession):
+        async def __aenter__(self):
+            opened.append(self)
+            return await super().__aenter__()
+
+    counting_sessions = sessionmaker(
+        class_=Session, bind=async_sessions.kw["bind"], expire_on_commit=False
+    )
+    budget.install()
+    try:
+        with budget.measure() as usage:
+            digimons = asyncio.run(
+                async_crud.get_digimons_by_ids([2, 4], counting_sessions)
+            )
+    finally:
+        budget.uninstall()
+
+    # the digimon, then a query per relation
+    assert len(opened) == 1
+    assert usage.statements == 9
+    digimons = sorted(digimons, key=lambda digimon: digimon.id)
+    assert [level.name for level in digimons[0].levels] == ["Rookie"]
+    assert [d.digimon_next.name for d in digimons[0].digivolve_to] == ["Greymon"]
+    assert [d.digimon_prior.name for d in digimons[1].digivolved_from] == [
+        "Agumon",
+        "Agumon (X-Antibody)",
+    ]
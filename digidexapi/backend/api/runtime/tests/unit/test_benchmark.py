@@ -0,0 +1,89 @@
+import json
+
+import benchmark
+import dataset
+import pytest
+import utils
+from sqlalchemy import create_engine
+
+import app
+
+
+@pytest.fixture(scope="module")
+def results(tmp_path_factory):
+    database_url = f"sqlite:///{tmp_path_factory.mktemp('benchmark')}/bench.db"
+    try:
+        yield benchmark.run(database_url, size=120, seed=2, repeat=3, warmup=1)
+    finally:
+        create_engine(database_url).dispose()
+
+
+def test_every_route_is_timed(results):
+    timed = {route.split(" [")[0] for route in results["routes"]}
+    paths = {
+        route.path
+        for route in app.app.routes
+        if getattr(route, "include_in_schema", False)
+        and route.path not in ("/docs", "/redoc")
+    }
+
+    assert timed == paths
+
+
+def test_asgi_and_handler_responses(results):
+    for route, result in results["routes"].items():
+        asgi, handler = result["asgi"], result["handler"]
+        expected = 302 if route.endswith(("/image", "/thumbnail")) else 200
+        assert asgi["status"] == handler["status"] == expected, route
+        assert asgi["bytes"] == handler["bytes"], route
+        assert 0 < asgi["min_ms"] <= asgi["median_ms"] <= asgi["max_ms"], route
+
+
+def test_queries_within_budget(results):
+    for route, result in results["routes"].items():
+        queries = result["queries"]
+        assert queries["statements"] <= queries["budget"]["statements"], route
+        assert queries["rows"] <= queries["budget"]["rows"], route
+    detail = results["routes"]["/digimon/{id_or_name}"]["queries"]
+    assert detail["statements"] == detail["budget"]["statements"]
+
+
+def test_results_are_json(results):
+    assert json.loads(json.dumps(results)) == results
+    assert results["dataset"] == {"size": 120, "seed": 2, "database": "sqlite"}
+    assert results["settings"]["REQUEST_PATH"] == app.REQUEST_PATH
+
+
+def test_keyset_page_is_the_deep_page(results):
+    keyset = results["routes"]["/digimon [keyset]"]
+    deep_page = results["routes"]["/digimon [deep page]"]
+    after = keyset["url"].split("after=")[1]
+
+    # the deep page is the 12th, after the last digimon of the 11th
+    assert deep_page["url"] == "/digimon?page=12"
+    assert utils.decode_cursor(after, "id") == (110,)
+    assert keyset["asgi"]["status"] == 200
+
+
+def test_another_seed_is_generated_again(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path.joinpath('bench.db')}")
+    dataset.generate(engine, size=20, seed=1)
+
+    assert benchmark.is_generated(engine, 20, seed=1)
+    assert not benchmark.is_generated(engine, 20, seed=2)
+    assert not benchmark.is_generated(engine, 30, seed=1)
+    engine.dispose()
+
+
+def test_urls_are_reproducible():
+    assert benchmark.urls(1000, seed=5) == benchmark.urls(1000, seed=5)
+
+
+def test_api_gateway_event():
+    event = benchmark.api_gateway_event("/digimon?page=2&page_size=5&page=3")
+
+    assert event["path"] == "/digimon"
+    assert event["multiValueQueryStringParameters"] == {
+        "page": ["2", "3"],
+        "page_size": ["5"],
+    }
@@ -0,0 +1,59 @@
+import bitmap
+import pytest
+from sqlalchemy.orm import Session
+
+
+def make_bitmap(*ids):
+    return bitmap.union(*(1 << id_ for id_ in ids))
+
+
+def test_to_ids_is_sorted_and_paginated():
+    matching = make_bitmap(7, 2, 130, 64, 3)
+
+    assert bitmap.to_ids(matching) == [2, 3, 7, 64, 130]
+    assert bitmap.to_ids(matching, offset=1, limit=2) == [3, 7]
+    assert bitmap.to_ids(matching, offset=4, limit=10) == [130]
+    assert bitmap.to_ids(matching, offset=5) == []
+    assert bitmap.to_ids(0) == []
+    assert bitmap.count(matching) == 5
+
+
+def test_set_operations():
+    first = make_bitmap(1, 2, 3)
+    second = make_bitmap(2, 3, 4)
+
+    assert bitmap.to_ids(bitmap.intersection(first, second)) == [2, 3]
+    assert bitmap.to_ids(bitmap.union(first, second)) == [1, 2, 3, 4]
+    assert bitmap.union() == 0
+
+
+@pytest.fixture(scope="module")
+def index(engine):
+    with Session(engine) as session:
+        return bitmap.BitmapIndex.build(session)
+
+
+def test_build_from_association_tables(index):
+    assert bitmap.to_ids(index.all) == [1, 2, 3, 4, 5, 6, 7]
+    assert bitmap.to_ids(index.get("type", 1)) == [2, 3, 4, 7]
+    assert bitmap.to_ids(index.get("field", 3)) == [2, 7]
+    assert bitmap.to_ids(index.get("xantibody", True)) == [3, 7]
+    assert index.get("type", 42) == 0
+
+
+def test_match(index):
+    assert bitmap.to_ids(index.match()) == [1, 2, 3, 4, 5, 6, 7]
+    assert bitmap.to_ids(index.match(type=1, level=4)) == [4, 7]
+    assert bitmap.to_ids(index.match(type=1, level=4, xantibody=False)) == [4]
+    assert bitmap.to_ids(index.match(type=1, field=None)) == [2, 3, 4, 7]
+    assert index.match(type=1, attribute=2) == 0
+
+
+def test_stats(index):
+    stats = index.stats()
+
+    assert stats["digimons"] == 7
+    # xantibody true/false + the type, field, level and attribute used
+    assert stats["bitmaps"] == 2 + 3 + 3 + 3 + 3
+    assert stats["build_time"] > 0
+    assert stats["memory_size"] > 0
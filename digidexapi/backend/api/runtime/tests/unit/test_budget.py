@@ -0,0 +1,163 @@
+import logging
+
+import budget
+import models
+import pytest
+from budget import Budget
+from fastapi.testclient import TestClient
+from sqlalchemy import select
+from sqlalchemy.engine import CursorResult
+
+import app
+
+# every route of the API, with the conftest data
+URLS = [
+    "/digimon",
+    "/digimon?page=9",
+    "/digimon?page_size=3&sort=name&after=",
+    "/digimon?name_contains=mon&page_size=50",
+    "/digimon?id_level=3&xantibody=false",
+    "/digimon/batch?ids=1,2,3,4,5,6,7",
+    "/digimon/2",
+    "/digimon/agumon",
+    "/digimon/unknownmon",
+    "/digimon/2/image",
+    "/digimon/2/thumbnail",
+    "/digimon/1/lineage",
+    "/digimon/1/tree",
+    "/digimon/1/path/7",
+    "/skill",
+    "/skill?name_contains=bla",
+    "/level",
+    "/attribute",
+    "/field",
+    "/type?page_size=2",
+]
+
+
+def budget_client(budgets, mode="raise"):
+    return TestClient(budget.QueryBudgetMiddleware(app.app, budgets, mode))
+
+
+def test_budgets_of_the_routes():
+    assert app.QUERY_BUDGETS == {
+        "/digimon": Budget(statements=2, rows=1, rows_per_item=1, page_size=10),
+        "/digimon/batch": Budget(statements=9, rows=10000),
+        "/digimon/{id_or_name}": Budget(statements=9, rows=200),
+        "/digimon/{digimon_id}/image": Budget(statements=1, rows=1),
+        "/digimon/{digimon_id}/thumbnail": Budget(statements=1, rows=1),
+        "/digimon/{digimon_id}/lineage": Budget(statements=0, rows=0),
+        "/digimon/{digimon_id}/tree": Budget(statements=0, rows=0),
+        "/digimon/{digimon_id}/path/{target_id}": Budget(statements=0, rows=0),
+        "/skill": Budget(statements=2, rows=1, rows_per_item=1, page_size=10),
+        "/level": Budget(statements=0, rows=0),
+        "/attribute": Budget(statements=0, rows=0),
+        "/field": Budget(statements=0, rows=0),
+        "/type": Budget(statements=0, rows=0),
+    }
+
+
+def test_every_route_has_a_budget():
+    paths = {
+        route.path
+        for route in app.app.routes
+        if getattr(route, "include_in_schema", False)
+        and route.path not in ("/docs", "/redoc")
+    }
+
+    assert set(app.QUERY_BUDGETS) == paths
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_routes_stay_within_their_budget(client, counted, url):
+    response = budget_client(app.QUERY_BUDGETS).get(url, follow_redirects=False)
+
+    assert response.status_code in (200, 302, 404)
+
+
+def test_digimon_details_use_their_whole_budget(client, counted):
+    # a query for the digimon, one per relation, none per related row
+    with budget.measure() as usage:
+        client.get("/digimon/batch?ids=1,2,3,4,5,6,7")
+    assert usage.statements == 9
+
+    with budget.measure() as usage:
+        client.get("/digimon/4")
+    assert usage.statements == 9
+
+
+def test_over_budget_raises(client, counted):
+    budgets = {"/digimon/{id_or_name}": Budget(statements=8, rows=200)}
+
+    with pytest.raises(budget.BudgetExceeded, match="9 statements"):
+        budget_client(budgets).get("/digimon/2")
+    # the other routes are not checked
+    response = budget_client(budgets).get("/digimon/2/image", follow_redirects=False)
+    assert response.status_code == 302
+
+
+def test_over_budget_logs(client, counted, caplog):
+    budgets = {"/digimon": Budget(statements=0, rows=1, rows_per_item=1)}
+
+    with caplog.at_level(logging.WARNING):
+        response = budget_client(budgets, mode="log").get("/digimon?page_size=3")
+
+    assert response.status_code == 200
+    (record,) = [r for r in caplog.records if "query budget" in r.getMessage()]
+    assert '"route": "/digimon"' in record.getMessage()
+    assert '"budget": {"statements": 0, "rows": 4}' in record.getMessage()
+
+
+def test_measure(db, counted):
+    with budget.measure() as usage:
+        db.query(models.Level).all()
+        # a Core result, fetched one row at a time
+        db.connection().execute(select(models.Attribute.id)).first()
+        list(db.execute(select(models.Field.id)))
+        db.query(models.Type.id).filter(models.Type.id == 1).scalar()
+
+    assert usage.statements == 4
+    assert usage.rows == 4 + 1 + 3 + 1
+
+
+def test_exempt(db, counted):
+    with budget.measure() as usage:
+        with budget.exempt():
+            db.query(models.Level).all()
+        db.query(models.Attribute).all()
+
+    assert usage.record() == {
+        "statements": 1,
+        "rows": 3,
+        "exempt_statements": 1,
+        "exempt_rows": 4,
+    }
+
+
+def test_nothing_is_counted_outside_of_a_request(db, counted):
+    with budget.exempt():
+        db.query(models.Level).all()
+
+    assert budget.current.get() is None
+
+
+def test_max_rows():
+    page = Budget(statements=2, rows=1, rows_per_item=1, page_size=10)
+
+    assert page.max_rows() == 11
+    assert page.max_rows(b"page=2&page_size=50") == 51
+    assert page.max_rows(b"page_size=ten") == 11
+    assert Budget(statements=1, rows=1).max_rows(b"page_size=50") == 1
+
+
+def test_uninstall_restores_the_results():
+    fetchall = CursorResult._fetchall_impl
+
+    budget.install()
+    budget.install()
+    assert budget.is_installed()
+    assert CursorResult._fetchall_impl.__wrapped__ is fetchall
+    budget.uninstall()
+
+    assert not budget.is_installed()
+    assert CursorResult._fetchall_impl is fetchall
@@ -0,0 +1,120 @@
+import cache
+
+
+def test_page_and_count_served_from_memory(db, statements):
+    reference_cache = cache.ReferenceCache()
+
+    levels, count = reference_cache.get_page("level", page_size=3, page=1, db=db)
+    assert [level.name for level in levels] == ["Baby", "In-Training", "Rookie"]
+    assert count == 4
+    assert len(statements) == 1
+
+    levels, count = reference_cache.get_page("level", page_size=3, page=2, db=db)
+    assert [level.name for level in levels] == ["Champion"]
+    assert count == 4
+    assert len(statements) == 1
+
+
+def test_out_of_range_page_is_empty(db):
+    reference_cache = cache.ReferenceCache()
+
+    assert reference_cache.get_page("type", page_size=5, page=3, db=db) == ([], 4)
+    assert reference_cache.get_page("type", page_size=5, page=0, db=db)[0]
+
+
+def test_ttl_reloads_table(db, statements, clock):
+    reference_cache = cache.ReferenceCache(ttl=60, clock=clock)
+
+    reference_cache.get_all("field", db)
+    clock.now = 59
+    reference_cache.get_all("field", db)
+    assert len(statements) == 1
+
+    clock.now = 60
+    reference_cache.get_all("field", db)
+    assert len(statements) == 2
+
+
+def test_invalidate(db, statements):
+    reference_cache = cache.ReferenceCache()
+
+    reference_cache.get_all("field", db)
+    reference_cache.get_all("attribute", db)
+    reference_cache.invalidate("field")
+    reference_cache.get_all("field", db)
+    reference_cache.get_all("attribute", db)
+    assert len(statements) == 3
+
+    reference_cache.invalidate()
+    reference_cache.get_all("field", db)
+    reference_cache.get_all("attribute", db)
+    assert len(statements) == 5
+
+
+def test_reference_routes(client):
+    cache.reference_cache.invalidate()
+
+    response = client.get("/attribute", params={"page_size": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["content"] == [
+        {"id": 1, "name": "Vaccine"},
+        {"id": 2, "name": "Data"},
+    ]
+    assert body["pagination"]["next_page"] == "/attribute?page=2&page_size=2"
+
+
+def test_count_cache_key_normalization():
+    key = cache.CountCache.key
+
+    assert key("digimon", id_type=1, name_contains=None) == key("digimon", id_type=1)
+    assert key("digimon", name_contains="") == key("digimon")
+    assert key("digimon", xantibody=False) != key("digimon")
+    assert key("digimon", id_type=1, id_level=2) == key(
+        "digimon", id_level=2, id_type=1
+    )
+    assert key("skill") != key("digimon")
+
+
+def test_count_cache_lru_and_ttl(clock):
+    count_cache = cache.CountCache(maxsize=2, ttl=10, clock=clock)
+
+    count_cache.set("a", 1)
+    count_cache.set("b", 2)
+    assert count_cache.get("a") == 1
+    count_cache.set("c", 3)
+    assert count_cache.get("b") is None
+    assert count_cache.get("a") == 1
+
+    clock.now = 10
+    assert count_cache.get("a") is None
+    assert count_cache.get("c") is None
+
+
+def test_filtered_count_single_round_trip(client, statements):
+    body = client.get("/digimon", params={"id_type": 1, "page_size": 3}).json()
+    assert body["pagination"]["total_page"] == 2
+    assert len(statements) == 1
+
+    body = client.get("/digimon", params={"id_type": 1, "page": 2}).json()
+    assert body["pagination"]["total_page"] == 1
+    assert len(statements) == 2
+
+    body = client.get("/digimon", params={"id_type": 1, "page": 5}).json()
+    assert body["content"] == []
+    assert len(statements) == 3
+
+
+def test_filtered_count_past_the_end(client, statements):
+    params = {"id_field": 1, "page": 5, "page_size": 3}
+    body = client.get("/digimon", params=params).json()
+
+    assert body["content"] == []
+    assert body["pagination"]["total_page"] == 2
+    assert len(statements) == 2
+
+
+def test_total_page_exact_multiple(client):
+    body = client.get("/digimon", params={"id_type": 1, "page_size": 2}).json()
+
+    assert body["pagination"]["total_page"] == 2
@@ -0,0 +1,122 @@
+import caching
+import models
+import pytest
+import utils
+
+
+@pytest.mark.parametrize(
+    "url, max_age",
+    [
+        ("/level", 86400),
+        ("/skill?page=2", 3600),
+        ("/digimon/1/lineage", 3600),
+        ("/digimon/1/path/2", 3600),
+    ],
+)
+def test_caching_headers(client, url, max_age):
+    response = client.get(url, headers={"Accept-Encoding": "identity"})
+
+    assert response.headers["etag"].startswith('"')
+    assert response.headers["cache-control"] == f"public, max-age={max_age}"
+
+
+def test_presigned_responses_expire_with_the_window(client):
+    response = client.get("/digimon/2")
+
+    max_age = int(response.headers["cache-control"].split("=")[1])
+    assert 0 < max_age <= utils.presigner.window
+
+
+def test_redirect_image_href_is_not_windowed(client, monkeypatch):
+    monkeypatch.setattr(utils, "IMAGE_HREF", "redirect")
+
+    response = client.get("/digimon/2")
+    assert response.headers["cache-control"] == "public, max-age=3600"
+    monkeypatch.setattr(utils.presigner, "window", 1)
+    assert client.get("/digimon/2").headers["etag"] == response.headers["etag"]
+
+
+@pytest.mark.parametrize("url", ["/digimon/1000", "/digimon?after=xxx", "/docs"])
+def test_no_caching_headers(client, url):
+    assert "etag" not in client.get(url).headers
+
+
+def test_not_modified(client, statements):
+    tag = client.get("/digimon?page_size=2&xantibody=true").headers["etag"]
+    executed = len(statements)
+
+    strong = tag.removeprefix("W/")
+    for if_none_match in (tag, strong, f'"other", {strong}'):
+        response = client.get(
+            "/digimon?xantibody=true&page_size=2",
+            headers={"If-None-Match": if_none_match, "Origin": "https://a.com"},
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        assert response.headers["etag"] == tag
+        assert response.headers["access-control-allow-origin"] == "*"
+    assert len(statements) == executed
+
+
+def test_any_tag_runs_the_route(client):
+    tag = client.get("/digimon/2").headers["etag"]
+
+    response = client.get("/digimon/2", headers={"If-None-Match": "*"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == tag
+    assert "content-length" not in response.headers
+
+    response = client.get("/digimon/1000", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
+    assert response.json()
+
+
+def test_modified(client):
+    response = client.get("/level", headers={"If-None-Match": '"other"'})
+
+    assert response.status_code == 200
+    assert response.json()["content"]
+
+
+def test_etag_changes(client, monkeypatch):
+    tags = {
+        client.get("/digimon/2").headers["etag"],
+        client.get("/digimon/3").headers["etag"],
+        client.get("/digimon/2?x=1").headers["etag"],
+    }
+    monkeypatch.setattr(caching, "DATASET_VERSION", "other")
+    tags.add(client.get("/digimon/2").headers["etag"])
+
+    assert len(tags) == 4
+
+
+def test_normalize_query():
+    assert caching.normalize_query(b"b=2&a=1&after=") == [
+        ("a", "1"),
+        ("after", ""),
+        ("b", "2"),
+    ]
+
+
+def test_computed_version(db, client, monkeypatch):
+    monkeypatch.setattr(caching, "DATASET_VERSION", None)
+    caching.invalidate()
+    try:
+        version = caching.compute_version(db)
+        assert caching.compute_version(db) == version
+        client.get("/level")
+        assert caching._version == version
+
+        db.add(models.Level(id=5, name="Ultimate"))
+        db.flush()
+        assert caching.compute_version(db) != version
+
+        # the same counts and ids, another content
+        db.rollback()
+        db.get(models.Level, 1).name = "Baby I"
+        db.flush()
+        assert caching.compute_version(db) != version
+    finally:
+        db.rollback()
+        caching.invalidate()
@@ -0,0 +1,193 @@
+import cache
+import catalog
+import crud
+import models
+import pytest
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import NoResultFound
+
+FILTERS = [
+    {},
+    {"xantibody": True},
+    {"xantibody": False},
+    {"name_contains": "mon"},
+    {"name_contains": "Agu"},
+    {"name_contains": "agu"},
+    {"name_contains": ""},
+    {"id_type": 1},
+    {"id_type": 4},
+    {"id_field": 1},
+    {"id_field": 3},
+    {"id_level": 3},
+    {"id_attribute": 2},
+    {"id_attribute": 42},
+    {"digivolved_from": 2},
+    {"digivolved_from": 7},
+    {"digivolve_to": 4},
+    {"digivolve_to": 1},
+    {"id_type": 1, "id_level": 4},
+    {"id_field": 1, "xantibody": False, "name_contains": "mon"},
+    {"id_type": 2, "id_attribute": 2, "digivolve_to": 6},
+]
+ALL_FILTERS = [
+    "xantibody",
+    "name_contains",
+    "id_type",
+    "id_field",
+    "id_level",
+    "id_attribute",
+    "digivolved_from",
+    "digivolve_to",
+]
+
+
+@pytest.fixture(scope="module")
+def digimon_catalog(engine):
+    with Session(engine) as session:
+        return catalog.Catalog.load(session)
+
+
+def sql_ids(db, page_size, page, filters):
+    arguments = {name: filters.get(name) for name in ALL_FILTERS}
+    digimons, _ = crud.get_digimons(page_size=page_size, page=page, db=db, **arguments)
+    return [digimon.id for digimon in digimons]
+
+
+def catalog_ids(digimon_catalog, page_size, page, filters):
+    digimons, _ = digimon_catalog.get_digimons(
+        page_size=page_size, page=page, **filters
+    )
+    return [digimon.id for digimon in digimons]
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("page_size, page", [(100, 1), (2, 1), (2, 2), (3, 3)])
+def test_list_parity(db, digimon_catalog, filters, page_size, page):
+    assert catalog_ids(digimon_catalog, page_size, page, filters) == sql_ids(
+        db, page_size, page, filters
+    )
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("page", [1, 3, 10])
+def test_filtered_count_parity(db, digimon_catalog, filters, page):
+    arguments = {name: filters.get(name) for name in ALL_FILTERS}
+    cache.count_cache.invalidate()
+    _, expected = crud.get_digimons(2, page, db=db, **arguments)
+    _, actual = digimon_catalog.get_digimons(2, page, **filters)
+
+    assert actual == expected
+    assert expected == len(sql_ids(db, 100, 1, filters))
+
+
+@pytest.fixture()
+def digimon_ids(db):
+    return [id_ for id_, in db.query(models.SimpleDigimon.id)]
+
+
+def test_detail_parity(db, digimon_catalog, digimon_ids):
+    for id_digimon in digimon_ids:
+        check_detail(db, digimon_catalog, id_digimon)
+
+
+def check_detail(db, digimon_catalog, id_digimon):
+    expected = crud.get_digimon_by_id(id_digimon, db)
+    actual = digimon_catalog.get_digimon_by_id(id_digimon)
+
+    assert actual.name == expected.name
+    assert actual.xantibody == expected.xantibody
+    for relation in ("levels", "fields", "attributes", "types"):
+        assert sorted(
+            (value.id, value.name) for value in getattr(actual, relation)
+        ) == sorted((value.id, value.name) for value in getattr(expected, relation))
+    assert sorted(skill.id for skill in actual.skills) == sorted(
+        skill.id for skill in expected.skills
+    )
+    assert sorted(d.description for d in actual.descriptions) == sorted(
+        d.description for d in expected.descriptions
+    )
+    assert sorted(
+        (d.digimon_next.name, d.condition) for d in actual.digivolve_to
+    ) == sorted((d.digimon_next.name, d.condition) for d in expected.digivolve_to)
+    assert sorted(
+        (d.digimon_prior.name, d.condition) for d in actual.digivolved_from
+    ) == sorted((d.digimon_prior.name, d.condition) for d in expected.digivolved_from)
+
+
+def test_unknown_digimon(digimon_catalog):
+    with pytest.raises(NoResultFound):
+        digimon_catalog.get_digimon_by_id(1000)
+    with pytest.raises(NoResultFound):
+        digimon_catalog.get_digimon_by_name("Omnimon")
+    assert digimon_catalog.get_digimon_by_name("Greymon").id == 4
+
+
+@pytest.fixture()
+def memory_backend(monkeypatch):
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", "memory")
+    catalog.invalidate()
+    yield
+    catalog.invalidate()
+
+
+@pytest.mark.parametrize(
+    "params",
+    [
+        {"page_size": 3},
+        {"page_size": 2, "page": 2, "id_type": 1},
+        {"name_contains": "mon", "xantibody": True},
+    ],
+)
+def test_list_route_parity(client, memory_backend, monkeypatch, params):
+    from_memory = client.get("/digimon", params=params).json()
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", "sql")
+    from_sql = client.get("/digimon", params=params).json()
+
+    for page in (from_memory, from_sql):
+        for digimon in page["content"]:
+            digimon.pop("image_href")
+    assert from_memory == from_sql
+
+
+def test_detail_route_parity(client, memory_backend, monkeypatch, digimon_ids):
+    from_memory = [client.get(f"/digimon/{id_}").json() for id_ in digimon_ids]
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", "sql")
+    from_sql = [client.get(f"/digimon/{id_}").json() for id_ in digimon_ids]
+
+    for memory, sql in zip(from_memory, from_sql):
+        for key in ("levels", "fields", "attributes", "types", "skills"):
+            memory[key].sort(key=lambda value: value["id"])
+            sql[key].sort(key=lambda value: value["id"])
+        for key in ("descriptions", "digivolve_to", "digivolved_from"):
+            memory[key].sort(key=str)
+            sql[key].sort(key=str)
+        memory.pop("image_href")
+        sql.pop("image_href")
+    assert from_memory == from_sql
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+@pytest.mark.parametrize("sort", ["id", "name", "release_date"])
+def test_keyset_parity(db, digimon_catalog, filters, sort):
+    arguments = {name: filters.get(name) for name in ALL_FILTERS}
+    after = None
+    for _ in range(10):
+        expected, _ = crud.get_digimons(
+            2, 1, db=db, sort=sort, after=after, **arguments
+        )
+        actual, _ = digimon_catalog.get_digimons(
+            2, 1, sort=sort, after=after, **filters
+        )
+        assert [digimon.id for digimon in actual] == [d.id for d in expected]
+        if not expected:
+            break
+        after = crud.sort_key(expected[-1], sort)
+
+
+@pytest.mark.parametrize("sort", ["name", "release_date"])
+def test_offset_sort_parity(db, digimon_catalog, sort):
+    for page in (1, 2, 3):
+        arguments = {name: None for name in ALL_FILTERS}
+        expected, _ = crud.get_digimons(3, page, db=db, sort=sort, **arguments)
+        actual, _ = digimon_catalog.get_digimons(3, page, sort=sort)
+        assert [digimon.id for digimon in actual] == [d.id for d in expected]
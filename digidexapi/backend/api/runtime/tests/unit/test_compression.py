@@ -0,0 +1,131 @@
+import gzip
+import json
+
+import brotli
+import compression
+import export
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+from starlette.responses import Response
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate, br", "br"),
+        ("gzip", "gzip"),
+        ("br;q=0.5, gzip", "gzip"),
+        ("gzip;q=0.8, br;q=0.9", "br"),
+        ("br;q=0, gzip;q=0", None),
+        ("*", "br"),
+        ("*;q=0.5, br;q=0", "gzip"),
+        ("deflate", None),
+        ("", None),
+    ],
+)
+def test_negotiate(accept_encoding, expected):
+    assert compression.negotiate(accept_encoding) == expected
+
+
+BODY = json.dumps({"content": [{"id": i, "name": "Agumon"} for i in range(50)]})
+
+
+def json_app(etag='"tag"', body=BODY, status_code=200):
+    async def app(scope, receive, send):
+        headers = {"ETag": etag} if etag else {}
+        response = Response(
+            body,
+            status_code=status_code,
+            media_type="application/json",
+            headers=headers,
+        )
+        await response(scope, receive, send)
+
+    return app
+
+
+def get(middleware, accept_encoding):
+    # decode_content=False: check what is sent, not what httpx makes of it
+    client = TestClient(middleware)
+    with client.stream("GET", "/", headers={"Accept-Encoding": accept_encoding}) as r:
+        return r, b"".join(r.iter_raw())
+
+
+@pytest.mark.parametrize(
+    "encoding, decompress", [("gzip", gzip.decompress), ("br", brotli.decompress)]
+)
+def test_compressed(encoding, decompress):
+    middleware = compression.CompressionMiddleware(json_app())
+    response, body = get(middleware, encoding)
+
+    assert response.headers["content-encoding"] == encoding
+    assert response.headers["content-length"] == str(len(body))
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.headers["etag"] == 'W/"tag"'
+    assert decompress(body) == BODY.encode("utf-8")
+    assert len(body) < len(BODY)
+
+
+@pytest.mark.parametrize(
+    "app, accept_encoding",
+    [
+        (json_app(), "identity"),
+        (json_app(body="{}"), "gzip"),
+        (json_app(status_code=404), "gzip"),
+    ],
+)
+def test_not_compressed(app, accept_encoding):
+    response, body = get(compression.CompressionMiddleware(app), accept_encoding)
+
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert len(body) == int(response.headers["content-length"])
+
+
+def test_compressed_once_per_etag():
+    middleware = compression.CompressionMiddleware(json_app(), cache_size=1)
+    for accept_encoding in ("gzip", "gzip", "br", "gzip"):
+        get(middleware, accept_encoding)
+
+    # the br variant evicted the gzip one
+    assert (middleware.hits, middleware.misses) == (1, 3)
+
+
+def test_compressed_each_time_without_etag():
+    middleware = compression.CompressionMiddleware(json_app(etag=None))
+    get(middleware, "gzip")
+    get(middleware, "gzip")
+
+    assert middleware.misses == middleware.hits == 0
+
+
+def test_not_modified_etag_is_weak():
+    middleware = compression.CompressionMiddleware(json_app(body=b"", status_code=304))
+
+    assert get(middleware, "gzip")[0].headers["etag"] == 'W/"tag"'
+    assert get(middleware, "identity")[0].headers["etag"] == '"tag"'
+
+
+def test_app_responses(client):
+    response = client.get("/digimon?page_size=7", headers={"Accept-Encoding": "br"})
+
+    assert response.headers["content-encoding"] == "br"
+    assert len(response.json()["content"]) == 7
+
+
+def test_benchmark(tmp_path, engine):
+    export.export(tmp_path, sessionmaker(bind=engine))
+    results = compression.benchmark(tmp_path, repeat=1)
+
+    assert set(results) == {
+        "/attribute",
+        "/digimon",
+        "/digimon/{id}",
+        "/field",
+        "/level",
+        "/skill",
+        "/type",
+    }
+    assert results["/digimon/{id}"]["responses"] == 7
+    assert results["/digimon"]["gzip"]["bytes"] < results["/digimon"]["bytes"]
@@ -0,0 +1,79 @@
+import database
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import event
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+
+
+def test_auth_token_is_reused_until_near_expiry(clock):
+    tokens = iter(["token-1", "token-2"])
+    token = database.AuthToken(generate=lambda: next(tokens), clock=clock)
+
+    assert token.get() == "token-1"
+    clock.now = database.TOKEN_LIFETIME - database.TOKEN_REFRESH_MARGIN - 1
+    assert token.get() == "token-1"
+    clock.now += 1
+    assert token.get() == "token-2"
+    assert token.generated == 2
+
+
+@pytest.fixture()
+def pooled_engine(tmp_path, monkeypatch):
+    engine = create_engine(
+        f"sqlite:///{tmp_path.joinpath('pool.db')}",
+        poolclass=QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True,
+    )
+    tokens = iter(f"token-{i}" for i in range(10))
+    token = database.AuthToken(generate=lambda: next(tokens))
+    monkeypatch.setattr(database, "auth_token", token)
+    monkeypatch.setattr(
+        database, "_connections", dict.fromkeys(database._connections, 0)
+    )
+    database.use_auth_token(engine, token)
+    passwords = []
+
+    # sqlite has no password, keep it for the test
+    @event.listens_for(engine, "do_connect")
+    def _pop_password(dialect, conn_rec, cargs, cparams):
+        passwords.append(cparams.pop("password"))
+
+    monkeypatch.setattr(database, "_engine", engine)
+    yield engine, passwords
+    engine.dispose()
+
+
+def test_token_per_physical_connection(pooled_engine):
+    engine, passwords = pooled_engine
+
+    for _ in range(3):
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    assert passwords == ["token-0"]
+    assert database.pool_stats() == {
+        "connects": 1,
+        "closes": 0,
+        "invalidations": 0,
+        "tokens": 1,
+        "size": 1,
+        "checked_in": 1,
+        "checked_out": 0,
+        "overflow": 0,
+    }
+
+
+def test_dead_connection_is_replaced(pooled_engine):
+    engine, passwords = pooled_engine
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+        connection.connection.invalidate()
+
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 1"))
+    stats = database.pool_stats()
+    assert (stats["connects"], stats["invalidations"]) == (2, 1)
+    # the token is still valid, the new connection reuses it
+    assert passwords == ["token-0", "token-0"]
@@ -0,0 +1,90 @@
+import dataset
+import models
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy import func
+from sqlalchemy import select
+
+
+@pytest.fixture()
+def generated(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path.joinpath('dataset.db')}")
+    counts = dataset.generate(engine, size=300, seed=1, batch_size=70)
+    yield engine, counts
+    engine.dispose()
+
+
+def by_table(rows):
+    tables = {}
+    for table, table_rows in rows:
+        tables.setdefault(table, []).extend(table_rows)
+    return tables
+
+
+def test_same_size_and_seed_same_rows():
+    assert list(dataset.rows(100, seed=3)) == list(dataset.rows(100, seed=3))
+    assert list(dataset.rows(100, seed=3)) != list(dataset.rows(100, seed=4))
+    # the batches do not change the rows
+    assert by_table(dataset.rows(100, seed=3, batch_size=7)) == by_table(
+        dataset.rows(100, seed=3)
+    )
+
+
+def test_names_are_unique():
+    names = [dataset.digimon_name(id_) for id_ in range(1, 20001)]
+
+    assert len(set(names)) == len(names)
+    assert all(name.endswith("mon") for name in names)
+
+
+def test_generate_counts(generated):
+    engine, counts = generated
+
+    with engine.connect() as connection:
+        for table in models.Base.metadata.sorted_tables:
+            if table.name in counts:
+                count = connection.scalar(select(func.count()).select_from(table))
+                assert count == counts[table.name], table.name
+    assert counts["digimon"] == 300
+    assert counts["level"] == len(dataset.LEVELS)
+    assert counts["skill"] == 600
+    assert counts["type"] == 30
+
+
+def test_relation_fan_out(generated):
+    engine, counts = generated
+
+    # each digimon has the level of its stage, then around the mean of the
+    # weights of FAN_OUT
+    assert 1 <= counts["digimon_level"] / 300 <= 1.2
+    assert 1 <= counts["digimon_skill"] / 300 <= 4.5
+    assert 1 <= counts["digimon_description"] / 300 <= 2
+    with engine.connect() as connection:
+        stages = connection.execute(
+            select(
+                models.Digivolution.id_digimon_prior,
+                models.Digivolution.id_digimon_next,
+            )
+        ).all()
+    assert stages
+    for prior, next_ in stages:
+        assert (int(next_) - 1) % dataset.STAGES == int(prior) % dataset.STAGES
+
+
+def test_generate_replaces_the_tables(generated):
+    engine, _ = generated
+
+    counts = dataset.generate(engine, size=10, seed=1)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count(models.SimpleDigimon.id))) == 10
+    assert counts["digimon"] == 10
+
+
+def test_generated_records_size_and_seed(generated, tmp_path):
+    engine, _ = generated
+
+    assert dataset.generated(engine) == {"size": 300, "seed": 1}
+    dataset.generate(engine, size=10, seed=2)
+    assert dataset.generated(engine) == {"size": 10, "seed": 2}
+    assert dataset.generated(create_engine("sqlite://")) is None
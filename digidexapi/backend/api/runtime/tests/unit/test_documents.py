@@ -0,0 +1,97 @@
+import documents
+import models
+import pytest
+import utils
+from sqlalchemy import delete
+
+
+@pytest.fixture()
+def materialized(engine, db, monkeypatch):
+    count = documents.materialize(db)
+    monkeypatch.setattr(documents, "DOCUMENTS", "table")
+    try:
+        yield count
+    finally:
+        db.execute(delete(models.Document))
+        db.commit()
+        documents.store.invalidate()
+
+
+URLS = [
+    "/digimon/2",
+    "/digimon/7",
+    "/digimon/Agumon",
+    "/level",
+    "/attribute",
+    "/field?page=1&page_size=5",
+    "/type",
+]
+
+
+def test_materialize(materialized):
+    # 7 digimon and one page per reference table
+    assert materialized == 7 + 4
+
+
+@pytest.mark.parametrize("url", URLS)
+def test_documents_are_the_rendered_responses(client, db, monkeypatch, url):
+    rendered = client.get(url)
+    documents.materialize(db)
+    monkeypatch.setattr(documents, "DOCUMENTS", "table")
+    try:
+        served = client.get(url)
+    finally:
+        db.execute(delete(models.Document))
+        db.commit()
+        documents.store.invalidate()
+
+    assert served.status_code == rendered.status_code == 200
+    assert served.headers["content-type"] == rendered.headers["content-type"]
+    assert served.content == rendered.content
+
+
+def test_image_href_is_spliced(materialized, client, monkeypatch):
+    monkeypatch.setattr(utils, "IMAGE_HREF", "redirect")
+
+    assert client.get("/digimon/7").json()["image_href"] == "digimon/7/image"
+
+
+def test_detail_is_one_primary_key_fetch(materialized, client, statements):
+    client.get("/digimon/7")
+    assert len(statements) == 1
+    assert "document.path = ?" in statements[0]
+
+    client.get("/digimon/7")
+    assert len(statements) == 1
+
+
+@pytest.mark.parametrize(
+    "url, status_code",
+    [
+        ("/digimon/1000", 404),
+        ("/digimon/Omnimon", 404),
+        ("/level?page_size=2", 200),
+        ("/level?page=2", 200),
+    ],
+)
+def test_fallback_without_document(materialized, client, url, status_code):
+    assert client.get(url).status_code == status_code
+
+
+def test_splice_image_href():
+    body = documents.dumps({"image_href": documents.IMAGE_HREF, "name": "Agumon"})
+
+    assert documents.splice_image_href(body, 'http://s3/"a"') == (
+        b'{"image_href":"http://s3/\\"a\\"","name":"Agumon"}'
+    )
+    assert documents.splice_image_href(body, None) == (
+        b'{"image_href":null,"name":"Agumon"}'
+    )
+
+
+def test_store_is_bounded(materialized, db):
+    store = documents.DocumentStore(maxsize=2)
+    for digimon_id in (1, 2, 3):
+        assert store.get(documents.digimon_path(digimon_id), db) is not None
+
+    assert list(store._documents) == ["/digimon/2", "/digimon/3"]
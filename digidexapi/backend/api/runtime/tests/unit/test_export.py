@@ -0,0 +1,78 @@
+import json
+
+import export
+import pytest
+import utils
+from sqlalchemy.orm import sessionmaker
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        ("/digimon", "digimon.json"),
+        ("/digimon/7", "digimon/7.json"),
+        ("/digimon?page=2&page_size=10", "digimon@page=2&page_size=10.json"),
+    ],
+)
+def test_file_name(url, expected):
+    assert export.file_name(url) == expected
+
+
+@pytest.fixture()
+def session_factory(engine):
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+def test_export(tmp_path, session_factory, client, monkeypatch):
+    manifest = export.export(tmp_path, session_factory)
+    monkeypatch.setattr(utils, "IMAGE_HREF", "redirect")
+
+    assert set(manifest) == {
+        "/digimon",
+        "/skill",
+        "/level",
+        "/attribute",
+        "/field",
+        "/type",
+        *(f"/digimon/{id_}" for id_ in range(1, 8)),
+    }
+    for url, entry in manifest.items():
+        body = tmp_path.joinpath(entry["file"]).read_bytes()
+        assert body == client.get(url).content
+        assert len(body) == entry["size"]
+    detail = json.loads(tmp_path.joinpath("digimon/7.json").read_bytes())
+    assert detail["image_href"] == "digimon/7/image"
+    assert json.loads(tmp_path.joinpath("manifest.json").read_text()) == manifest
+
+
+def test_export_follows_the_pagination(tmp_path, session_factory, monkeypatch):
+    monkeypatch.setattr(export, "START_URLS", ["/level?page_size=3"])
+    manifest = export.export(tmp_path, session_factory)
+
+    # the last page of the 4 levels is not full, so it has no links
+    assert list(manifest) == [
+        "/level?page=2&page_size=3",
+        "/level?page_size=3",
+    ]
+
+
+def test_export_is_reproducible(tmp_path, session_factory, monkeypatch):
+    export.export(tmp_path, session_factory)
+    first = {path: path.read_bytes() for path in tmp_path.rglob("*.json")}
+    monkeypatch.setattr(export, "START_URLS", ["/level"])
+    export.export(tmp_path, session_factory)
+    monkeypatch.undo()
+    export.export(tmp_path, session_factory)
+
+    assert {path: path.read_bytes() for path in tmp_path.rglob("*.json")} == first
+
+
+def test_stale_files_are_removed(tmp_path, session_factory, monkeypatch):
+    export.export(tmp_path, session_factory)
+    monkeypatch.setattr(export, "START_URLS", ["/level"])
+    export.export(tmp_path, session_factory)
+
+    assert sorted(p.name for p in tmp_path.rglob("*.json")) == [
+        "level.json",
+        "manifest.json",
+    ]
@@ -0,0 +1,178 @@
+import graph
+import pytest
+
+
+@pytest.fixture()
+def digivolution_graph(db):
+    return graph.DigivolutionGraph.load(db)
+
+
+@pytest.fixture()
+def cyclic_graph():
+    names = {1: "A", 2: "B", 3: "C", 4: "D"}
+    return graph.DigivolutionGraph(
+        names, [(1, 2, "a"), (2, 3, "b"), (3, 1, "c"), (3, 4, "d")]
+    )
+
+
+def test_descendants(digivolution_graph):
+    assert digivolution_graph.lineage(1, graph.DESCENDANTS) == [(2, 1), (4, 2), (7, 3)]
+    assert digivolution_graph.lineage(1, graph.DESCENDANTS, max_depth=2) == [
+        (2, 1),
+        (4, 2),
+    ]
+    assert digivolution_graph.lineage(7, graph.DESCENDANTS) == []
+
+
+def test_ancestors(digivolution_graph):
+    assert digivolution_graph.lineage(7, graph.ANCESTORS) == [
+        (4, 1),
+        (2, 2),
+        (3, 2),
+        (1, 3),
+    ]
+    assert digivolution_graph.lineage(7, graph.ANCESTORS, max_depth=1) == [(4, 1)]
+
+
+def test_lineage_is_memoized(digivolution_graph):
+    lineage = digivolution_graph.lineage(1, graph.DESCENDANTS)
+
+    assert digivolution_graph.lineage(1, graph.DESCENDANTS) is lineage
+
+
+def test_shortest_path(digivolution_graph):
+    assert digivolution_graph.shortest_path(1, 7) == [
+        (1, None),
+        (2, "Level up"),
+        (4, "Level up"),
+        (7, "Dark Digivolution"),
+    ]
+    assert digivolution_graph.shortest_path(4, 4) == [(4, None)]
+    assert digivolution_graph.shortest_path(7, 1) is None
+    assert digivolution_graph.shortest_path(1, 6) is None
+
+
+def test_cycles(cyclic_graph):
+    assert cyclic_graph.lineage(1, graph.DESCENDANTS) == [(2, 1), (3, 2), (4, 3)]
+    assert cyclic_graph.shortest_path(2, 1) == [(2, None), (3, "b"), (1, "c")]
+
+    nodes, edges = cyclic_graph.tree(1, graph.DESCENDANTS)
+    assert nodes == [(1, 0), (2, 1), (3, 2), (4, 3)]
+    assert edges == [(1, 2, "a"), (2, 3, "b"), (3, 1, "c"), (3, 4, "d")]
+
+
+def test_tree_expands_each_digimon_once():
+    # 6 levels of 8 digimon, each digivolving to every digimon of the next
+    # level: 8 ** 5 paths, but 48 digimon and 5 * 64 digivolutions
+    names = {id_: str(id_) for id_ in range(48)}
+    edges = [
+        (level * 8 + i, (level + 1) * 8 + j, None)
+        for level in range(5)
+        for i in range(8)
+        for j in range(8)
+    ]
+    layered = graph.DigivolutionGraph(names, edges)
+
+    nodes, tree_edges = layered.tree(0, graph.DESCENDANTS)
+    assert len(nodes) == 1 + 5 * 8
+    assert len(tree_edges) == 8 + 4 * 64
+    nodes, tree_edges = layered.tree(47, graph.ANCESTORS, max_depth=1)
+    assert nodes == [(47, 0)] + [(id_, 1) for id_ in range(32, 40)]
+    assert tree_edges == [(id_, 47, None) for id_ in range(32, 40)]
+
+
+def test_memos_are_bounded(cyclic_graph):
+    small = graph.DigivolutionGraph(cyclic_graph.names, [(1, 2, "a")], memo_size=2)
+    for max_depth in range(1, 100):
+        small.lineage(1, graph.DESCENDANTS, max_depth)
+    # max_depth from 4 on is the same query as no max_depth
+    assert len(small._lineages) == 2
+    assert small.lineage(1, graph.DESCENDANTS, 1000) is small.lineage(
+        1, graph.DESCENDANTS
+    )
+
+
+def test_graph_loaded_once(client, statements):
+    client.get("/digimon/1/lineage")
+    loaded = len(statements)
+    client.get("/digimon/7/lineage", params={"direction": "ancestors"})
+    client.get("/digimon/1/path/7")
+    client.get("/digimon/1/tree")
+
+    assert len(statements) == loaded == 2
+
+
+def test_lineage_route(client):
+    response = client.get("/digimon/1/lineage", params={"max_depth": 2})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": 1,
+        "name": "Koromon",
+        "direction": "descendants",
+        "content": [
+            {"id": 2, "name": "Agumon", "depth": 1, "href": "digimon/2"},
+            {"id": 4, "name": "Greymon", "depth": 2, "href": "digimon/4"},
+        ],
+    }
+
+
+def test_tree_route(client):
+    response = client.get("/digimon/7/tree", params={"direction": "ancestors"})
+
+    assert response.status_code == 200
+    assert response.json() == {
+        "id": 7,
+        "name": "MetalGreymon",
+        "direction": "ancestors",
+        "nodes": [
+            {"id": 7, "name": "MetalGreymon", "depth": 0, "href": "digimon/7"},
+            {"id": 4, "name": "Greymon", "depth": 1, "href": "digimon/4"},
+            {"id": 2, "name": "Agumon", "depth": 2, "href": "digimon/2"},
+            {
+                "id": 3,
+                "name": "Agumon (X-Antibody)",
+                "depth": 2,
+                "href": "digimon/3",
+            },
+            {"id": 1, "name": "Koromon", "depth": 3, "href": "digimon/1"},
+        ],
+        "edges": [
+            {"digimon_prior": 1, "digimon_next": 2, "condition": "Level up"},
+            {"digimon_prior": 2, "digimon_next": 4, "condition": "Level up"},
+            {"digimon_prior": 3, "digimon_next": 4, "condition": "Level up"},
+            {
+                "digimon_prior": 4,
+                "digimon_next": 7,
+                "condition": "Dark Digivolution",
+            },
+        ],
+    }
+
+
+def test_path_route(client):
+    body = client.get("/digimon/2/path/7").json()
+
+    assert body["length"] == 2
+    assert [step["name"] for step in body["steps"]] == [
+        "Agumon",
+        "Greymon",
+        "MetalGreymon",
+    ]
+
+
+@pytest.mark.parametrize(
+    "url",
+    [
+        "/digimon/1000/lineage",
+        "/digimon/1000/tree",
+        "/digimon/1/path/1000",
+        "/digimon/7/path/1",
+    ],
+)
+def test_graph_routes_not_found(client, url):
+    assert client.get(url).status_code == 404
+
+
+def test_invalid_max_depth(client):
+    assert client.get("/digimon/1/lineage?max_depth=0").status_code == 422
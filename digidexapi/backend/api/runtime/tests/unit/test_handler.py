@@ -1,71 +1,98 @@
+import asyncio
+import base64
+import gzip
 import json
 
 import pytest
-from digimon_api import app
+
+import app
+
+
+@pytest.fixture(autouse=True)
+def event_loop():
+    # Mangum runs the application on the current event loop, which a Lambda
+    # process has
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    yield loop
+    asyncio.set_event_loop(None)
+    loop.close()
 
 
 @pytest.fixture()
 def apigw_event():
     """Generates API GW Event"""
 
-    return {
-        "body": '{ "test": "body"}',
-        "resource": "/{proxy+}",
-        "requestContext": {
-            "resourceId": "123456",
-            "apiId": "1234567890",
-            "resourcePath": "/{proxy+}",
-            "httpMethod": "POST",
-            "requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef",
-            "accountId": "123456789012",
-            "identity": {
-                "apiKey": "",
-                "userArn": "",
-                "cognitoAuthenticationType": "",
-                "caller": "",
-                "userAgent": "Custom User Agent String",
-                "user": "",
-                "cognitoIdentityPoolId": "",
-                "cognitoIdentityId": "",
-                "cognitoAuthenticationProvider": "",
-                "sourceIp": "127.0.0.1",
-                "accountId": "",
-            },
-            "stage": "prod",
-        },
-        "queryStringParameters": {"foo": "bar"},
-        "headers": {
-            "Via": "1.1 08f323deadbeefa7af34d5feb414ce27.cloudfront.net (CloudFront)",
-            "Accept-Language": "en-US,en;q=0.8",
-            "CloudFront-Is-Desktop-Viewer": "true",
-            "CloudFront-Is-SmartTV-Viewer": "false",
-            "CloudFront-Is-Mobile-Viewer": "false",
-            "X-Forwarded-For": "127.0.0.1, 127.0.0.2",
-            "CloudFront-Viewer-Country": "US",
-            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8",
-            "Upgrade-Insecure-Requests": "1",
-            "X-Forwarded-Port": "443",
-            "Host": "1234567890.execute-api.us-east-1.amazonaws.com",
-            "X-Forwarded-Proto": "https",
-            "X-Amz-Cf-Id": "aaaaaaaaaae3VYQb9jd-nvCd-de396Uhbp027Y2JvkCPNLmGJHqlaA==",
-            "CloudFront-Is-Tablet-Viewer": "false",
-            "Cache-Control": "max-age=0",
+    def event(path, query=None, headers=None):
+        headers = {
+            "Host": "1234567890.execute-api.eu-west-3.amazonaws.com",
             "User-Agent": "Custom User Agent String",
-            "CloudFront-Forwarded-Proto": "https",
-            "Accept-Encoding": "gzip, deflate, sdch",
-        },
-        "pathParameters": {"proxy": "/examplepath"},
-        "httpMethod": "POST",
-        "stageVariables": {"baz": "qux"},
-        "path": "/examplepath",
-    }
+            "X-Forwarded-Proto": "https",
+            **(headers or {}),
+        }
+        return {
+            "body": None,
+            "resource": "/{proxy+}",
+            "requestContext": {
+                "resourceId": "123456",
+                "apiId": "1234567890",
+                "resourcePath": "/{proxy+}",
+                "httpMethod": "GET",
+                "requestId": "c6af9ac6-7b61-11e6-9a41-93e8deadbeef",
+                "accountId": "123456789012",
+                "identity": {"sourceIp": "127.0.0.1"},
+                "stage": "prod",
+            },
+            "queryStringParameters": query,
+            "multiValueQueryStringParameters": (
+                {name: [value] for name, value in query.items()} if query else None
+            ),
+            "headers": headers,
+            "multiValueHeaders": {name: [value] for name, value in headers.items()},
+            "pathParameters": {"proxy": path.lstrip("/")},
+            "httpMethod": "GET",
+            "stageVariables": None,
+            "path": path,
+            "isBase64Encoded": False,
+        }
 
+    return event
 
-def test_lambda_handler(apigw_event):
 
-    ret = app.lambda_handler(apigw_event, "")
+def test_lambda_handler(client, apigw_event):
+    ret = app.handler(apigw_event("/digimon/2"), None)
     data = json.loads(ret["body"])
 
     assert ret["statusCode"] == 200
-    assert "message" in ret["body"]
-    assert data["message"] == "hello world"
+    assert ret["isBase64Encoded"] is False
+    assert ret["headers"]["content-type"] == "application/json"
+    assert data["name"] == "Agumon"
+    assert [level["name"] for level in data["levels"]] == ["Rookie"]
+
+
+def test_lambda_handler_query_string(client, apigw_event):
+    ret = app.handler(apigw_event("/digimon", query={"page_size": "2"}), None)
+    data = json.loads(ret["body"])
+
+    assert ret["statusCode"] == 200
+    assert [digimon["name"] for digimon in data["content"]] == ["Koromon", "Agumon"]
+
+
+def test_lambda_handler_compressed_body(client, apigw_event):
+    ret = app.handler(
+        apigw_event("/digimon", headers={"Accept-Encoding": "gzip"}), None
+    )
+
+    # API Gateway gets the binary body in base64
+    assert ret["statusCode"] == 200
+    assert ret["isBase64Encoded"] is True
+    assert ret["headers"]["content-encoding"] == "gzip"
+    data = json.loads(gzip.decompress(base64.b64decode(ret["body"])))
+    assert len(data["content"]) == 7
+
+
+def test_lambda_handler_not_found(client, apigw_event):
+    ret = app.handler(apigw_event("/digimon/1000"), None)
+
+    assert ret["statusCode"] == 404
+    assert json.loads(ret["body"]) == {"detail": "Digimon not found"}
@@ -0,0 +1,79 @@
+import os
+import pathlib
+import subprocess
+import sys
+
+import database
+from sqlalchemy import text
+
+RUNTIME = pathlib.Path(__file__).parent.parent.parent.joinpath("digidex_api")
+# cumulative microseconds of "import app", the part of a Lambda cold start
+# before the handler runs
+IMPORT_TIME_BUDGET = int(os.getenv("IMPORT_TIME_BUDGET", "1500000"))
+# only needed once a request reaches the database or signs an image
+LAZY_MODULES = ["boto3", "botocore", "uvicorn", "psycopg2", "asyncpg"]
+
+
+def import_app(code: str = ""):
+    """(stderr of python -X importtime, stdout of code) of a fresh
+    interpreter importing app, with the environment of the Lambda"""
+    environment = {
+        "PATH": os.environ.get("PATH", ""),
+        "DB_USER": "digidex",
+        "DB_ENPOINT": "localhost",
+        "S3_IMAGE_BUCKET": "digidex-images",
+    }
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import app\n{code}"],
+        cwd=RUNTIME,
+        env=environment,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return result.stderr, result.stdout
+
+
+def cumulative_time(importtime: str, module: str) -> int:
+    # import time: self [us] | cumulative | imported package
+    for line in importtime.splitlines():
+        _, cumulative, name = line.split("|")
+        if name.strip() == module:
+            return int(cumulative)
+    raise AssertionError(f"{module} was not imported")
+
+
+def test_heavy_modules_are_lazy():
+    _, imported = import_app(
+        "import sys, database\n"
+        f"print([m for m in {LAZY_MODULES!r} if m in sys.modules])\n"
+        "print(database._engine)"
+    )
+
+    assert imported.splitlines() == ["[]", "None"]
+
+
+def test_import_time_budget():
+    # the first run may compile the .pyc files
+    best = min(cumulative_time(import_app()[0], "app") for _ in range(3))
+
+    assert best < IMPORT_TIME_BUDGET, f"import app took {best / 1000:.0f}ms"
+
+
+def test_engine_is_created_on_first_use(engine, monkeypatch):
+    created = []
+
+    def create_engine():
+        created.append(engine)
+        return engine
+
+    monkeypatch.setattr(database, "_engine", None)
+    monkeypatch.setattr(database, "_create_engine", create_engine)
+    session = database.SessionLocal()
+    try:
+        assert created == []
+        assert session.execute(text("SELECT 1")).scalar() == 1
+        session.execute(text("SELECT 1"))
+        assert created == [engine]
+    finally:
+        session.close()
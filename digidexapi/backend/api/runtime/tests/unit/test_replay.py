@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+
+import pytest
+import replay
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app
+
+TRAFFIC = [
+    {"path": "/digimon/2", "time": 1000.5},
+    {"path": "/digimon", "query": "page=1&page_size=3", "time": 1000.0},
+    {"path": "/digimon", "query": {"name_contains": "mon"}, "time": 1001.0},
+    {"path": "/digimon/agumon", "time": 1001.25},
+    {"path": "/digimon/404", "time": 1001.5},
+    {"path": "/level", "time": 1002.0},
+]
+
+
+@pytest.fixture()
+def requests():
+    return replay.load(json.dumps(record) for record in TRAFFIC)
+
+
+@pytest.fixture()
+def database(file_engine):
+    # several requests at once, each with its connection, which the thread
+    # pool may close from another thread
+    engine = create_engine(file_engine.url, connect_args={"check_same_thread": False})
+    session_factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.app.dependency_overrides[app.get_db] = get_db
+    yield
+    app.app.dependency_overrides.clear()
+    engine.dispose()
+
+
+def test_load(requests):
+    assert [request.time for request in requests] == [0, 0.5, 1, 1.25, 1.5, 2]
+    assert requests[0].url == "/digimon?page=1&page_size=3"
+    assert requests[1].url == "/digimon/2"
+    assert requests[2].url == "/digimon?name_contains=mon"
+
+
+def test_load_skips_lines_without_path():
+    assert replay.load(["", '{"time": 1}', '{"path": "/level"}']) == [
+        replay.Request("/level", "", 0)
+    ]
+
+
+def test_route_of():
+    assert replay.route_of("/digimon/7") == "/digimon/{id_or_name}"
+    assert replay.route_of("/digimon/7/path/2") == (
+        "/digimon/{digimon_id}/path/{target_id}"
+    )
+    assert replay.route_of("/unknown") == "/unknown"
+
+
+def test_percentile():
+    values = list(range(1, 101))
+
+    assert replay.percentile(values, 50) == 50
+    assert replay.percentile(values, 99) == 99
+    assert replay.percentile([3], 95) == 3
+
+
+def test_replay_by_route(database, requests):
+    results = asyncio.run(replay.run(requests, concurrency=3))
+
+    assert set(results) == {"/digimon", "/digimon/{id_or_name}", "/level", "all"}
+    assert results["/digimon"]["requests"] == 2
+    # the 404 is a client error, not an error of the API
+    assert results["/digimon/{id_or_name}"]["requests"] == 3
+    assert results["/digimon/{id_or_name}"]["client_errors"] == 1
+    assert results["all"]["requests"] == len(TRAFFIC)
+    assert results["all"]["error_rate"] == 0
+    for summary in results.values():
+        assert 0 < summary["p50_ms"] <= summary["p95_ms"] <= summary["p99_ms"]
+        assert summary["throughput"] > 0
+
+
+def test_replay_at_a_rate(database, requests):
+    start = time.perf_counter()
+    asyncio.run(replay.run(requests, rate=20))
+
+    # the last request is sent 5 / 20 seconds after the first
+    assert time.perf_counter() - start >= 0.25
+
+
+def test_replay_at_recorded_speed(database, requests):
+    start = time.perf_counter()
+    asyncio.run(replay.run(requests, speed=8))
+
+    assert time.perf_counter() - start >= 2 / 8
+
+
+def test_unreachable_api_is_an_error(requests):
+    results = asyncio.run(replay.run(requests[:2], url="http://127.0.0.1:9"))
+
+    assert results["all"]["error_rate"] == 1
+
+
+def test_application_errors_are_counted(requests):
+    def get_db():
+        raise RuntimeError("no database")
+
+    app.app.dependency_overrides[app.get_db] = get_db
+    try:
+        results = asyncio.run(replay.run(requests, concurrency=3))
+    finally:
+        app.app.dependency_overrides.clear()
+
+    assert results["all"]["requests"] == len(TRAFFIC)
+    assert results["all"]["error_rate"] == 1
+
+
+def test_compare():
+    baseline = {
+        "/digimon": {
+            "requests": 10,
+            "p50_ms": 10.0,
+            "p95_ms": 20.0,
+            "p99_ms": 30.0,
+            "throughput": 100.0,
+            "error_rate": 0.0,
+            "client_errors": 0,
+        }
+    }
+    baseline["all"] = baseline["/digimon"]
+    same = {"/digimon": dict(baseline["/digimon"], p99_ms=31.0, throughput=1.0)}
+    slower = {"/digimon": dict(baseline["/digimon"], p95_ms=30.0, error_rate=0.5)}
+    fewer = {"all": dict(baseline["all"], throughput=50.0)}
+
+    assert replay.compare(same, baseline) == []
+    assert replay.compare({}, baseline) == []
+    assert replay.compare(slower, baseline) == [
+        "/digimon: p95_ms 30.0 > 20.0 (baseline)",
+        "/digimon: error rate 0.5 > 0.0 (baseline)",
+    ]
+    assert replay.compare(fewer, baseline) == [
+        "all: throughput 50.0 < 100.0 (baseline)"
+    ]
+    # paced, the throughput is the pacing's
+    assert replay.compare(fewer, baseline, throughput=False) == []
+
+
+def test_main_fails_on_regression(database, tmp_path):
+    traffic = tmp_path.joinpath("traffic.jsonl")
+    traffic.write_text("".join(json.dumps(record) + "\n" for record in TRAFFIC))
+    output = tmp_path.joinpath("results.json")
+
+    assert replay.main([str(traffic), "--output", str(output)]) == 0
+    results = json.loads(output.read_text())
+    assert results["all"]["requests"] == len(TRAFFIC)
+
+    baseline = tmp_path.joinpath("baseline.json")
+    slow = {
+        route: dict(summary, p50_ms=1000, p95_ms=1000, p99_ms=1000, throughput=0)
+        for route, summary in results.items()
+    }
+    baseline.write_text(json.dumps(slow))
+    assert replay.main([str(traffic), "--baseline", str(baseline)]) == 0
+
+    fast = {
+        route: dict(summary, p50_ms=0, p95_ms=0, p99_ms=0)
+        for route, summary in results.items()
+    }
+    baseline.write_text(json.dumps(fast))
+    assert replay.main([str(traffic), "--baseline", str(baseline)]) == 1
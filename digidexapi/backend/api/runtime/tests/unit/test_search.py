@@ -0,0 +1,276 @@
+import catalog
+import crud
+import models
+import pytest
+import search
+from sqlalchemy import event
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+def test_normalize():
+    assert search.normalize("Étoile Dorée") == "etoile doree"
+    assert search.normalize("AGUMON") == "agumon"
+    # as lower(unaccent()) of Postgres
+    assert (
+        search.normalize("Straße Æther Œuvre Øst ﬁre")
+        == "strasse aether oeuvre ost fire"
+    )
+    assert search.normalize(None) == ""
+
+
+def test_similarity_matches_pg_trgm():
+    # SELECT similarity('word', 'two words') -> 0.36363637
+    assert search.similarity("word", "two words") == pytest.approx(4 / 11)
+    assert search.similarity("agumon", "agumon") == 1
+    assert search.similarity("", "agumon") == 0
+
+
+@pytest.fixture()
+def index():
+    return search.NgramIndex.build(
+        [(1, "Koromon"), (2, "Agumon"), (3, "Étoile"), (4, "Agumon (X-Antibody)")]
+    )
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ("agu", [2, 4]),
+        ("AGUMON", [2, 4]),
+        ("etoi", [3]),
+        ("étoi", [3]),
+        ("mo", [1, 2, 4]),
+        ("x-anti", [4]),
+        ("", [1, 2, 3, 4]),
+        ("zzz", []),
+    ],
+)
+def test_ngram_index_match(index, query, expected):
+    assert search.bitmap.to_ids(index.match(query)) == expected
+
+
+def test_ngram_index_match_within(index):
+    assert search.bitmap.to_ids(index.match("agu", within=1 << 4)) == [4]
+
+
+def test_ngram_index_rank(index):
+    assert index.rank("agumon", [4, 2]) == [2, 4]
+    assert index.rank("agumon", [1, 4, 2], limit=1) == [2]
+
+
+def names(content):
+    return [row["name"] for row in content]
+
+
+def test_case_insensitive_route(client):
+    content = client.get("/digimon", params={"name_contains": "GREY"}).json()["content"]
+
+    assert names(content) == ["Greymon", "MetalGreymon"]
+
+
+def test_pattern_characters_are_literal(client):
+    for name_contains in ("%", "_", "Agu%n"):
+        content = client.get("/digimon", params={"name_contains": name_contains})
+        assert content.json()["content"] == []
+
+
+@pytest.mark.parametrize(
+    "url, expected",
+    [
+        (
+            "/digimon?name_contains=greymon&sort=relevance",
+            ["Greymon", "MetalGreymon"],
+        ),
+        (
+            "/digimon?name_contains=agumon&sort=relevance",
+            ["Agumon", "Agumon (X-Antibody)"],
+        ),
+        (
+            "/skill?name_contains=blast&sort=relevance",
+            ["Nova Blast", "Blue Blaster"],
+        ),
+        ("/skill?sort=relevance&page_size=2", ["Pepper Breath", "Sharp Claws"]),
+    ],
+)
+def test_relevance_sort(client, url, expected):
+    assert names(client.get(url).json()["content"]) == expected
+
+
+def test_relevance_sort_has_no_cursor(client):
+    assert client.get("/digimon?sort=relevance&after=").status_code == 400
+
+
+@pytest.mark.parametrize("name_contains", ["mon", "AGU", "greymon", "x", ""])
+def test_catalog_relevance_parity(engine, db, name_contains):
+    with Session(engine) as session:
+        digimon_catalog = catalog.Catalog.load(session)
+    for page in (1, 2, 3):
+        arguments = dict(
+            xantibody=None,
+            id_type=None,
+            id_field=None,
+            id_level=None,
+            id_attribute=None,
+            digivolved_from=None,
+            digivolve_to=None,
+        )
+        expected, expected_count = crud.get_digimons(
+            3, page, name_contains=name_contains, db=db, sort="relevance", **arguments
+        )
+        actual, count = digimon_catalog.get_digimons(
+            3, page, name_contains=name_contains, sort="relevance"
+        )
+        assert [digimon.id for digimon in actual] == [d.id for d in expected]
+        assert count == expected_count
+
+
+class PostgresSession:
+    """A session of a Postgres database, with or without the trigram DDL"""
+
+    def __init__(self, has_trigram):
+        self.has_trigram = has_trigram
+        self.statements = []
+
+    def get_bind(self):
+        from sqlalchemy.dialects import postgresql
+
+        class Bind:
+            dialect = postgresql.dialect()
+
+        return Bind
+
+    def scalar(self, statement):
+        self.statements.append(statement)
+        return self.has_trigram
+
+
+@pytest.fixture()
+def trigram(monkeypatch):
+    monkeypatch.setattr(search, "NAME_SEARCH", "trigram")
+    search.invalidate()
+    yield
+    search.invalidate()
+
+
+def test_trigram_filter_on_postgres(trigram):
+    from sqlalchemy.dialects import postgresql
+
+    db = PostgresSession(True)
+    clause = search.name_filter("digimon", "Agú%", db)
+    sql = str(
+        clause.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+    # the query is normalized by the function of the index too
+    assert sql == (
+        "digidex_search_key(digimon.name) LIKE '%%' || "
+        "digidex_search_key('Agú/%%') || '%%' ESCAPE '/'"
+    )
+    search.name_filter("digimon", "mon", db)
+    assert len(db.statements) == 1
+
+
+def test_trigram_falls_back_without_its_ddl(trigram, caplog):
+    db = PostgresSession(False)
+
+    assert not search.uses_trigram(db)
+    assert not search.uses_trigram(db)
+    assert len(db.statements) == 1
+    assert "n-gram index" in caplog.text
+
+
+def test_ngram_by_default(engine):
+    with Session(engine) as db:
+        assert search.NAME_SEARCH == "ngram"
+        assert not search.uses_trigram(db)
+
+
+def test_relevance_ranks_the_page_inline(db, engine):
+    parameters = []
+
+    def record(conn, cursor, statement, statement_parameters, *args):
+        parameters.append(statement_parameters)
+
+    key = search.relevance("digimon", "mon", db, limit=2)
+    event.listen(engine, "before_cursor_execute", record)
+    try:
+        ids = db.scalars(select(models.SimpleDigimon.id).order_by(key)).all()
+    finally:
+        event.remove(engine, "before_cursor_execute", record)
+
+    index = search.get_index("digimon", db)
+    assert ids[:2] == index.rank("mon", search.bitmap.iter_ids(index.match("mon")))[:2]
+    assert parameters == [()]
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        ("Agumon (X-Antibody)", "agumon (x-antibody)"),
+        ("agumon_(x-antibody)", "agumon (x-antibody)"),
+        ("  Metal   Greymon ", "metal greymon"),
+    ],
+)
+def test_name_key(name, expected):
+    assert search.name_key(name) == expected
+
+
+def test_name_index(db, statements):
+    name_index = search.NameIndex()
+
+    assert name_index.resolve("AGUMON_(X-Antibody)", db) == 3
+    assert name_index.resolve("greymon", db) == 4
+    assert len(statements) == 1
+
+    assert name_index.resolve("Omnimon", db) is None
+    assert len(statements) == 2
+    assert name_index.resolve("omnimon", db) is None
+    assert len(statements) == 2
+
+
+def test_name_index_negative_cache_is_bounded(db):
+    name_index = search.NameIndex(negative_size=2)
+
+    for name in ("a", "b", "c"):
+        name_index.resolve(name, db)
+    assert list(name_index.misses) == ["b", "c"]
+
+
+def test_name_index_sees_new_digimon(db):
+    name_index = search.NameIndex()
+    assert name_index.resolve("Omnimon", db) is None
+
+    db.add(models.SimpleDigimon(id=8, name="Omnimon", xantibody=False))
+    db.flush()
+    try:
+        assert name_index.resolve("Gabumon", db) == 5
+        assert name_index.resolve("Omnimon", db) is None
+        assert name_index.resolve("WarGreymon", db) is None
+        assert name_index.resolve("Omnimon", db) == 8
+    finally:
+        db.rollback()
+
+
+@pytest.mark.parametrize("backend", ["sql", "memory"])
+def test_detail_by_normalized_name(client, monkeypatch, backend):
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", backend)
+    catalog.invalidate()
+    try:
+        response = client.get("/digimon/agumon_(x-antibody)")
+        assert response.status_code == 200
+        assert response.json()["id"] == 3
+        assert client.get("/digimon/Agu%").status_code == 404
+        assert client.get("/digimon/Omnimon").status_code == 404
+        assert client.get("/digimon/1000").status_code == 404
+    finally:
+        catalog.invalidate()
+
+
+def test_unknown_name_does_not_query_digimon(client, statements):
+    assert client.get("/digimon/Omnimon").status_code == 404
+    assert client.get("/digimon/Omnimon").status_code == 404
+
+    # only the load of the name index
+    assert len(statements) == 1
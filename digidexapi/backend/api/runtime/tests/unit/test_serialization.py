@@ -0,0 +1,81 @@
+import catalog
+import pytest
+import schemas
+import serialization
+
+import app
+
+URLS = [
+    "/digimon",
+    "/digimon?page_size=3&page=2&sort=name",
+    "/digimon?after=&sort=release_date&page_size=2",
+    "/digimon?name_contains=agu",
+    "/skill",
+    "/skill?name_contains=blast&sort=relevance",
+    "/level?page=2&page_size=3",
+    "/attribute",
+    "/field",
+    "/type",
+]
+
+
+@pytest.mark.parametrize("backend", ["sql", "memory"])
+@pytest.mark.parametrize("url", URLS)
+def test_same_bytes_as_pydantic(client, monkeypatch, url, backend):
+    monkeypatch.setattr(catalog, "DIGIMON_BACKEND", backend)
+    headers = {"Accept-Encoding": "identity"}
+    fast = client.get(url, headers=headers)
+    monkeypatch.setattr(serialization, "SERIALIZATION", "pydantic")
+    validated = client.get(url, headers=headers)
+
+    assert fast.status_code == validated.status_code == 200
+    assert fast.headers["content-type"] == validated.headers["content-type"]
+    assert fast.content == validated.content
+
+
+@pytest.mark.parametrize("path", ["/digimon", "/skill", "/level", "/type"])
+def test_openapi_schema_is_unchanged(path):
+    response = app.app.openapi()["paths"][path]["get"]["responses"]["200"]
+
+    assert response["content"]["application/json"]["schema"] == {
+        "$ref": "#/components/schemas/Page"
+    }
+
+
+def test_encoder_follows_the_schema_order():
+    class Row:
+        name = "Pepper Breath"
+        description = "Spits a fireball"
+        id = 1
+
+    assert list(serialization.skill(Row())) == ["id", "name", "description"]
+
+
+def test_encoder_computed_fields(monkeypatch):
+    monkeypatch.setattr(serialization.utils, "IMAGE_HREF", "redirect")
+
+    class Row:
+        id = 2
+        name = "Agumon"
+        xantibody = False
+        release_date = "1997"
+
+    assert serialization.digimon(Row()) == {
+        "id": 2,
+        "name": "Agumon",
+        "xantibody": False,
+        "release_date": "1997",
+        "href": "digimon/2",
+        "image_href": "digimon/2/thumbnail",
+    }
+    assert serialization.reference(schemas.LevelBase(id=1, name="Baby")) == {
+        "id": 1,
+        "name": "Baby",
+    }
+
+
+def test_single_field_encoder():
+    class Id(schemas.BaseModel):
+        id: int
+
+    assert serialization.Encoder(Id)(schemas.LevelBase(id=3, name="x")) == {"id": 3}
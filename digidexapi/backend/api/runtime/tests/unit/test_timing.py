@@ -0,0 +1,112 @@
+import json
+import logging
+
+import fastapi.routing
+import pytest
+import serialization
+import timing
+import utils
+from fastapi.testclient import TestClient
+from starlette.responses import JSONResponse
+
+import app
+
+
+def server_timing(response):
+    """Server-Timing header as metric -> (duration, description)"""
+    metrics = {}
+    for metric in response.headers["server-timing"].split(", "):
+        name, *parameters = metric.split(";")
+        values = dict(parameter.split("=", 1) for parameter in parameters)
+        metrics[name] = (float(values["dur"]), values.get("desc", "").strip('"'))
+    return metrics
+
+
+@pytest.fixture()
+def timed_client(client):
+    timing.install()
+    try:
+        yield TestClient(timing.ServerTimingMiddleware(app.app))
+    finally:
+        timing.uninstall()
+
+
+def test_list_phases(timed_client):
+    response = timed_client.get("/digimon?page_size=3")
+
+    assert response.status_code == 200
+    metrics = server_timing(response)
+    assert list(metrics) == ["db-connect", "sql", "presign", "serialize", "total"]
+    assert metrics["db-connect"][1] == "1 connections"
+    # the page and its count, in one statement
+    assert metrics["sql"][1] == "1 statements"
+    # the page signed at once, then each URL read from the presigner cache
+    assert metrics["presign"][1] == "4 calls"
+    assert all(duration >= 0 for duration, _ in metrics.values())
+    assert metrics["sql"][0] <= metrics["total"][0]
+
+
+def test_response_model_phases(timed_client):
+    response = timed_client.get("/digimon/2")
+
+    metrics = server_timing(response)
+    assert {"sql", "presign", "validate", "serialize", "total"} <= metrics.keys()
+    # the digimon and one query per relation
+    assert metrics["sql"][1] == "9 statements"
+
+
+def test_log_line(timed_client, caplog):
+    with caplog.at_level(logging.INFO):
+        timed_client.get("/digimon/2/lineage")
+
+    records = [
+        json.loads(record.getMessage())
+        for record in caplog.records
+        if record.getMessage().startswith('{"message": "request timing"')
+    ]
+    assert len(records) == 1
+    record = records[0]
+    assert record["path"] == "/digimon/2/lineage"
+    assert record["route"] == "/digimon/{digimon_id}/lineage"
+    assert record["status"] == 200
+    assert record["phases"]["sql"]["count"] >= 1
+    assert record["total_ms"] >= record["phases"]["sql"]["ms"]
+
+
+def test_nothing_is_timed_outside_of_a_request(timed_client):
+    assert timing.current.get() is None
+    url = utils.create_presigned_url("Agumon", thumbnail=True)
+
+    assert url.startswith("https://")
+    assert timing.current.get() is None
+
+
+def test_uninstall_restores_the_functions():
+    presign_many = utils.presigner.presign_many
+    render = JSONResponse.render
+    page = serialization.page
+    serialize_response = fastapi.routing.serialize_response
+
+    timing.install()
+    timing.install()
+    assert timing.is_installed()
+    assert utils.presigner.presign_many.__wrapped__ == presign_many
+    timing.uninstall()
+
+    assert not timing.is_installed()
+    assert utils.presigner.presign_many == presign_many
+    assert JSONResponse.render is render
+    assert serialization.page is page
+    assert fastapi.routing.serialize_response is serialize_response
+
+
+def test_header_format():
+    request_timing = timing.RequestTiming()
+    request_timing.add("sql", 0.0015)
+    request_timing.add("sql", 0.0005)
+    request_timing.add("db-connect", 0.001)
+
+    assert request_timing.header(0.005) == (
+        'db-connect;dur=1.000;desc="1 connections", '
+        'sql;dur=2.000;desc="2 statements", total;dur=5.000'
+    )
@@ -0,0 +1,171 @@
+import datetime
+from urllib.parse import parse_qs
+from urllib.parse import urlparse
+
+import boto3
+import botocore.auth
+import pytest
+import utils
+from botocore.config import Config
+from botocore.credentials import Credentials
+from botocore.credentials import RefreshableCredentials
+
+
+@pytest.fixture()
+def clients(monkeypatch):
+    created = []
+    real_client = boto3.session.Session.client
+
+    def client(self, *args, **kwargs):
+        created.append(args)
+        return real_client(self, *args, **kwargs)
+
+    monkeypatch.setattr(boto3.session.Session, "client", client)
+    return created
+
+
+def query(url):
+    return parse_qs(urlparse(url).query)
+
+
+def test_image_key():
+    assert utils.image_key("Agumon (X-Antibody)", thumbnail=True) == (
+        "digimon-thumbnail/Agumon_(X-Antibody).png"
+    )
+    assert utils.image_key("Agumon", thumbnail=False) == "digimon-image/Agumon.png"
+
+
+def test_presigned_url_cached_for_the_window(clients, clock):
+    clock.now = 10_000
+    presigner = utils.Presigner(expiration=3600, window=900, clock=clock)
+
+    first = presigner.presign("digimon-image/Agumon.png", thumbnail=False)
+    clock.now += 100
+    assert presigner.presign("digimon-image/Agumon.png", thumbnail=False) == first
+    assert presigner.presign("digimon-image/Gabumon.png", thumbnail=False) != first
+    assert len(clients) == 1
+
+    # signed at the start of the [9_900, 10_800[ window
+    assert query(first)["X-Amz-Date"] == ["19700101T024500Z"]
+    assert query(first)["X-Amz-Expires"] == ["4500"]
+
+    clock.now = 10_800
+    second = presigner.presign("digimon-image/Agumon.png", thumbnail=False)
+    assert second != first
+    assert query(second)["X-Amz-Date"] == ["19700101T030000Z"]
+    assert len(clients) == 1
+
+
+def test_presign_many_uses_the_cache(clients, clock):
+    clock.now = 10_000
+    presigner = utils.Presigner(clock=clock)
+
+    agumon = presigner.presign("digimon-image/Agumon.png", thumbnail=False)
+    urls = presigner.presign_many(
+        ["digimon-image/Gabumon.png", "digimon-image/Agumon.png"], thumbnail=False
+    )
+
+    assert urls[1] == agumon
+    assert urls[0] == presigner.presign("digimon-image/Gabumon.png", thumbnail=False)
+
+
+FROZEN_TIME = datetime.datetime(2023, 1, 17, 12, 34, 56)
+KEYS = [
+    "digimon-image/Agumon.png",
+    "digimon-thumbnail/Agumon_(X-Antibody).png",
+    "digimon-image/Lucemon:_Falldown_Mode.png",
+    "digimon-image/Ōmegamon~Zwart+D.png",
+    "digimon-image/100%_sure?&=.png",
+]
+
+
+@pytest.mark.parametrize(
+    "region, bucket, token",
+    [
+        ("eu-west-3", "digidex-images", None),
+        ("eu-west-3", "digidex-images", "FwoGZXIvYXdzEP//////////wEaDA+token/=="),
+        ("us-east-1", "digidex-images", None),
+        ("us-west-2", "digidex-images", None),
+        ("eu-west-3", "digidex.images", None),
+    ],
+)
+def test_sigv4_presigner_matches_botocore(monkeypatch, region, bucket, token):
+    credentials = Credentials(
+        "AKIDEXAMPLE", "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY", token
+    )
+    client = boto3.client(
+        "s3",
+        region_name=region,
+        aws_access_key_id=credentials.access_key,
+        aws_secret_access_key=credentials.secret_key,
+        aws_session_token=credentials.token,
+        config=Config(signature_version="s3v4"),
+    )
+    monkeypatch.setattr(botocore.auth, "get_current_datetime", lambda: FROZEN_TIME)
+    expected = [
+        client.generate_presigned_url(
+            "get_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=4500
+        )
+        for key in KEYS
+    ]
+
+    signer = utils.SigV4Presigner(client, bucket, credentials)
+    timestamp = FROZEN_TIME.replace(tzinfo=datetime.timezone.utc).timestamp()
+    assert signer.presign_many(KEYS, expires_in=4500, timestamp=timestamp) == expected
+
+
+def test_presigner_signs_with_the_client_credentials(clients, clock, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "AKIDSESSION")
+    presigner = utils.Presigner(expiration=3600, window=900, clock=clock)
+    monkeypatch.setattr(
+        botocore.auth, "get_current_datetime", lambda: datetime.datetime(1970, 1, 1)
+    )
+    expected = presigner.client.generate_presigned_url(
+        "get_object",
+        Params={"Bucket": "digidex-images", "Key": KEYS[0]},
+        ExpiresIn=4500,
+    )
+
+    assert presigner.presign(KEYS[0], thumbnail=False) == expected
+    assert query(expected)["X-Amz-Credential"][0].startswith("AKIDSESSION/")
+    assert len(clients) == 1
+
+
+def test_sigv4_presigner_freezes_the_credentials():
+    client = boto3.client("s3", region_name="eu-west-3")
+    credentials = RefreshableCredentials(
+        "AKIDOLD",
+        "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+        "token",
+        expiry_time=datetime.datetime(2000, 1, 1, tzinfo=datetime.timezone.utc),
+        refresh_using=lambda: {
+            "access_key": "AKIDNEW",
+            "secret_key": "wJalrXUtnFEMI/K7MDENG+bPxRfiCYEXAMPLEKEY",
+            "token": "token",
+            "expiry_time": "2999-01-01T00:00:00Z",
+        },
+        method="test",
+    )
+    signer = utils.SigV4Presigner(client, "digidex-images", credentials)
+
+    (url,) = signer.presign_many(KEYS[:1], expires_in=60, timestamp=0)
+    assert query(url)["X-Amz-Credential"][0].startswith("AKIDNEW/")
+
+
+def test_sigv4_presigner_without_sigv4_client():
+    # without configuration botocore presigns us-east-1 URLs with SigV2
+    client = boto3.client("s3", region_name="us-east-1")
+    signer = utils.SigV4Presigner(client, "digidex-images", None)
+
+    urls = signer.presign_many(KEYS[:2], expires_in=60, timestamp=0)
+    assert [urlparse(url).path for url in urls] == [
+        "/digimon-image/Agumon.png",
+        "/digimon-thumbnail/Agumon_%28X-Antibody%29.png",
+    ]
+
+
+def test_create_presigned_url():
+    url = utils.create_presigned_url("Agumon", thumbnail=True)
+
+    assert urlparse(url).path == "/digimon-thumbnail/Agumon.png"
+    assert utils.create_presigned_url("Agumon", thumbnail=True) == url